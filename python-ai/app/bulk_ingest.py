@@ -0,0 +1,518 @@
+"""
+Bulk ingestion of a local directory or a manifest of documents.
+
+Runs the same download, extraction, encoding and storage code as the
+embedding.create handler, as a pipeline: prepare workers download (or read in
+place) and extract documents concurrently, an encoder batches the chunks of
+several documents per encode call, and a store step writes each batch while
+the next one is being encoded.
+
+    python -m app.bulk_ingest ./documents
+    python -m app.bulk_ingest manifest.jsonl --workers 16 --checkpoint ./manifest.checkpoint.jsonl
+
+A directory is scanned recursively for --pattern; each file's doc_id is its
+path relative to the directory. A manifest has one document per line, either
+an embedding.create payload ({"url": ..., "objectName": ...}, "path" works in
+place of "url") or "<path or URL>[<TAB><doc_id>]"; the doc_id defaults to the
+file name. Relative paths are resolved against the manifest's directory.
+
+Completed documents are appended to the checkpoint file once the stores are
+flushed, so an interrupted run (Ctrl-C drains in-flight documents, a second
+Ctrl-C stops at once) resumes where it stopped. Failed documents are not
+checkpointed and are retried by the next run. Documents whose stored
+fingerprint matches are not re-embedded, so --restart is cheap for unchanged
+files.
+
+Stores that only one process may open (the numpy vector index, local ChromaDB,
+the lexical index) must not be open in a running API process at the same time.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Set
+
+from .services.embedding.embedding_service import (
+    encode_scheduler, cpu_executor, document_downloader, vector_index, lexical_index
+)
+from .services.embedding.ingestion import (
+    PreparedDocument, get_stored_fingerprints, prepare_document, encode_documents, store_documents
+)
+from .services.utils.stage_timing import add_stage_listener, remove_stage_listener
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_STAGES = ("download", "extract", "encode", "store")
+
+
+@dataclass
+class BulkItem:
+    """One document to ingest"""
+    location: str  # File path, or URL when not local
+    doc_id: str
+    local: bool = True
+
+
+def _is_url(location: str) -> bool:
+    return location.startswith(("http://", "https://"))
+
+
+def _manifest_item(line: str, base_dir: str) -> BulkItem:
+    if line.startswith("{"):
+        payload = json.loads(line)
+        location = payload.get("url") or payload.get("path")
+        doc_id = payload.get("objectName") or payload.get("doc_id")
+    else:
+        location, _, doc_id = line.partition("\t")
+    location = (location or "").strip()
+    if not location:
+        raise ValueError(f"Manifest line has no path or URL: {line!r}")
+
+    if _is_url(location):
+        return BulkItem(location, (doc_id or "").strip() or os.path.basename(location.split("?")[0]), local=False)
+    path = os.path.join(base_dir, os.path.expanduser(location))
+    return BulkItem(path, (doc_id or "").strip() or os.path.basename(path))
+
+
+def discover_items(source: str, pattern: str = "*.pdf") -> List[BulkItem]:
+    """
+    List the documents of a directory or manifest
+
+    Args:
+        source: Directory scanned recursively, or manifest file
+        pattern: File name pattern of a directory's documents
+
+    Returns:
+        The documents in a stable order; for repeated doc_ids only the last one is kept
+    """
+    root = Path(source)
+    if root.is_dir():
+        items = [
+            BulkItem(str(path), path.relative_to(root).as_posix())
+            for path in sorted(root.rglob(pattern))
+            if path.is_file()
+        ]
+    else:
+        base_dir = str(root.resolve().parent)
+        with open(source, encoding="utf-8") as f:
+            items = [
+                _manifest_item(line.strip(), base_dir)
+                for line in f
+                if line.strip() and not line.startswith("#")
+            ]
+
+    latest = {item.doc_id: item for item in items}
+    return list(latest.values())
+
+
+class Checkpoint:
+    """
+    Append-only record of the documents a bulk run has stored
+
+    The first line names the source the checkpoint belongs to; every further
+    line is one completed document. A line cut short by a crash is ignored.
+    """
+
+    def __init__(self, path: str, source: str, restart: bool = False):
+        """
+        Open or create a checkpoint
+
+        Args:
+            path: Checkpoint file
+            source: Directory or manifest being ingested
+            restart: Discard the completed documents of an earlier run
+
+        Raises:
+            ValueError: If the checkpoint belongs to another source
+        """
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.completed: Set[str] = set()
+
+        if restart or not os.path.exists(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"source": self.source}) + "\n")
+        else:
+            self._load()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        header = json.loads(lines[0]) if lines else {}
+        if header.get("source") != self.source:
+            raise ValueError(
+                f"Checkpoint {self.path} belongs to {header.get('source')}; "
+                f"pass --restart or another --checkpoint"
+            )
+        for line in lines[1:]:
+            try:
+                self.completed.add(json.loads(line)["doc_id"])
+            except (ValueError, KeyError):
+                logger.warning(f"Ignoring damaged checkpoint line: {line!r}")
+
+    def record(self, documents: List[PreparedDocument]) -> None:
+        """Durably mark documents as completed; call only once their chunks are flushed"""
+        self._file.write("".join(
+            json.dumps({"doc_id": document.doc_id, "chunks": len(document.chunks), "unchanged": document.unchanged}) + "\n"
+            for document in documents
+        ))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.completed.update(document.doc_id for document in documents)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+@dataclass
+class BulkIngestStats:
+    """Counters of a bulk run"""
+    total: int = 0
+    skipped: int = 0  # Completed by an earlier run
+    stored: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    chunks: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    failures: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def done(self) -> int:
+        return self.stored + self.unchanged
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "total": self.total,
+            "skipped": self.skipped,
+            "stored": self.stored,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "seconds": round(elapsed, 2),
+            "docs_per_second": round(self.done / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+class StageUtilization:
+    """
+    Stage listener summing the busy time of each pipeline stage
+
+    Utilization is busy time over wall-clock time, so a stage running on
+    several documents at once goes above 100%. A stage's time counts when it
+    completes, so short intervals read burstier than the real load.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # Encode timings arrive from the scheduler's threads
+        self._busy: Dict[str, float] = defaultdict(float)
+
+    def __call__(self, stage: str, seconds: float, values: dict) -> None:
+        if stage in PIPELINE_STAGES:
+            with self._lock:
+                self._busy[stage] += seconds
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._busy)
+
+
+class BulkIngestJob:
+    """
+    Pipelined ingestion of many documents with checkpointing.
+
+        feed (fingerprint lookup) -> prepare workers (download, extract)
+            -> encoder (batched encode) -> store (upsert, flush, checkpoint)
+
+    The stages are connected by bounded queues, so a slow stage throttles the
+    ones before it instead of piling up extracted text in memory.
+    """
+
+    def __init__(
+        self,
+        items: List[BulkItem],
+        checkpoint: Checkpoint,
+        workers: int = 8,
+        batch_chunks: int = 512,
+        source: str = "bulk",
+        progress_interval: float = 5.0
+    ):
+        """
+        Initialize bulk ingestion job
+
+        Args:
+            items: Documents to ingest
+            checkpoint: Completed documents are skipped and new ones recorded here
+            workers: Documents downloaded and extracted at once
+            batch_chunks: Chunks collected from several documents per encode and store batch
+            source: Value of the "source" metadata field
+            progress_interval: Seconds between progress lines (0 disables them)
+        """
+        if workers <= 0 or batch_chunks <= 0:
+            raise ValueError("workers and batch_chunks must be positive")
+
+        self.items = items
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.batch_chunks = batch_chunks
+        self.source = source
+        self.progress_interval = progress_interval
+        self.stats = BulkIngestStats()
+        self.utilization = StageUtilization()
+        self._stopping = asyncio.Event()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def stop(self) -> None:
+        """Stop feeding new documents; those in flight are still stored and checkpointed"""
+        self._stopping.set()
+
+    def _fail(self, doc_id: str, error: BaseException) -> None:
+        logger.error(f"[-] Error ingesting {doc_id}: {error}")
+        self.stats.failed += 1
+        self.stats.failures[doc_id] = str(error)
+
+    async def _feed(self, work: asyncio.Queue, pending: List[BulkItem], lookup_size: int = 64) -> None:
+        """Queue the pending documents with their stored fingerprints, looked up per block"""
+        loop = asyncio.get_running_loop()
+        for offset in range(0, len(pending), lookup_size):
+            if self._stopping.is_set():
+                break
+            block = pending[offset:offset + lookup_size]
+            fingerprints = await loop.run_in_executor(None, get_stored_fingerprints, [item.doc_id for item in block])
+            for item in block:
+                if self._stopping.is_set():
+                    break
+                await work.put((item, fingerprints.get(item.doc_id, {})))
+        for _ in range(self.workers):
+            await work.put(None)
+
+    async def _prepare(self, work: asyncio.Queue, prepared: asyncio.Queue) -> None:
+        while True:
+            entry = await work.get()
+            if entry is None:
+                return
+            item, stored = entry
+            if self._stopping.is_set():
+                continue  # Queued but not started: left for the next run
+            try:
+                document = await prepare_document(item.location, item.doc_id, encode=False, stored=stored, local=item.local)
+            except Exception as e:
+                self._fail(item.doc_id, e)
+                continue
+            await prepared.put(document)
+
+    async def _encode(self, prepared: asyncio.Queue, batches: asyncio.Queue) -> None:
+        """Encode the chunks of the prepared documents in batches of about batch_chunks"""
+        finished = False
+        while not finished:
+            document = await prepared.get()
+            if document is None:
+                break
+            batch = [document]
+            chunks = len(document.chunks)
+            # Take what is ready now rather than wait for a full batch, so the encoder never idles
+            while chunks < self.batch_chunks and not prepared.empty():
+                document = prepared.get_nowait()
+                if document is None:
+                    finished = True
+                    break
+                batch.append(document)
+                chunks += len(document.chunks)
+
+            try:
+                await encode_documents(batch)
+            except Exception as e:
+                for document in batch:
+                    self._fail(document.doc_id, e)
+                continue
+            await batches.put(batch)
+        await batches.put(None)
+
+    def _store_batch(self, batch: List[PreparedDocument]) -> None:
+        store_documents(batch, self.source)
+        vector_index.get().flush()
+        lexical = lexical_index.get()
+        if lexical is not None:
+            lexical.flush()
+        self.checkpoint.record(batch)
+
+    async def _store(self, batches: asyncio.Queue) -> None:
+        """Write each batch off the event loop while the encoder works on the next one"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                return
+            future = loop.run_in_executor(None, self._store_batch, batch)
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Let the write finish, so the stores are not closed under it
+                await asyncio.wait([future])
+                raise
+            except Exception as e:
+                for document in batch:
+                    self._fail(document.doc_id, e)
+                continue
+            for document in batch:
+                if document.unchanged:
+                    self.stats.unchanged += 1
+                else:
+                    self.stats.stored += 1
+                    self.stats.chunks += len(document.chunks)
+
+    async def _report_progress(self) -> None:
+        last_at, last_done, last_chunks = self.stats.started_at, 0, 0
+        last_busy: Dict[str, float] = {}
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            now = time.perf_counter()
+            busy = self.utilization.snapshot()
+            elapsed = now - last_at
+            print(self.progress_line(
+                (self.stats.done - last_done) / elapsed,
+                (self.stats.chunks - last_chunks) / elapsed,
+                {stage: (busy.get(stage, 0.0) - last_busy.get(stage, 0.0)) / elapsed for stage in PIPELINE_STAGES}
+            ), flush=True)
+            last_at, last_done, last_chunks, last_busy = now, self.stats.done, self.stats.chunks, busy
+
+    def progress_line(self, docs_per_second: float, chunks_per_second: float, utilization: Dict[str, float]) -> str:
+        stats = self.stats
+        remaining = stats.total - stats.skipped - stats.done - stats.failed
+        eta = f", ETA {remaining / docs_per_second:.0f}s" if docs_per_second > 0 else ""
+        stages = ", ".join(f"{stage} {utilization[stage]:.0%}" for stage in PIPELINE_STAGES)
+        return (
+            f"[bulk] {stats.skipped + stats.done}/{stats.total} docs "
+            f"({stats.stored} stored, {stats.unchanged} unchanged, {stats.failed} failed{eta}) | "
+            f"{docs_per_second:.1f} docs/s, {chunks_per_second:.0f} chunks/s | utilization: {stages}"
+        )
+
+    async def run(self) -> BulkIngestStats:
+        """Ingest every document not completed yet; returns once the pipeline has drained"""
+        pending = [item for item in self.items if item.doc_id not in self.checkpoint.completed]
+        self.stats = BulkIngestStats(total=len(self.items), skipped=len(self.items) - len(pending))
+        print(f"[bulk] {len(pending)} documents to ingest, {self.stats.skipped} completed by an earlier run")
+
+        work: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        prepared: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        batches: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+        async def prepare_all() -> None:
+            await asyncio.gather(*(self._prepare(work, prepared) for _ in range(self.workers)))
+            await prepared.put(None)
+
+        add_stage_listener(self.utilization)
+        progress = asyncio.create_task(self._report_progress()) if self.progress_interval > 0 else None
+        try:
+            await asyncio.gather(
+                self._feed(work, pending),
+                prepare_all(),
+                self._encode(prepared, batches),
+                self._store(batches)
+            )
+        finally:
+            if progress is not None:
+                progress.cancel()
+            remove_stage_listener(self.utilization)
+
+        elapsed = time.perf_counter() - self.stats.started_at
+        busy = self.utilization.snapshot()
+        print(self.progress_line(
+            self.stats.done / elapsed,
+            self.stats.chunks / elapsed,
+            {stage: busy.get(stage, 0.0) / elapsed for stage in PIPELINE_STAGES}
+        ))
+        return self.stats
+
+
+async def run_bulk_ingest(job: BulkIngestJob) -> BulkIngestStats:
+    """Run a job until it finishes or is interrupted, then release the model and stores"""
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+
+    def interrupt() -> None:
+        if job.stopping:
+            print("[bulk] Stopping now; documents not checkpointed are ingested by the next run", flush=True)
+            task.cancel()
+        else:
+            print("[bulk] Finishing in-flight documents; interrupt again to stop now", flush=True)
+            job.stop()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, interrupt)
+
+    try:
+        return await job.run()
+    finally:
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(signum)
+        job.checkpoint.close()
+        encode_scheduler.stop(timeout=5)
+        cpu_executor.shutdown()
+        if vector_index.peek() is not None:
+            vector_index.peek().flush()
+        if lexical_index.peek() is not None:
+            lexical_index.peek().close()
+        await document_downloader.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of documents, or manifest file")
+    parser.add_argument("--pattern", default="*.pdf", help="File name pattern when ingesting a directory")
+    parser.add_argument("--checkpoint", default="./bulk_ingest.checkpoint.jsonl", help="Checkpoint file")
+    parser.add_argument("--restart", action="store_true", help="Ignore the documents completed by an earlier run")
+    parser.add_argument("--workers", type=int, default=8, help="Documents downloaded and extracted at once")
+    parser.add_argument("--batch-chunks", type=int, default=512, help="Chunks per encode and store batch")
+    parser.add_argument("--source-label", default="bulk", help='Value of the "source" metadata field')
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument("--report", help="Write the final counters as JSON to this file")
+    args = parser.parse_args()
+
+    # Per-document logs would drown the progress lines
+    logging.basicConfig(level=getattr(logging, os.getenv("LOG_LEVEL", "WARNING")))
+
+    items = discover_items(args.source, args.pattern)
+    try:
+        checkpoint = Checkpoint(args.checkpoint, args.source, restart=args.restart)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    job = BulkIngestJob(
+        items,
+        checkpoint,
+        workers=args.workers,
+        batch_chunks=args.batch_chunks,
+        source=args.source_label,
+        progress_interval=args.progress_interval
+    )
+    try:
+        stats = asyncio.run(run_bulk_ingest(job))
+    except asyncio.CancelledError:
+        stats = job.stats
+    summary = stats.as_dict()
+    print(f"[bulk] Summary: {json.dumps(summary)}")
+    for doc_id, error in list(stats.failures.items())[:10]:
+        print(f"[bulk] Failed: {doc_id}: {error}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({**summary, "failures": stats.failures}, f, indent=2)
+    return 1 if stats.failed or stats.done + stats.skipped < stats.total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,36 +1,149 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from .services.kafka.kafka_client import kafka_message_queue
-from .services.kafka.topic_handlers import TOPIC_HANDLERS
+from .services.kafka.worker_supervisor import create_worker_supervisor
+from .services.pipeline_runtime import PipelineRuntime
+from .services.query_service import search_queries, answer_queries, stream_answers, document_summary
+from .services.utils.lazy_service import component_registry
+from .services.utils.metrics import create_pipeline_metrics, CONTENT_TYPE_LATEST
 import asyncio
+import json
+import os
+
+# Largest batch accepted by /search and /query
+MAX_BATCH_QUERIES = int(os.getenv("HTTP_MAX_BATCH_QUERIES", "64"))
+
+# KAFKA_CONSUMER_WORKERS > 0 consumes in that many worker processes instead of the API process
+worker_supervisor = create_worker_supervisor()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("FastAPI app has started!")
+    loop = asyncio.get_running_loop()
 
-    # Connect Kafka producer
-    kafka_message_queue.connect()
-
-    # Subscribe to Kafka topics with handlers
-    for topic, handler in TOPIC_HANDLERS.items():
-        if topic in [".", ".."] or not topic.strip():
-            continue
-        asyncio.get_event_loop().run_in_executor(
-            None,
-            kafka_message_queue.subscribe,
-            [topic],
-            "python-ai-consumer-group",
-            handler
-        )
+    runtime = PipelineRuntime(consume=worker_supervisor is None)
+    await runtime.start()
+    if worker_supervisor is not None:
+        with component_registry.track("consumer_workers"):
+            worker_supervisor.start()
 
     yield  # App is running
 
-    # Cleanup on shutdown
-    kafka_message_queue.disconnect()
+    # Cleanup on shutdown: workers and subscriptions drain in-flight messages and commit
+    if worker_supervisor is not None:
+        await loop.run_in_executor(None, worker_supervisor.stop)
+    await runtime.stop()
     print("FastAPI app has shut down!")
 
 app = FastAPI(lifespan=lifespan)
 
+# Stage timings are only collected when METRICS_ENABLED=true; gauges are read at scrape time
+pipeline_metrics = create_pipeline_metrics(engines=lambda: kafka_message_queue.engines)
+if pipeline_metrics is not None and worker_supervisor is not None:
+    print("Consumer workers run in their own processes; /metrics covers the API process only, "
+          "without the workers' stage timings and consumer lag")
+
 @app.get("/")
 async def read_root():
     return {"message": "Hello, FastAPI!"}
+
+@app.get("/ready")
+async def ready():
+    """Readiness and startup time of each component; 503 until all of them are ready"""
+    is_ready = component_registry.is_ready()
+    body = {"ready": is_ready, "components": component_registry.status()}
+    if worker_supervisor is not None:
+        body["workers"] = worker_supervisor.status()
+        body["ready"] = is_ready = is_ready and worker_supervisor.alive == worker_supervisor.workers
+    return JSONResponse(body, status_code=200 if is_ready else 503)
+
+@app.get("/metrics")
+async def metrics():
+    if pipeline_metrics is None:
+        return Response("Metrics are disabled, set METRICS_ENABLED=true\n", status_code=404, media_type="text/plain")
+    return Response(pipeline_metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+class SearchParams(BaseModel):
+    n_results: int = Field(3, ge=1, le=100)
+    similarity_threshold: float = 0.7
+
+class LLMParams(BaseModel):
+    max_tokens: int = Field(1000, ge=1)
+    temperature: float = Field(0.7, ge=0, le=2)
+    system_message: Optional[str] = None
+
+class SearchRequest(BaseModel):
+    """A batch of queries; search_params are those of a document.query event"""
+    queries: List[str] = Field(..., min_length=1)
+    search_params: SearchParams = SearchParams()
+
+class QueryRequest(SearchRequest):
+    """A batch of questions answered from their documents, optionally streamed as NDJSON"""
+    llm_params: LLMParams = LLMParams()
+    stream: bool = False
+
+def _check_batch(request: SearchRequest) -> None:
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per request")
+    if not all(query.strip() for query in request.queries):
+        raise HTTPException(status_code=422, detail="Queries must not be empty")
+
+@app.post("/search")
+async def search(request: SearchRequest):
+    """Similar documents of each query, without calling the LLM"""
+    _check_batch(request)
+    _, contexts = await search_queries(request.queries, **request.search_params.model_dump())
+    return {
+        "results": [
+            {"query": query, "documents": [document_summary(document) for document in documents]}
+            for query, documents in zip(request.queries, contexts)
+        ]
+    }
+
+@app.post("/query")
+async def query(request: QueryRequest):
+    """
+    Answer each query from its similar documents, like a document.query event
+
+    With stream=true the answers are generated concurrently and streamed as
+    NDJSON events: {"index", "documents"} for each query first, then
+    {"index", "delta"} pieces and a final {"index", "done", ...} or {"index", "error"}.
+    Without streaming, a query whose answer failed has an "error" instead of a "response".
+    """
+    _check_batch(request)
+    embeddings, contexts = await search_queries(request.queries, **request.search_params.model_dump())
+    llm_params = request.llm_params.model_dump()
+
+    if request.stream:
+        async def events():
+            for index, documents in enumerate(contexts):
+                summaries = [document_summary(document, include_content=False) for document in documents]
+                yield json.dumps({"index": index, "documents": summaries}) + "\n"
+            async for event in stream_answers(request.queries, embeddings, contexts, llm_params):
+                yield json.dumps(event) + "\n"
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    answers = await answer_queries(request.queries, embeddings, contexts, llm_params)
+    results = []
+    for query, documents, answer in zip(request.queries, contexts, answers):
+        result = {
+            "prompt": query,
+            "documents": [document_summary(document, include_content=False) for document in documents],
+        }
+        if isinstance(answer, Exception):
+            result["error"] = str(answer)
+        else:
+            response, cached = answer
+            result.update(
+                response=response.content,
+                model=response.model,
+                finish_reason=response.finish_reason,
+                cached=cached,
+                context_usage=response.context_usage
+            )
+        results.append(result)
+    return {"results": results}
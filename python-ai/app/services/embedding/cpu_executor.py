@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+import numpy as np
+
+from .embedding_backend import EmbeddingBackend, create_embedding_backend
+from ..utils.chunk_text import TextChunker, DEFAULT_CHUNK_SIZE, DEFAULT_CHUNK_OVERLAP
+from ..utils.extract_text import extract_page_range, get_page_count, page_ranges
+from ..utils.stage_timing import record_stage, stage_timing_enabled
+
+DEFAULT_PAGES_PER_RANGE = int(os.getenv("PDF_PAGES_PER_RANGE", "16"))
+
+logger = logging.getLogger(__name__)
+
+# Model loaded once per worker process by _init_worker, never pickled per call
+_worker_model: Optional[EmbeddingBackend] = None
+
+
+@dataclass
+class ExtractedDocument:
+    """Result of the extraction stage for one document"""
+    chunks: List[str]
+
+
+def _init_worker(model_name: str, backend: str, backend_options: Dict[str, Any]) -> None:
+    """Process pool initializer: load the embedding model once per worker"""
+    global _worker_model
+    _worker_model = create_embedding_backend(backend, model_name, **backend_options)
+    logger.info(f"CPU stage worker {os.getpid()} loaded model {model_name} ({backend})")
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(texts)
+
+
+def _dimension() -> int:
+    return _worker_model.dimension
+
+
+class CPUStageExecutor:
+    """
+    Runs the CPU-bound pipeline stages (PDF extraction, encoding) in a process
+    pool so they never block the asyncio event loop.
+
+    Each worker process loads the embedding model once in its initializer; calls
+    only ship texts in and arrays out. With ``workers=0`` the stages run in the
+    default thread pool of the calling loop instead.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int = 2,
+        backend: str = "sentence-transformers",
+        backend_options: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Initialize CPU stage executor
+
+        Args:
+            model_name: SentenceTransformer model to load in each worker
+            workers: Number of worker processes (0 disables the process pool)
+            backend: Embedding backend each worker loads (see create_embedding_backend)
+            backend_options: Extra create_embedding_backend arguments; unless set,
+                intra_op_threads splits the CPU cores between the workers
+        """
+        self.model_name = model_name
+        self.workers = max(0, workers)
+        self.backend = backend
+        self.backend_options = dict(backend_options or {})
+        if self.workers and not self.backend_options.get("intra_op_threads"):
+            self.backend_options["intra_op_threads"] = max(1, (os.cpu_count() or 1) // self.workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> Optional[Executor]:
+        """Process pool, created on first use"""
+        if not self.workers:
+            return None
+        with self._lock:
+            if self._pool is None:
+                # spawn avoids forking a parent that may already hold torch threads
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.backend, self.backend_options)
+                )
+                logger.info(f"Started CPU stage pool with {self.workers} workers")
+            return self._pool
+
+    async def iter_document_chunks(
+        self,
+        file_path: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+        pages_per_range: int = DEFAULT_PAGES_PER_RANGE
+    ) -> AsyncIterator[List[str]]:
+        """
+        Extract a PDF in parallel page ranges and yield its chunks as they become available
+
+        All page ranges are submitted at once, so a large document is spread over
+        every worker; ranges are merged back in page order and chunked incrementally,
+        so encoding can start before the last page has been read.
+
+        Args:
+            file_path: Path to the PDF file
+            chunk_size: Maximum number of characters per chunk
+            chunk_overlap: Number of characters shared between consecutive chunks
+            pages_per_range: Number of pages extracted by each task
+
+        Yields:
+            Lists of chunks, in document order
+
+        Raises:
+            Exception: If the PDF cannot be processed or has no text content
+        """
+        started = time.perf_counter() if stage_timing_enabled() else None
+        loop = asyncio.get_running_loop()
+        page_count = await loop.run_in_executor(None, get_page_count, file_path)
+        futures = [
+            loop.run_in_executor(self.pool, extract_page_range, file_path, start, stop)
+            for start, stop in page_ranges(page_count, pages_per_range)
+        ]
+
+        chunker = TextChunker(chunk_size, chunk_overlap)
+        has_text = False
+        chunk_count = 0
+        try:
+            for future in futures:
+                range_text = await future
+                if not range_text.strip():
+                    continue
+                chunks = chunker.feed(("\n" if has_text else "") + range_text)
+                has_text = True
+                if chunks:
+                    chunk_count += len(chunks)
+                    yield chunks
+        finally:
+            for future in futures:
+                future.cancel()
+
+        if not has_text:
+            raise Exception("PDF text extraction failed: No text content found in PDF")
+
+        chunks = chunker.flush()
+        chunk_count += len(chunks)
+        if started is not None:
+            record_stage("extract", time.perf_counter() - started, pages=page_count, chunks=chunk_count)
+        if chunks:
+            yield chunks
+
+    async def extract_document(
+        self,
+        file_path: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+    ) -> ExtractedDocument:
+        """
+        Extract and chunk a whole PDF outside the event loop
+
+        Args:
+            file_path: Path to the PDF file
+            chunk_size: Maximum number of characters per chunk
+            chunk_overlap: Number of characters shared between consecutive chunks
+
+        Returns:
+            ExtractedDocument with the document's chunks
+        """
+        chunks = []
+        async for batch in self.iter_document_chunks(file_path, chunk_size, chunk_overlap):
+            chunks.extend(batch)
+        return ExtractedDocument(chunks=chunks)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts in a worker process, blocking the calling thread.
+
+        Intended as the encode function of an EncodeScheduler, whose worker
+        threads already run off the event loop.
+        """
+        if not self.workers:
+            raise RuntimeError("CPU stage pool is disabled (workers=0); encode with the in-process model instead")
+        return self.pool.submit(_encode, texts).result()
+
+    def dimension(self) -> int:
+        """Embedding dimension of the workers' model, blocking until a worker has loaded it"""
+        if not self.workers:
+            raise RuntimeError("CPU stage pool is disabled (workers=0); ask the in-process model instead")
+        return self.pool.submit(_dimension).result()
+
+    def warm_up(self) -> None:
+        """Start the worker processes and load their models with one tiny encode per worker"""
+        if not self.workers:
+            return
+        futures = [self.pool.submit(_encode, ["warm up"]) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Shut down the process pool"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=wait, cancel_futures=True)
+            logger.info("CPU stage pool shut down")
+
+
+class PooledEmbeddingBackend(EmbeddingBackend):
+    """
+    The model held by the CPU stage workers, behind the EmbeddingBackend interface.
+
+    Lets a process that encodes through the pool hand a model to the code that
+    needs one (vector index dimension, retriever) without loading a copy of its own.
+    """
+
+    name = "pool"
+
+    def __init__(self, executor: CPUStageExecutor):
+        """
+        Initialize pooled backend
+
+        Args:
+            executor: CPU stage executor with at least one worker
+        """
+        self.executor = executor
+        self._dimension: Optional[int] = None
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = self.executor.dimension()
+        return self._dimension
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32) -> np.ndarray:
+        if isinstance(texts, str):
+            return self.executor.encode([texts])[0]
+        return self.executor.encode(list(texts))
@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentTooLargeError(Exception):
+    """Raised when a document exceeds the downloader's size cap"""
+
+
+@dataclass
+class DownloadResult:
+    """Outcome of a download"""
+    file_path: Optional[str]  # None when the document was not modified
+    size: int = 0
+    sha256: Optional[str] = None
+    etag: Optional[str] = None
+    not_modified: bool = False
+    temporary: bool = True  # file_path is a temp file the caller deletes
+
+
+class DocumentDownloader:
+    """
+    Streams documents to unique temp files over a shared, pooled HTTP session.
+
+    The session (and therefore the keep-alive connections to MinIO) is reused
+    across messages. Bodies are written chunk by chunk, so peak memory does not
+    depend on object size, and a global semaphore bounds concurrent downloads.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_bytes: int = 100 * 1024 * 1024,
+        total_timeout: float = 120.0,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 30.0,
+        chunk_size: int = 64 * 1024,
+        pool_size: int = 32,
+        temp_dir: Optional[str] = None
+    ):
+        """
+        Initialize document downloader
+
+        Args:
+            max_concurrency: Maximum number of downloads in flight
+            max_bytes: Maximum document size; larger documents are rejected
+            total_timeout: Timeout for a whole download, in seconds
+            connect_timeout: Timeout for establishing a connection, in seconds
+            read_timeout: Timeout between two reads of the body, in seconds
+            chunk_size: Size of the chunks streamed to disk
+            pool_size: Maximum number of pooled connections
+            temp_dir: Directory for downloaded files (defaults to the system temp dir)
+        """
+        self.max_concurrency = max_concurrency
+        self.max_bytes = max_bytes
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        self.chunk_size = chunk_size
+        self.pool_size = pool_size
+        self.temp_dir = temp_dir
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it for the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if self._session is not None and not self._session.closed:
+                await self._close_stale_session()
+            # aiohttp sessions are bound to the loop that created them
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._session
+
+    async def _close_stale_session(self) -> None:
+        """Close the session of an earlier event loop instead of leaking its pooled connections"""
+        session, loop = self._session, self._loop
+        self._session = None
+        if loop is not None and loop.is_running():
+            # Still running (in another thread): close the session on its own loop
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            # Its loop has stopped; closing from this loop still releases the connector
+            await session.close()
+        logger.info("Closed the download session of a previous event loop")
+
+    async def download(self, url: str) -> str:
+        """
+        Download a document to a unique temp file
+
+        Args:
+            url: Document URL (e.g. a presigned MinIO URL)
+
+        Returns:
+            str: Path of the downloaded file; the caller is responsible for deleting it
+
+        Raises:
+            DocumentTooLargeError: If the document exceeds max_bytes
+            Exception: If the download fails
+        """
+        result = await self.fetch(url)
+        return result.file_path
+
+    async def fetch(self, url: str, etag: Optional[str] = None) -> DownloadResult:
+        """
+        Download a document to a unique temp file, hashing it while it streams
+
+        Args:
+            url: Document URL (e.g. a presigned MinIO URL)
+            etag: ETag of the copy we already have; the server may then answer
+                304 Not Modified and nothing is downloaded
+
+        Returns:
+            DownloadResult with the file path (the caller is responsible for deleting it),
+            size and SHA-256 of the body
+
+        Raises:
+            DocumentTooLargeError: If the document exceeds max_bytes
+            Exception: If the download fails
+        """
+        session = await self._ensure_session()
+        filename = os.path.basename(url.split("?")[0]) or "document"
+        request_headers = {"If-None-Match": etag} if etag else None
+
+        async with self._semaphore:
+            async with session.get(url, headers=request_headers) as resp:
+                if resp.status == 304:
+                    return DownloadResult(file_path=None, etag=etag, not_modified=True)
+
+                if resp.status != 200:
+                    raise Exception(f"Failed to download document: {resp.status}")
+
+                if resp.content_length is not None and resp.content_length > self.max_bytes:
+                    raise DocumentTooLargeError(
+                        f"Document is {resp.content_length} bytes, limit is {self.max_bytes}"
+                    )
+
+                fd, file_path = tempfile.mkstemp(prefix="aether-", suffix=f"-{filename}", dir=self.temp_dir)
+                digest = hashlib.sha256()
+                try:
+                    size = 0
+                    with os.fdopen(fd, "wb") as f:
+                        async for chunk in resp.content.iter_chunked(self.chunk_size):
+                            size += len(chunk)
+                            if size > self.max_bytes:
+                                raise DocumentTooLargeError(
+                                    f"Document exceeds size limit of {self.max_bytes} bytes"
+                                )
+                            digest.update(chunk)
+                            f.write(chunk)
+                except BaseException:
+                    os.remove(file_path)
+                    raise
+
+                response_etag = resp.headers.get("ETag")
+
+        logger.debug(f"Downloaded {size} bytes to {file_path}")
+        return DownloadResult(
+            file_path=file_path,
+            size=size,
+            sha256=digest.hexdigest(),
+            etag=response_etag
+        )
+
+    async def fetch_local(self, path: str) -> DownloadResult:
+        """
+        Hash a local document in place, as a download of it would
+
+        Args:
+            path: Path of the document
+
+        Returns:
+            DownloadResult for the file itself; it is not temporary and must not be deleted
+
+        Raises:
+            DocumentTooLargeError: If the document exceeds max_bytes
+            OSError: If the file cannot be read
+        """
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            raise DocumentTooLargeError(f"Document is {size} bytes, limit is {self.max_bytes}")
+
+        def hash_file() -> str:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(self.chunk_size * 16), b""):
+                    digest.update(chunk)
+            return digest.hexdigest()
+
+        sha256 = await asyncio.get_running_loop().run_in_executor(None, hash_file)
+        return DownloadResult(file_path=path, size=size, sha256=sha256, temporary=False)
+
+    async def close(self) -> None:
+        """Close the shared session"""
+        if self._session and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+        self._loop = None
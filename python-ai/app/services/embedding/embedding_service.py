@@ -1,27 +1,146 @@
-import aiohttp
 import os
-from sentence_transformers import SentenceTransformer
-from chromadb import PersistentClient
+from typing import List, Optional
+from .encode_scheduler import EncodeScheduler
+from .cpu_executor import CPUStageExecutor, PooledEmbeddingBackend
+from .document_downloader import DocumentDownloader, DownloadResult
+from .query_cache import QueryEmbeddingCache
+from .embedding_backend import EmbeddingBackend, create_embedding_backend
+from ..index.vector_index import ChromaIndex, VectorIndex
+from ..index.numpy_index import NumpyIndex
+from ..index.lexical_index import BM25Index
+from ..utils.lazy_service import LazyService
 
-# Initialize the embedding model
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 
-# Initialize local ChromaDB client (new API)
-chroma_client = PersistentClient(path="./chromadb")
-collection = chroma_client.get_or_create_collection(name="document_embeddings")
+# Encoder implementation: "sentence-transformers" (PyTorch, default) or "onnx", which runs
+# the model exported by export_onnx_model (optionally int8-quantized) without PyTorch
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers").lower()
+_intra_op_threads = os.getenv("EMBEDDING_INTRA_OP_THREADS")
+EMBEDDING_BACKEND_OPTIONS = {
+    "onnx_path": os.getenv("EMBEDDING_ONNX_PATH", "./onnx/all-MiniLM-L6-v2"),
+    "quantized": os.getenv("EMBEDDING_ONNX_QUANTIZED", "false").lower() == "true",
+    "intra_op_threads": int(_intra_op_threads) if _intra_op_threads else None,
+}
+
+# Process pool for PDF extraction and encoding, so they never run on the event loop;
+# the pool and its per-worker models are only started by the first call
+cpu_executor = CPUStageExecutor(
+    model_name=EMBEDDING_MODEL_NAME,
+    workers=int(os.getenv("CPU_STAGE_WORKERS", "2")),
+    backend=EMBEDDING_BACKEND,
+    backend_options=EMBEDDING_BACKEND_OPTIONS
+)
+
+
+def _load_embedding_model() -> EmbeddingBackend:
+    if cpu_executor.workers:
+        # The pool's workers hold the model; this process does not load a copy of its own
+        model = PooledEmbeddingBackend(cpu_executor)
+        model.dimension  # Ready once a worker has loaded the model
+        return model
+    return create_embedding_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME, **EMBEDDING_BACKEND_OPTIONS)
+
+
+# Expensive services (model, stores) are created on first use or when the app
+# lifespan warms them, never at import time
+embedding_model = LazyService("embedding_model", _load_embedding_model)
+
+
+def _encode_in_process(texts):
+    return embedding_model.get().encode(texts)
+
+
+# Micro-batching scheduler shared by the ingestion and query paths
+encode_scheduler = EncodeScheduler(
+    cpu_executor.encode if cpu_executor.workers else _encode_in_process,
+    max_batch_size=int(os.getenv("ENCODE_MAX_BATCH_SIZE", "64")),
+    max_wait_ms=float(os.getenv("ENCODE_MAX_WAIT_MS", "5")),
+    concurrency=max(1, cpu_executor.workers)
+)
+
+# LRU/TTL cache of query embeddings, keyed by model name and normalized query text
+_query_cache_ttl = os.getenv("QUERY_CACHE_TTL_SECONDS")
+query_embedding_cache = QueryEmbeddingCache(
+    model_name=EMBEDDING_MODEL_NAME,
+    max_size=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+    ttl_seconds=float(_query_cache_ttl) if _query_cache_ttl else None
+)
+
+# Vector store used by ingestion and retrieval: "chroma" (default) or the in-process "numpy" index,
+# whose vectors can be stored as float32, float16 or int8 with exact re-ranking of candidates
+# (compact formats use 2x/4x less memory but scan slower; VECTOR_INDEX_SCAN_CACHE_MB trades memory back for speed)
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "chroma").lower()
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+
+
+def _open_vector_index() -> VectorIndex:
+    if VECTOR_INDEX_BACKEND == "numpy":
+        return NumpyIndex(
+            path=os.getenv("VECTOR_INDEX_PATH", "./vector_index"),
+            dimension=embedding_model.get().dimension,
+            storage=os.getenv("VECTOR_INDEX_STORAGE", "float32").lower(),
+            rerank_factor=int(os.getenv("VECTOR_INDEX_RERANK_FACTOR", "4")),
+            scan_cache_bytes=int(float(os.getenv("VECTOR_INDEX_SCAN_CACHE_MB", "0")) * 1024 * 1024)
+        )
+
+    import chromadb
+
+    if CHROMA_HOST:
+        # Chroma server: safe to share between the API process and consumer worker processes
+        chroma_client = chromadb.HttpClient(host=CHROMA_HOST, port=int(os.getenv("CHROMA_PORT", "8000")))
+    else:
+        # Initialize local ChromaDB client (new API)
+        chroma_client = chromadb.PersistentClient(path="./chromadb")
+    collection = chroma_client.get_or_create_collection(name="document_embeddings")
+    return ChromaIndex(collection)
+
+
+vector_index = LazyService("vector_index", _open_vector_index)
+
+# BM25 index over the same chunks, kept up to date by the ingestion pipeline for hybrid retrieval
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+
+
+def _open_lexical_index() -> Optional[BM25Index]:
+    if not LEXICAL_INDEX_ENABLED:
+        return None
+    return BM25Index(path=os.getenv("LEXICAL_INDEX_PATH", "./lexical_index"))
+
+
+lexical_index = LazyService("lexical_index", _open_lexical_index)
+
+
+def process_local_stores() -> List[str]:
+    """Stores kept in files that only one process may open; they cannot be shared by consumer workers"""
+    stores = []
+    if VECTOR_INDEX_BACKEND == "numpy":
+        stores.append("vector index (VECTOR_INDEX_BACKEND=numpy)")
+    elif not CHROMA_HOST:
+        stores.append("vector index (local ChromaDB, set CHROMA_HOST)")
+    if LEXICAL_INDEX_ENABLED:
+        # Enabled by default; its append-only log would be written by several processes
+        stores.append("lexical index (enabled by default, set LEXICAL_INDEX_ENABLED=false)")
+    return stores
+
+
+# Shared, pooled downloader reused across messages
+document_downloader = DocumentDownloader(
+    max_concurrency=int(os.getenv("DOWNLOAD_MAX_CONCURRENCY", "8")),
+    max_bytes=int(os.getenv("DOWNLOAD_MAX_BYTES", str(100 * 1024 * 1024))),
+    total_timeout=float(os.getenv("DOWNLOAD_TIMEOUT_SECONDS", "120")),
+    connect_timeout=float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT_SECONDS", "10")),
+    read_timeout=float(os.getenv("DOWNLOAD_READ_TIMEOUT_SECONDS", "30")),
+    pool_size=int(os.getenv("DOWNLOAD_POOL_SIZE", "32"))
+)
 
 async def download_document(url: str) -> str:
-    filename = url.split("?")[0].split("/")[-1]
-    file_path = os.path.join("/tmp", filename)
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status == 200:
-                with open(file_path, 'wb') as f:
-                    f.write(await resp.read())
-                return file_path
-            else:
-                raise Exception(f"Failed to download document: {resp.status}")
+    return await document_downloader.download(url)
+
+async def fetch_document(url: str, etag: Optional[str] = None) -> DownloadResult:
+    return await document_downloader.fetch(url, etag)
+
+async def fetch_local_document(path: str) -> DownloadResult:
+    return await document_downloader.fetch_local(path)
 
 def extract_text_from_pdf(file_path: str) -> str:
     import fitz  # PyMuPDF
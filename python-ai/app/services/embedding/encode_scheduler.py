@@ -0,0 +1,298 @@
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ..utils.priority_scheduler import current_weight
+from ..utils.stage_timing import record_stage
+
+logger = logging.getLogger(__name__)
+
+EncodeFunction = Callable[[List[str]], np.ndarray]
+
+# Queue rank of the stop sentinel: workers only see it once every queued request is taken
+_STOP_RANK = float("inf")
+
+
+@dataclass
+class _EncodeRequest:
+    """A pending encode request waiting to be batched"""
+    texts: List[str]
+    single: bool
+    future: Future
+    weight: float = 1.0
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class EncodeSchedulerStats:
+    """Batching statistics reported by the encode scheduler"""
+    batches: int = 0
+    requests: int = 0
+    texts: int = 0
+    max_batch_size: int = 0
+    total_queue_wait: float = 0.0
+    max_queue_wait: float = 0.0
+    total_encode_time: float = 0.0
+
+    @property
+    def avg_batch_size(self) -> float:
+        return self.texts / self.batches if self.batches else 0.0
+
+    @property
+    def avg_queue_wait(self) -> float:
+        return self.total_queue_wait / self.requests if self.requests else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts,
+            "avg_batch_size": self.avg_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_queue_wait_ms": self.avg_queue_wait * 1000,
+            "max_queue_wait_ms": self.max_queue_wait * 1000,
+            "total_encode_time_ms": self.total_encode_time * 1000,
+        }
+
+
+class EncodeScheduler:
+    """
+    Micro-batching scheduler in front of the embedding model.
+
+    Encode requests from any thread or event loop are queued and worker
+    threads drain them into batches of up to ``max_batch_size`` texts,
+    waiting at most ``max_wait_ms`` for a batch to fill. Each caller gets its
+    own slice of the batch result back through a future.
+
+    A request with more than ``max_batch_size`` texts is split into slices of
+    that size, encoded as separate batches and concatenated again.
+
+    Requests are taken by weight, then in arrival order: a query submitted
+    with a higher weight than a queued bulk ingestion goes into the next
+    batch. The weight defaults to the caller's scheduling weight
+    (``current_weight``), set by the priority scheduler around handler calls.
+    """
+
+    def __init__(
+        self,
+        encode_fn: EncodeFunction,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        concurrency: int = 1
+    ):
+        """
+        Initialize encode scheduler
+
+        Args:
+            encode_fn: Function encoding a list of texts into a 2-D array
+            max_batch_size: Maximum number of texts per encode call
+            max_wait_ms: Maximum time to wait for more requests before encoding
+            concurrency: Number of batches that may be encoded at the same time
+                (only useful when encode_fn dispatches to a process pool)
+        """
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be positive")
+        if concurrency <= 0:
+            raise ValueError("concurrency must be positive")
+
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.concurrency = concurrency
+
+        # Entries are (-weight, sequence, request); a None request stops a worker
+        self._queue: "queue.PriorityQueue[Tuple[float, int, Optional[_EncodeRequest]]]" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._stats = EncodeSchedulerStats()
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """Start the batching worker threads (idempotent)"""
+        with self._start_lock:
+            if any(worker.is_alive() for worker in self._workers):
+                return
+            self._workers = [
+                threading.Thread(target=self._run, name=f"encode-scheduler-{i}", daemon=True)
+                for i in range(self.concurrency)
+            ]
+            for worker in self._workers:
+                worker.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker threads after draining already queued requests"""
+        with self._start_lock:
+            workers = [worker for worker in self._workers if worker.is_alive()]
+            self._workers = []
+        for _ in workers:
+            self._queue.put((_STOP_RANK, next(self._sequence), None))
+        for worker in workers:
+            worker.join(timeout)
+
+    def submit(self, texts: Union[str, List[str]], weight: Optional[float] = None) -> Future:
+        """
+        Queue texts for encoding
+
+        Args:
+            texts: A single text or a list of texts
+            weight: Requests with a higher weight are batched first
+                (if None, the caller's current_weight)
+
+        Returns:
+            Future resolving to a 1-D vector for a single text, or a 2-D array for a list
+        """
+        if weight is None:
+            weight = current_weight.get()
+        if not isinstance(texts, str) and len(texts) > self.max_batch_size:
+            return self._submit_slices(list(texts), weight)
+
+        single = isinstance(texts, str)
+        request = _EncodeRequest(
+            texts=[texts] if single else list(texts),
+            single=single,
+            future=Future(),
+            weight=weight
+        )
+
+        if not request.texts:
+            request.future.set_result(np.empty((0, 0), dtype=np.float32))
+            return request.future
+
+        self.start()
+        self._queue.put((-request.weight, next(self._sequence), request))
+        return request.future
+
+    def _submit_slices(self, texts: List[str], weight: float) -> Future:
+        """Queue more texts than fit in one batch as max_batch_size slices and concatenate their results"""
+        slices = [
+            self.submit(texts[start:start + self.max_batch_size], weight)
+            for start in range(0, len(texts), self.max_batch_size)
+        ]
+        combined = Future()
+        remaining = [len(slices)]
+        lock = threading.Lock()
+
+        def slice_done(_: Future) -> None:
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if not combined.set_running_or_notify_cancel():
+                return
+            errors = [future.exception() for future in slices if not future.cancelled() and future.exception()]
+            if errors:
+                combined.set_exception(errors[0])
+            else:
+                combined.set_result(np.concatenate([future.result() for future in slices]))
+
+        def combined_done(future: Future) -> None:
+            if future.cancelled():
+                for part in slices:
+                    part.cancel()
+
+        combined.add_done_callback(combined_done)
+        for part in slices:
+            part.add_done_callback(slice_done)
+        return combined
+
+    async def encode(self, texts: Union[str, List[str]], weight: Optional[float] = None) -> np.ndarray:
+        """Encode texts without blocking the calling event loop"""
+        return await asyncio.wrap_future(self.submit(texts, weight))
+
+    def encode_sync(self, texts: Union[str, List[str]], weight: Optional[float] = None) -> np.ndarray:
+        """Encode texts, blocking the calling thread until the batch is done"""
+        return self.submit(texts, weight).result()
+
+    @property
+    def stats(self) -> EncodeSchedulerStats:
+        """Snapshot of the batching statistics"""
+        with self._stats_lock:
+            return EncodeSchedulerStats(**vars(self._stats))
+
+    def _next_entry(self, timeout: Optional[float]) -> Tuple[float, int, Optional[_EncodeRequest]]:
+        if timeout is None or timeout > 0:
+            return self._queue.get(timeout=timeout)
+        return self._queue.get_nowait()
+
+    def _collect_batch(self) -> Optional[List[_EncodeRequest]]:
+        """
+        Block for the first request, then fill the batch until it is full or max_wait expires
+
+        Returns:
+            The batch, or None when stopping
+        """
+        first = self._next_entry(timeout=None)[2]
+        if first is None:
+            return None
+
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.perf_counter() + self.max_wait
+
+        while size < self.max_batch_size:
+            try:
+                entry = self._next_entry(timeout=deadline - time.perf_counter())
+            except queue.Empty:
+                break
+            request = entry[2]
+            if request is None or size + len(request.texts) > self.max_batch_size:
+                # Put it back in its place: the stop sentinel ends the worker after this
+                # batch, a request that does not fit competes again for the next one
+                self._queue.put(entry)
+                break
+            batch.append(request)
+            size += len(request.texts)
+
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch: List[_EncodeRequest]) -> None:
+        # Skip requests whose callers have already given up
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        texts = [text for request in batch for text in request.texts]
+        started = time.perf_counter()
+
+        try:
+            embeddings = np.asarray(self.encode_fn(texts))
+        except Exception as e:
+            logger.error(f"Error encoding batch of {len(texts)} texts: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        record_stage("encode", finished - started, batch_size=len(texts), requests=len(batch))
+        offset = 0
+        for request in batch:
+            result = embeddings[offset:offset + len(request.texts)]
+            offset += len(request.texts)
+            request.future.set_result(result[0] if request.single else result)
+
+        with self._stats_lock:
+            self._stats.batches += 1
+            self._stats.requests += len(batch)
+            self._stats.texts += len(texts)
+            self._stats.max_batch_size = max(self._stats.max_batch_size, len(texts))
+            self._stats.total_encode_time += finished - started
+            for request in batch:
+                wait = started - request.enqueued_at
+                self._stats.total_queue_wait += wait
+                self._stats.max_queue_wait = max(self._stats.max_queue_wait, wait)
@@ -0,0 +1,357 @@
+import asyncio
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_service import fetch_document, fetch_local_document, encode_scheduler, cpu_executor, vector_index, lexical_index
+from ..utils.stage_timing import time_stage
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PreparedDocument:
+    """A document that has been downloaded, extracted, chunked and (optionally) encoded"""
+    doc_id: str
+    chunks: List[str]
+    embeddings: Optional[np.ndarray] = None
+    content_sha256: Optional[str] = None  # Hash of the raw bytes
+    text_sha256: Optional[str] = None  # Hash of the extracted, chunked text
+    etag: Optional[str] = None
+    previous_chunk_count: int = 0
+    unchanged: bool = False  # Stored vectors are already up to date
+
+
+def hash_chunks(chunks: List[str]) -> str:
+    """Fingerprint extracted text by its chunks, so a change of chunking settings also re-embeds"""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def get_stored_fingerprints(doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Look up the stored metadata (hashes, etag, chunk count) of documents
+
+    Reads only the first chunk of each document, in one index lookup.
+
+    Args:
+        doc_ids: Documents to look up
+
+    Returns:
+        Mapping of doc_id to the metadata of its first chunk, for documents that are stored
+    """
+    if not doc_ids:
+        return {}
+
+    index = vector_index.get()
+    doc_filter = {"doc_id": doc_ids[0]} if len(doc_ids) == 1 else {"doc_id": {"$in": doc_ids}}
+    result = index.get(
+        where={"$and": [doc_filter, {"chunk_index": 0}]},
+        include=["metadatas"]
+    )
+    return {
+        metadata["doc_id"]: metadata
+        for metadata in (result["metadatas"] or [])
+        if metadata and "doc_id" in metadata
+    }
+
+
+async def prepare_document(
+    url: str,
+    doc_id: str,
+    encode: bool = True,
+    stored: Optional[Dict[str, Any]] = None,
+    local: bool = False
+) -> PreparedDocument:
+    """
+    Download, extract and chunk a document, optionally encoding its chunks
+
+    The pipeline short-circuits when the stored copy is current: first when the
+    server answers 304 to the stored ETag or the raw bytes hash the same, then
+    when the extracted text hashes the same. New documents are encoded while they
+    are being extracted; updated ones only once their text is known to differ.
+
+    Args:
+        url: Document URL
+        doc_id: Document ID
+        encode: Whether to encode the chunks here (batch ingestion encodes all documents at once)
+        stored: Stored fingerprint of the document (looked up if None)
+        local: ``url`` is the path of a local file, read in place instead of downloaded
+
+    Returns:
+        PreparedDocument for the document, with ``unchanged`` set when nothing needs storing
+    """
+    loop = asyncio.get_running_loop()
+    if stored is None:
+        stored = (await loop.run_in_executor(None, get_stored_fingerprints, [doc_id])).get(doc_id, {})
+    previous_chunk_count = int(stored.get("chunk_count", 0))
+
+    file_path = None
+    temp_path = None
+    try:
+        # Download document
+        async with time_stage("download") as stage:
+            if local:
+                download = await fetch_local_document(url)
+            else:
+                download = await fetch_document(url, etag=stored.get("etag"))
+            stage.values.update(bytes=download.size, not_modified=download.not_modified)
+        file_path = download.file_path
+        if download.temporary:
+            temp_path = file_path
+
+        if download.not_modified or (stored and download.sha256 == stored.get("content_sha256")):
+            logger.info(f"Document {doc_id} is unchanged, skipping re-embedding")
+            return PreparedDocument(
+                doc_id=doc_id,
+                chunks=[],
+                content_sha256=stored.get("content_sha256"),
+                text_sha256=stored.get("text_sha256"),
+                etag=download.etag,
+                previous_chunk_count=previous_chunk_count,
+                unchanged=True
+            )
+        logger.info(f"Document downloaded: {file_path} ({download.size} bytes)")
+
+        # Extract the PDF in parallel page ranges off the event loop; only stream
+        # chunks into the encoder when there is no stored copy that could match
+        stream_encode = encode and not stored
+        chunks = []
+        encode_tasks = []
+        try:
+            async for batch in cpu_executor.iter_document_chunks(file_path):
+                chunks.extend(batch)
+                if stream_encode:
+                    encode_tasks.append(asyncio.ensure_future(encode_scheduler.encode(batch)))
+            logger.info(f"Text of {doc_id} extracted into {len(chunks)} chunks")
+
+            document = PreparedDocument(
+                doc_id=doc_id,
+                chunks=chunks,
+                content_sha256=download.sha256,
+                text_sha256=hash_chunks(chunks),
+                etag=download.etag,
+                previous_chunk_count=previous_chunk_count
+            )
+
+            if stored and document.text_sha256 == stored.get("text_sha256"):
+                logger.info(f"Text of {doc_id} is unchanged, skipping re-embedding")
+                await loop.run_in_executor(None, refresh_fingerprint, document)
+                document.unchanged = True
+                return document
+
+            if stream_encode:
+                document.embeddings = np.concatenate(await asyncio.gather(*encode_tasks))
+            elif encode:
+                document.embeddings = await encode_scheduler.encode(chunks)
+        finally:
+            for task in encode_tasks:
+                task.cancel()
+
+        return document
+
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def refresh_fingerprint(document: PreparedDocument) -> None:
+    """Record new raw-bytes hash and ETag for a document whose text did not change"""
+    index = vector_index.get()
+    result = index.get(where={"doc_id": document.doc_id}, include=["metadatas"])
+    if not result["ids"]:
+        return
+
+    metadatas = [
+        {**metadata, "content_sha256": document.content_sha256, "etag": document.etag or ""}
+        for metadata in result["metadatas"]
+    ]
+    index.update(ids=result["ids"], metadatas=metadatas)
+
+
+async def encode_documents(documents: List[PreparedDocument]) -> None:
+    """Encode the chunks of all documents that still need it in one batched encode call"""
+    pending = [document for document in documents if not document.unchanged and document.embeddings is None]
+    chunks = [chunk for document in pending for chunk in document.chunks]
+    if not chunks:
+        return
+
+    embeddings = await encode_scheduler.encode(chunks)
+
+    offset = 0
+    for document in pending:
+        document.embeddings = embeddings[offset:offset + len(document.chunks)]
+        offset += len(document.chunks)
+
+
+def store_documents(documents: List[PreparedDocument], source: str = "kafka") -> None:
+    """
+    Store the chunks of all changed documents in the vector index with a single bulk write
+
+    Chunk ids are "<doc_id>#<n>", so a re-embedded document overwrites its vectors
+    in place with one upsert; chunks beyond its new length are deleted. A document
+    stored before chunking, as a single record with id "<doc_id>", has that record
+    deleted when it is first stored as chunks.
+    The text hash doubles as the document version, so cached responses based on
+    older content never match.
+
+    The stores cannot be written atomically, so the lexical index (when enabled)
+    is written first and the vector upsert, which records the new fingerprint,
+    last: if any write fails, the stored fingerprint is still the old one and the
+    retried message rewrites everything. Lexical entries left without a vector
+    record are dropped by ``backfill_lexical_index`` at startup.
+    """
+    ids, texts, embeddings, metadatas, stale_ids, new_doc_ids = [], [], [], [], [], []
+    for document in documents:
+        if document.unchanged:
+            continue
+        if not document.previous_chunk_count:
+            new_doc_ids.append(document.doc_id)
+        for i, chunk in enumerate(document.chunks):
+            ids.append(f"{document.doc_id}#{i}")
+            texts.append(chunk)
+            metadatas.append({
+                "source": source,
+                "filename": document.doc_id,
+                "doc_id": document.doc_id,
+                "chunk_index": i,
+                "chunk_count": len(document.chunks),
+                "version": document.text_sha256,
+                "content_sha256": document.content_sha256,
+                "text_sha256": document.text_sha256,
+                "etag": document.etag or "",
+            })
+        embeddings.extend(document.embeddings.tolist())
+        stale_ids.extend(
+            f"{document.doc_id}#{i}"
+            for i in range(len(document.chunks), document.previous_chunk_count)
+        )
+
+    if not ids:
+        return
+
+    index = vector_index.get()
+    stale_ids.extend(legacy_record_ids(new_doc_ids))
+
+    with time_stage("store", chunks=len(ids), documents=len(documents)):
+        lexical = lexical_index.get()
+        if lexical is not None:
+            lexical.upsert(ids, texts)
+            if stale_ids:
+                lexical.delete(stale_ids)
+
+        if stale_ids:
+            index.delete(ids=stale_ids)
+        index.upsert(
+            documents=texts,
+            embeddings=embeddings,
+            ids=ids,
+            metadatas=metadatas
+        )
+
+
+def legacy_record_ids(doc_ids: List[str]) -> List[str]:
+    """
+    Find documents stored before chunking: one record per document, with id "<doc_id>"
+
+    Those records have no "doc_id" metadata, so fingerprint lookups never find
+    them; they are recognized by id and by the missing field.
+
+    Args:
+        doc_ids: Documents to look for
+
+    Returns:
+        Ids of the legacy records among them
+    """
+    if not doc_ids:
+        return []
+    result = vector_index.get().get(ids=doc_ids, include=["metadatas"])
+    metadatas = result["metadatas"] or [None] * len(result["ids"])
+    return [
+        record_id for record_id, metadata in zip(result["ids"], metadatas)
+        if not metadata or "doc_id" not in metadata
+    ]
+
+
+def backfill_lexical_index() -> int:
+    """
+    Reconcile the lexical index with the vector index, which is the source of truth
+
+    Indexes chunks that were stored before the lexical index existed or whose
+    lexical write was lost, and drops lexical entries whose vector record is gone
+    (left behind when a store_documents call failed halfway).
+
+    Returns:
+        int: Number of chunks added or removed
+    """
+    index, lexical = vector_index.get(), lexical_index.get()
+    if lexical is None:
+        return 0
+
+    vector_ids = set(index.get(include=["metadatas"])["ids"])
+    lexical_ids = set(lexical.ids())
+    missing = [chunk_id for chunk_id in vector_ids if chunk_id not in lexical_ids]
+    orphaned = [chunk_id for chunk_id in lexical_ids if chunk_id not in vector_ids]
+
+    if missing:
+        result = index.get(ids=missing, include=["documents"])
+        lexical.upsert(result["ids"], result["documents"] or [""] * len(result["ids"]))
+        logger.info(f"Backfilled lexical index with {len(result['ids'])} chunks")
+    if orphaned:
+        lexical.delete(orphaned)
+        logger.info(f"Removed {len(orphaned)} chunks without a vector record from the lexical index")
+    return len(missing) + len(orphaned)
+
+
+async def ingest_documents(
+    items: List[Tuple[str, str]],
+    source: str = "kafka",
+    errors: Optional[Dict[str, BaseException]] = None
+) -> List[PreparedDocument]:
+    """
+    Ingest a batch of documents
+
+    Stored fingerprints are looked up in one call, documents are downloaded and
+    extracted concurrently, the chunks of every changed document are encoded in
+    one call and written with one upsert off the event loop. A document that fails to download or
+    extract is logged and left out of the batch.
+
+    Args:
+        items: (url, doc_id) pairs; for repeated doc_ids only the last one is kept
+        source: Value of the "source" metadata field
+        errors: If given, receives the exception of each document that failed, by doc_id
+
+    Returns:
+        The prepared documents; unchanged ones have ``unchanged`` set and were not written
+    """
+    loop = asyncio.get_running_loop()
+    latest = {doc_id: url for url, doc_id in items}
+    fingerprints = await loop.run_in_executor(None, get_stored_fingerprints, list(latest))
+
+    results = await asyncio.gather(
+        *(
+            prepare_document(url, doc_id, encode=False, stored=fingerprints.get(doc_id, {}))
+            for doc_id, url in latest.items()
+        ),
+        return_exceptions=True
+    )
+
+    documents = []
+    for doc_id, result in zip(latest, results):
+        if isinstance(result, BaseException):
+            logger.error(f"[-] Error preparing {doc_id} for embedding: {result}")
+            if errors is not None:
+                errors[doc_id] = result
+        else:
+            documents.append(result)
+
+    await encode_documents(documents)
+    await loop.run_in_executor(None, store_documents, documents, source)
+    return documents
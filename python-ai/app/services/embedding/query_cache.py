@@ -0,0 +1,143 @@
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class QueryCacheStats:
+    """Counters reported by the query embedding cache"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": self.size,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings with an optional TTL.
+
+    Keys are the model name plus the normalized query text, so the same question
+    typed with different spacing or casing reuses one embedding.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_size: int = 1024,
+        ttl_seconds: Optional[float] = None,
+        lowercase: bool = True
+    ):
+        """
+        Initialize query embedding cache
+
+        Args:
+            model_name: Name of the embedding model, part of every key
+            max_size: Maximum number of cached embeddings
+            ttl_seconds: Time after which an entry expires (None keeps entries until evicted)
+            lowercase: Lowercase queries when normalizing; only safe for uncased models
+                such as all-MiniLM-L6-v2
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.lowercase = lowercase
+
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = QueryCacheStats()
+
+    def normalize(self, query: str) -> str:
+        """Normalize unicode, whitespace and (optionally) case of a query"""
+        normalized = " ".join(unicodedata.normalize("NFKC", query).split())
+        return normalized.lower() if self.lowercase else normalized
+
+    def _key(self, query: str) -> Tuple[str, str]:
+        return self.model_name, self.normalize(query)
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        """
+        Look up the embedding of a query
+
+        Args:
+            query: Query text
+
+        Returns:
+            Cached embedding, or None on a miss
+        """
+        key = self._key(query)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and now - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                self._stats.expirations += 1
+                entry = None
+
+            if entry is None:
+                self._stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return entry[0]
+
+    def put(self, query: str, embedding: np.ndarray) -> None:
+        """
+        Store the embedding of a query, evicting the least recently used entry if full
+
+        Args:
+            query: Query text
+            embedding: Embedding of the query
+        """
+        embedding = np.array(embedding, copy=True)
+        embedding.setflags(write=False)  # Shared between callers, so never mutated
+        key = self._key(query)
+
+        with self._lock:
+            self._entries[key] = (embedding, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every cached embedding"""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self) -> QueryCacheStats:
+        """Snapshot of the cache counters"""
+        with self._lock:
+            return QueryCacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                expirations=self._stats.expirations,
+                size=len(self._entries)
+            )
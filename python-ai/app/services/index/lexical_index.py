@@ -0,0 +1,253 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and identifiers such as "INV-2024-0042", "A12.7/B" or "part_no"
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+_SEPARATORS = re.compile(r"[-./_]")
+# Terms that look like identifiers: they contain a digit or a separator
+_IDENTIFIER = re.compile(r"\d|[-./_]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase terms for lexical matching
+
+    Compound identifiers are kept whole and also indexed by their parts, so
+    "INV-2024-0042" matches both the exact identifier and "0042".
+    """
+    terms = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        terms.append(token)
+        parts = [part for part in _SEPARATORS.split(token) if part]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """
+    Incremental in-memory BM25 inverted index over chunk texts.
+
+    Chunks are added, replaced and removed individually, so the index is kept up
+    to date by the ingestion pipeline alongside the vector store. When a path is
+    given, changes are appended to a JSON-lines log that is replayed on open and
+    rewritten by ``compact()`` once it holds mostly superseded entries.
+    """
+
+    LOG_FILE = "postings.jsonl"
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+        """
+        Initialize BM25 index
+
+        Args:
+            path: Directory to persist the index in (memory only if None)
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._terms: Dict[str, Dict[str, int]] = {}  # chunk id -> term frequencies
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._log = None
+        self._log_records = 0
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+            self._log = open(os.path.join(path, self.LOG_FILE), "a", encoding="utf-8")
+            if self._log_records > 2 * len(self._lengths) + 1000:
+                self.compact()
+
+    # ---- persistence -------------------------------------------------------
+
+    def _load(self) -> None:
+        log_path = os.path.join(self.path, self.LOG_FILE)
+        if not os.path.exists(log_path):
+            return
+
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self._log_records += 1
+                if record["op"] == "put":
+                    self._put(record["id"], record["terms"])
+                elif record["op"] == "del":
+                    self._remove(record["id"])
+
+        logger.info(f"Loaded lexical index from {self.path}: {len(self._lengths)} chunks, {len(self._postings)} terms")
+
+    def _append_log(self, records: List[dict]) -> None:
+        if self._log is None or not records:
+            return
+        self._log.write("".join(json.dumps(record) + "\n" for record in records))
+        self._log.flush()
+        self._log_records += len(records)
+
+    def compact(self) -> None:
+        """Rewrite the log with one entry per live chunk"""
+        if not self.path:
+            return
+        with self._lock:
+            log_path = os.path.join(self.path, self.LOG_FILE)
+            tmp_path = log_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for chunk_id, terms in self._terms.items():
+                    f.write(json.dumps({"op": "put", "id": chunk_id, "terms": terms}) + "\n")
+            if self._log is not None:
+                self._log.close()
+            os.replace(tmp_path, log_path)
+            self._log = open(log_path, "a", encoding="utf-8")
+            self._log_records = len(self._terms)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+
+    def close(self) -> None:
+        """Flush and close the log"""
+        with self._lock:
+            if self._log is not None:
+                self.flush()
+                self._log.close()
+                self._log = None
+
+    # ---- postings ------------------------------------------------------------
+
+    def _put(self, chunk_id: str, terms: Dict[str, int]) -> None:
+        self._remove(chunk_id)
+        self._terms[chunk_id] = terms
+        length = sum(terms.values())
+        self._lengths[chunk_id] = length
+        self._total_length += length
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[chunk_id] = frequency
+
+    def _remove(self, chunk_id: str) -> bool:
+        terms = self._terms.pop(chunk_id, None)
+        if terms is None:
+            return False
+        self._total_length -= self._lengths.pop(chunk_id)
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self._postings[term]
+        return True
+
+    def upsert(self, ids: List[str], documents: List[str]) -> None:
+        """Index chunk texts, replacing chunks with the same id"""
+        with self._lock:
+            records = []
+            for chunk_id, text in zip(ids, documents):
+                terms = dict(Counter(tokenize(text or "")))
+                self._put(chunk_id, terms)
+                records.append({"op": "put", "id": chunk_id, "terms": terms})
+            self._append_log(records)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        """Remove chunks from the index"""
+        with self._lock:
+            removed = [chunk_id for chunk_id in ids if self._remove(chunk_id)]
+            self._append_log([{"op": "del", "id": chunk_id} for chunk_id in removed])
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._lengths)
+
+    def ids(self) -> List[str]:
+        """Ids of all indexed chunks"""
+        with self._lock:
+            return list(self._lengths)
+
+    def search(self, query: str, n_results: int = 10) -> List[Tuple[str, float]]:
+        """
+        Rank chunks by BM25 score against a query
+
+        Args:
+            query: Query text
+            n_results: Maximum number of hits
+
+        Returns:
+            (chunk id, score) pairs, best first; only chunks containing a query term
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_chunks = len(self._lengths)
+            if not terms or not n_chunks:
+                return []
+            average_length = self._total_length / n_chunks
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_chunks - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, frequency in posting.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+    def identifier_matches(self, query: str, max_document_fraction: float = 0.01) -> Set[str]:
+        """
+        Chunks containing a rare identifier-like term of the query
+
+        Only terms with a digit or a separator (order numbers, part numbers,
+        versions) that occur in at most ``max_document_fraction`` of the chunks
+        (and at least in one) count, so common words and stopwords never match.
+
+        Args:
+            query: Query text
+            max_document_fraction: Highest share of chunks a term may occur in
+
+        Returns:
+            Ids of the matching chunks
+        """
+        terms = {term for term in tokenize(query) if _IDENTIFIER.search(term)}
+        with self._lock:
+            max_chunks = max(1, int(len(self._lengths) * max_document_fraction))
+            matches: Set[str] = set()
+            for term in terms:
+                posting = self._postings.get(term)
+                if posting and len(posting) <= max_chunks:
+                    matches.update(posting)
+        return matches
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several rankings of ids with reciprocal-rank fusion
+
+    Args:
+        rankings: Lists of ids, each best first
+        k: Damping constant; larger values flatten the contribution of top ranks
+
+    Returns:
+        (id, fused score) pairs, best first
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
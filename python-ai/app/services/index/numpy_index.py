@@ -0,0 +1,525 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .vector_index import GetResult, QueryResult, VectorIndex, Where
+
+logger = logging.getLogger(__name__)
+
+# Storage formats of the scanned matrix and their element types
+STORAGE_FORMATS = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+# Rows converted to float32 at a time when scanning a compact matrix
+SCAN_BLOCK_ROWS = 4096
+
+
+
+def matches_where(metadata: Optional[Dict[str, Any]], where: Where) -> bool:
+    """Evaluate the subset of Chroma's where syntax we use: equality, $eq, $in and $and"""
+    if not where:
+        return True
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            if "$eq" in condition and metadata.get(key) != condition["$eq"]:
+                return False
+            if "$in" in condition and metadata.get(key) not in condition["$in"]:
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def quantize_int8(vectors: np.ndarray):
+    """
+    Scalar-quantize vectors to int8 with one scale per vector
+
+    Returns:
+        (codes, scales) with ``vectors ~= codes * scales[:, None]``
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class NumpyIndex(VectorIndex):
+    """
+    In-process vector index on a memory-mapped matrix.
+
+    Embeddings are L2-normalized and kept in one contiguous matrix, so top-k is a
+    single matrix-vector product plus ``argpartition``. Writes append rows (or
+    overwrite the row of an existing id); deletes only set a tombstone. Records
+    are persisted as an append-only JSON-lines log next to the matrix and replayed
+    on open; ``compact()`` drops tombstoned rows from both.
+
+    With ``storage="float16"`` or ``"int8"`` (per-vector scale) the scanned matrix,
+    and so the resident memory of the vectors, is 2x or 4x smaller than float32.
+    Disk use grows instead: the full-precision vectors are written to a second
+    file as well, which is only read back with positioned reads for the
+    ``n_results * rerank_factor`` best candidates, so they can be re-scored exactly.
+
+    The memory is paid for with scan time. NumPy has no fast float16 or int8
+    matrix product, so each block is converted to float32 before it is
+    multiplied: an int8 scan is about 2.5x and a float16 scan about 15x slower
+    than a float32 one. float16 is therefore only worth it where memory matters
+    far more than latency; int8 is the smaller and faster compact format.
+    ``scan_cache_bytes`` keeps that many bytes of converted blocks for later
+    queries, buying back scan speed with exactly the memory compact storage saves;
+    it is off by default.
+    """
+
+    name = "numpy"
+
+    VECTORS_FILE = "vectors.f32"
+    SCALES_FILE = "scales.f32"
+    RECORDS_FILE = "records.jsonl"
+    META_FILE = "meta.json"
+
+    def __init__(
+        self,
+        path: str,
+        dimension: Optional[int] = None,
+        space: str = "l2",
+        initial_capacity: int = 1024,
+        storage: str = "float32",
+        rerank_factor: int = 4,
+        scan_cache_bytes: int = 0
+    ):
+        """
+        Initialize NumPy index
+
+        Args:
+            path: Directory holding the index files (created if missing)
+            dimension: Embedding dimension (taken from the first write if None)
+            space: Distance reported by query(): "l2" (squared L2, ChromaDB's default)
+                or "cosine" (1 - cosine similarity)
+            initial_capacity: Number of rows allocated up front; grows by doubling
+            storage: Format of the scanned matrix: "float32", "float16" or "int8".
+                An existing index keeps the format it was created with.
+            rerank_factor: Candidates re-scored at full precision per requested result
+                (compact storage only)
+            scan_cache_bytes: Memory for float32 copies of scan blocks (compact storage
+                only; each cached block costs more than its compact form saves)
+        """
+        if space not in ("l2", "cosine"):
+            raise ValueError("space must be 'l2' or 'cosine'")
+        if storage not in STORAGE_FORMATS:
+            raise ValueError(f"storage must be one of {', '.join(STORAGE_FORMATS)}")
+
+        self.path = path
+        self.space = space
+        self.storage = storage
+        self.rerank_factor = max(1, rerank_factor)
+        self.scan_cache_bytes = max(0, scan_cache_bytes)
+        self.initial_capacity = max(1, initial_capacity)
+
+        self._lock = threading.RLock()
+        self._dim: Optional[int] = dimension
+        self._capacity = 0
+        self._size = 0  # Rows in use, including tombstoned ones
+        self._vectors: Optional[np.memmap] = None  # Scanned matrix, in the storage format
+        self._scales: Optional[np.memmap] = None  # Per-row scales of int8 storage
+        self._full_fd: Optional[int] = None  # Full-precision vectors of compact storage
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._documents: List[Optional[str]] = []
+        self._metadatas: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {}
+        self._scan_cache: Dict[int, np.ndarray] = {}  # Block start row -> float32 copy of the block
+
+        os.makedirs(path, exist_ok=True)
+        self._load()
+        self._log = open(os.path.join(path, self.RECORDS_FILE), "a", encoding="utf-8")
+
+    @property
+    def compact_storage(self) -> bool:
+        """Whether the scanned matrix is quantized and candidates are re-ranked"""
+        return self.storage != "float32"
+
+    @property
+    def vector_bytes(self) -> int:
+        """Resident bytes per vector in the scanned matrix (plus its scale for int8), without the scan cache"""
+        size = self._dim * np.dtype(STORAGE_FORMATS[self.storage]).itemsize if self._dim else 0
+        return size + (4 if self.storage == "int8" else 0)
+
+    # ---- persistence -------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _matrix_file(self) -> str:
+        return self._file(self.VECTORS_FILE if self.storage == "float32" else f"vectors.{self.storage}")
+
+    def _load(self) -> None:
+        meta_path = self._file(self.META_FILE)
+        if not os.path.exists(meta_path):
+            return
+
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        stored_storage = meta.get("storage", "float32")
+        if stored_storage != self.storage:
+            logger.warning(f"Index at {self.path} uses {stored_storage} storage, ignoring requested {self.storage}")
+            self.storage = stored_storage
+        self._dim = meta["dimension"]
+        self._open_vectors(meta["capacity"])
+
+        records_path = self._file(self.RECORDS_FILE)
+        if os.path.exists(records_path):
+            with open(records_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._replay(json.loads(line))
+
+        logger.info(f"Loaded NumPy index from {self.path}: {self.count()} records, {self._size} rows")
+
+    def _replay(self, record: Dict[str, Any]) -> None:
+        op = record["op"]
+        if op == "put":
+            self._set_row(record["row"], record["id"], record["document"], record["metadata"])
+        elif op == "meta":
+            row = self._rows.get(record["id"])
+            if row is not None:
+                self._metadatas[row] = record["metadata"]
+        elif op == "del":
+            self._tombstone(record["id"])
+
+    def _write_meta(self) -> None:
+        tmp_path = self._file(self.META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "dimension": self._dim,
+                "capacity": self._capacity,
+                "space": self.space,
+                "storage": self.storage,
+            }, f)
+        os.replace(tmp_path, self._file(self.META_FILE))
+
+    @staticmethod
+    def _map(path: str, dtype, shape) -> np.memmap:
+        with open(path, "ab") as f:
+            f.truncate(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _unmap(self) -> None:
+        self._scan_cache.clear()
+        for name in ("_vectors", "_scales"):
+            array = getattr(self, name)
+            if array is not None:
+                array.flush()
+                setattr(self, name, None)
+                del array
+
+    def _open_vectors(self, capacity: int) -> None:
+        """(Re)map the index files with room for ``capacity`` rows"""
+        self._unmap()
+
+        self._vectors = self._map(self._matrix_file(), STORAGE_FORMATS[self.storage], (capacity, self._dim))
+        if self.storage == "int8":
+            self._scales = self._map(self._file(self.SCALES_FILE), np.float32, (capacity,))
+        if self.compact_storage and self._full_fd is None:
+            # Written and read with positioned I/O so it never becomes resident as a whole
+            self._full_fd = os.open(self._file(self.VECTORS_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        self._capacity = capacity
+
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive[:capacity]
+        self._alive = alive
+
+    def _reserve(self, rows: int) -> None:
+        if self._vectors is None:
+            self._open_vectors(max(self.initial_capacity, rows))
+            self._write_meta()
+        elif self._size + rows > self._capacity:
+            capacity = self._capacity
+            while self._size + rows > capacity:
+                capacity *= 2
+            self._open_vectors(capacity)
+            self._write_meta()
+
+    def _append_log(self, records: List[Dict[str, Any]]) -> None:
+        self._log.write("".join(json.dumps(record) + "\n" for record in records))
+        self._log.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            for array in (self._vectors, self._scales):
+                if array is not None:
+                    array.flush()
+            if self._full_fd is not None:
+                os.fsync(self._full_fd)
+            self._log.flush()
+            os.fsync(self._log.fileno())
+
+    def close(self) -> None:
+        """Flush and close the index files"""
+        with self._lock:
+            self.flush()
+            self._log.close()
+            self._unmap()
+            if self._full_fd is not None:
+                os.close(self._full_fd)
+                self._full_fd = None
+
+    def compact(self) -> None:
+        """Rewrite the index files and the log without tombstoned rows"""
+        with self._lock:
+            if self._vectors is None:
+                return
+            live_rows = np.flatnonzero(self._alive[:self._size])
+            vectors = self._read_full(live_rows)
+            ids = [self._ids[row] for row in live_rows]
+            documents = [self._documents[row] for row in live_rows]
+            metadatas = [self._metadatas[row] for row in live_rows]
+
+            self._log.close()
+            self._unmap()
+            if self._full_fd is not None:
+                os.close(self._full_fd)
+                self._full_fd = None
+            for name in (self.VECTORS_FILE, self.SCALES_FILE, self.RECORDS_FILE, os.path.basename(self._matrix_file())):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+
+            self._size = 0
+            self._alive = np.zeros(0, dtype=bool)
+            self._ids, self._documents, self._metadatas, self._rows = [], [], [], {}
+            self._open_vectors(max(self.initial_capacity, len(ids)))
+            self._write_meta()
+            self._log = open(self._file(self.RECORDS_FILE), "a", encoding="utf-8")
+            if ids:
+                self._write_rows(ids, vectors, documents, metadatas)
+            self.flush()
+            logger.info(f"Compacted NumPy index to {len(ids)} rows")
+
+    # ---- row bookkeeping -----------------------------------------------------
+
+    def _set_row(self, row: int, record_id: str, document: Optional[str], metadata: Optional[Dict[str, Any]]) -> None:
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._documents.append(None)
+            self._metadatas.append(None)
+        self._ids[row] = record_id
+        self._documents[row] = document
+        self._metadatas[row] = metadata
+        self._rows[record_id] = row
+        self._alive[row] = True
+        self._size = max(self._size, row + 1)
+
+    def _tombstone(self, record_id: str) -> bool:
+        row = self._rows.pop(record_id, None)
+        if row is None:
+            return False
+        self._alive[row] = False
+        self._documents[row] = None
+        self._metadatas[row] = None
+        return True
+
+    def _store_vector(self, row: int, vector: np.ndarray) -> None:
+        """Write one normalized vector into the scanned matrix (and the full-precision file)"""
+        if self.storage == "float32":
+            self._vectors[row] = vector
+            return
+        self._scan_cache.pop(row - row % SCAN_BLOCK_ROWS, None)
+        if self.storage == "int8":
+            codes, scales = quantize_int8(vector[None, :])
+            self._vectors[row] = codes[0]
+            self._scales[row] = scales[0]
+        else:
+            self._vectors[row] = vector.astype(np.float16)
+        os.pwrite(self._full_fd, vector.astype(np.float32).tobytes(), row * self._dim * 4)
+
+    def _read_full(self, rows) -> np.ndarray:
+        """Full-precision vectors of the given rows"""
+        if not self.compact_storage:
+            return np.array(self._vectors[rows], dtype=np.float32)
+        row_bytes = self._dim * 4
+        out = np.empty((len(rows), self._dim), dtype=np.float32)
+        for i, row in enumerate(rows):
+            out[i] = np.frombuffer(os.pread(self._full_fd, row_bytes, int(row) * row_bytes), dtype=np.float32)
+        return out
+
+    def _write_rows(self, ids, vectors: np.ndarray, documents, metadatas) -> None:
+        """Write normalized vectors and records; overwrites rows of existing ids in place"""
+        log = []
+        for i, record_id in enumerate(ids):
+            row = self._rows.get(record_id)
+            if row is None:
+                row = self._size
+                self._size += 1
+            self._store_vector(row, vectors[i])
+            self._set_row(row, record_id, documents[i], metadatas[i])
+            log.append({"op": "put", "row": row, "id": record_id, "document": documents[i], "metadata": metadatas[i]})
+        self._append_log(log)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # ---- VectorIndex ---------------------------------------------------------
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("embeddings must be a 2-D array with one row per id")
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._dim}")
+
+            new_rows = sum(1 for record_id in set(ids) if record_id not in self._rows)
+            self._reserve(new_rows)
+            self._write_rows(ids, self._normalize(vectors), documents, metadatas)
+            self._vectors.flush()
+
+    def add(self, ids, embeddings, documents, metadatas) -> None:
+        """Alias of upsert, for drop-in compatibility with a Chroma collection"""
+        self.upsert(ids, embeddings, documents, metadatas)
+
+    def update(self, ids, metadatas) -> None:
+        with self._lock:
+            log = []
+            for record_id, metadata in zip(ids, metadatas):
+                row = self._rows.get(record_id)
+                if row is None:
+                    continue
+                self._metadatas[row] = metadata
+                log.append({"op": "meta", "id": record_id, "metadata": metadata})
+            self._append_log(log)
+
+    def delete(self, ids=None, where=None) -> None:
+        with self._lock:
+            if ids is None:
+                ids = self._matching_ids(where)
+            elif where:
+                matching = set(self._matching_ids(where))
+                ids = [record_id for record_id in ids if record_id in matching]
+            deleted = [record_id for record_id in ids if self._tombstone(record_id)]
+            self._append_log([{"op": "del", "id": record_id} for record_id in deleted])
+
+    def _matching_ids(self, where: Where) -> List[str]:
+        return [
+            record_id for record_id, row in self._rows.items()
+            if matches_where(self._metadatas[row], where)
+        ]
+
+    def _matching_mask(self, where: Where) -> np.ndarray:
+        """Boolean mask over rows of live records matching the filter"""
+        mask = self._alive[:self._size].copy()
+        if where:
+            for row in np.flatnonzero(mask):
+                if not matches_where(self._metadatas[row], where):
+                    mask[row] = False
+        return mask
+
+    def get(self, ids=None, where=None, include=None, limit=None) -> GetResult:
+        include = include or ["documents", "metadatas"]
+        with self._lock:
+            if ids is not None:
+                rows = [self._rows[record_id] for record_id in ids if record_id in self._rows]
+                if where:
+                    rows = [row for row in rows if matches_where(self._metadatas[row], where)]
+            else:
+                rows = list(np.flatnonzero(self._matching_mask(where)))
+            if limit is not None:
+                rows = rows[:limit]
+
+            result: GetResult = {"ids": [self._ids[row] for row in rows]}
+            result["documents"] = [self._documents[row] for row in rows] if "documents" in include else None
+            result["metadatas"] = [self._metadatas[row] for row in rows] if "metadatas" in include else None
+            result["embeddings"] = list(self._read_full(rows)) if "embeddings" in include else None
+            return result
+
+    def _scan(self, queries: np.ndarray) -> np.ndarray:
+        """(rows, queries) similarities over the live prefix of the scanned matrix"""
+        if not self.compact_storage:
+            return self._vectors[:self._size] @ queries.T
+
+        # Convert the compact matrix block by block to bound the float32 working set,
+        # keeping converted blocks while they fit in the scan cache
+        similarities = np.empty((self._size, len(queries)), dtype=np.float32)
+        block_bytes = SCAN_BLOCK_ROWS * self._dim * 4
+        for start in range(0, self._size, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, self._size)
+            block = self._scan_cache.get(start)
+            if block is None or len(block) != stop - start:
+                block = self._vectors[start:stop].astype(np.float32)
+                if (len(self._scan_cache) + 1) * block_bytes <= self.scan_cache_bytes or start in self._scan_cache:
+                    self._scan_cache[start] = block
+            similarities[start:stop] = block @ queries.T
+        if self.storage == "int8":
+            similarities *= self._scales[:self._size, None]
+        return similarities
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first"""
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k < len(scores):
+            top = np.argpartition(-scores, k - 1)[:k]
+            return top[np.argsort(-scores[top])]
+        return np.argsort(-scores)[:k]
+
+    def query(self, query_embeddings, n_results=10, include=None, where=None) -> QueryResult:
+        include = include or ["documents", "metadatas", "distances"]
+        queries = self._normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        result: QueryResult = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        with self._lock:
+            if self._vectors is None or self._size == 0:
+                for _ in queries:
+                    for key in result:
+                        result[key].append([])
+                return result
+
+            mask = self._matching_mask(where)
+            # (rows, queries) similarities in one matrix product over the live prefix
+            similarities = self._scan(queries)
+            similarities[~mask] = -np.inf
+            live = int(mask.sum())
+            k = min(n_results, live)
+
+            for q in range(len(queries)):
+                column = similarities[:, q]
+                if self.compact_storage and k:
+                    # Re-score the best approximate candidates at full precision
+                    candidates = self._top(column, min(k * self.rerank_factor, live))
+                    exact = self._read_full(candidates) @ queries[q]
+                    order = self._top(exact, k)
+                    top, scores = candidates[order], exact[order]
+                else:
+                    top = self._top(column, k)
+                    scores = column[top]
+
+                distances = 1.0 - scores if self.space == "cosine" else 2.0 - 2.0 * scores
+                result["ids"].append([self._ids[row] for row in top])
+                result["documents"].append([self._documents[row] for row in top] if "documents" in include else None)
+                result["metadatas"].append([self._metadatas[row] for row in top] if "metadatas" in include else None)
+                result["distances"].append([float(d) for d in distances])
+
+        return result
+
+    def distances(self, query_embedding, embeddings) -> np.ndarray:
+        query = self._normalize(np.atleast_2d(np.asarray(query_embedding, dtype=np.float32)))[0]
+        scores = self._normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32))) @ query
+        return 1.0 - scores if self.space == "cosine" else 2.0 - 2.0 * scores
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._rows)
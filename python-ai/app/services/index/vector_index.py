@@ -0,0 +1,137 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Results follow ChromaDB's shapes so backends are interchangeable:
+#   get()   -> {"ids": [...], "documents": [...], "metadatas": [...], "embeddings": [...]}
+#   query() -> {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}
+# with one inner list per query embedding. Distances use the backend's distance space.
+GetResult = Dict[str, Any]
+QueryResult = Dict[str, Any]
+Where = Optional[Dict[str, Any]]
+
+
+class VectorIndex(ABC):
+    """Interface of the vector stores DocumentRetriever and the ingestion pipeline run on"""
+
+    name: str = "abstract"
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """Insert records, overwriting records with the same id"""
+
+    @abstractmethod
+    def update(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Replace the metadata of existing records"""
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, where: Where = None) -> None:
+        """Delete records by id or metadata filter"""
+
+    @abstractmethod
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Where = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None
+    ) -> GetResult:
+        """Fetch records by id or metadata filter"""
+
+    @abstractmethod
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        include: Optional[List[str]] = None,
+        where: Where = None
+    ) -> QueryResult:
+        """Return the n_results nearest records for each query embedding"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of live records"""
+
+    def flush(self) -> None:
+        """Persist pending writes (no-op for backends that persist on every write)"""
+
+    def distances(self, query_embedding, embeddings) -> np.ndarray:
+        """
+        Distances of embeddings to a query embedding, in the space query() reports
+
+        Lets callers score records fetched by id on the same scale as query hits.
+        The default is squared L2, ChromaDB's default space.
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        vectors = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        return np.sum((vectors - query) ** 2, axis=1)
+
+
+class ChromaIndex(VectorIndex):
+    """VectorIndex backed by a ChromaDB collection"""
+
+    name = "chroma"
+
+    def __init__(self, collection):
+        """
+        Initialize Chroma index
+
+        Args:
+            collection: ChromaDB collection
+        """
+        self.collection = collection
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update(self, ids, metadatas) -> None:
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None) -> None:
+        self.collection.delete(ids=ids, where=where)
+
+    def get(self, ids=None, where=None, include=None, limit=None) -> GetResult:
+        return self.collection.get(
+            ids=ids,
+            where=where,
+            include=include or ["documents", "metadatas"],
+            limit=limit
+        )
+
+    def query(self, query_embeddings, n_results=10, include=None, where=None) -> QueryResult:
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=include or ["documents", "metadatas", "distances"],
+            where=where
+        )
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def distances(self, query_embedding, embeddings) -> np.ndarray:
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "l2":
+            return super().distances(query_embedding, embeddings)
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        vectors = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+            return 1.0 - (vectors @ query) / np.maximum(norms, 1e-12)
+        return 1.0 - vectors @ query  # "ip"
+
+
+def as_vector_index(store) -> VectorIndex:
+    """Wrap a raw ChromaDB collection in a ChromaIndex; pass VectorIndex instances through"""
+    return store if isinstance(store, VectorIndex) else ChromaIndex(store)
@@ -0,0 +1,455 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from kafka import ConsumerRebalanceListener, KafkaConsumer
+from kafka.structs import OffsetAndMetadata, TopicPartition
+
+logger = logging.getLogger(__name__)
+
+# Callback running one consumer record to completion on the event loop
+RecordProcessor = Callable[[Any], Awaitable[None]]
+
+# Callback running a batch of consumer records (all from one topic) to completion
+BatchProcessor = Callable[[List[Any]], Awaitable[None]]
+
+
+def _offset_and_metadata(offset: int) -> OffsetAndMetadata:
+    """Build an OffsetAndMetadata across kafka-python versions (leader_epoch was added in 2.1)"""
+    if len(OffsetAndMetadata._fields) == 3:
+        return OffsetAndMetadata(offset, None, -1)
+    return OffsetAndMetadata(offset, None)
+
+
+class OffsetTracker:
+    """
+    Tracks in-flight offsets per partition and computes what is safe to commit.
+
+    Records complete out of order when they run concurrently, so the committable
+    offset of a partition is the lowest offset still in flight or failed, or one
+    past the highest completed offset when there is none. Failed offsets hold the
+    partition's commits back until it is rewound to redeliver them.
+    """
+
+    def __init__(self):
+        self._pending: Dict[TopicPartition, Set[int]] = {}
+        self._failed: Dict[TopicPartition, Set[int]] = {}
+        self._next: Dict[TopicPartition, int] = {}
+        self._committed: Dict[TopicPartition, int] = {}
+        self._lock = threading.Lock()
+
+    def start(self, tp: TopicPartition, offset: int) -> None:
+        """Record that an offset has been dispatched"""
+        with self._lock:
+            self._pending.setdefault(tp, set()).add(offset)
+            self._next[tp] = max(self._next.get(tp, 0), offset + 1)
+
+    def complete(self, tp: TopicPartition, offset: int) -> None:
+        """Record that an offset has finished processing"""
+        with self._lock:
+            self._pending.get(tp, set()).discard(offset)
+
+    def fail(self, tp: TopicPartition, offset: int) -> None:
+        """Record that an offset failed; nothing from it on is committed until the partition is rewound"""
+        with self._lock:
+            self._pending.get(tp, set()).discard(offset)
+            self._failed.setdefault(tp, set()).add(offset)
+
+    def failed_partitions(self) -> List[TopicPartition]:
+        """Partitions with failed offsets waiting to be redelivered"""
+        with self._lock:
+            return [tp for tp, offsets in self._failed.items() if offsets]
+
+    def rewind(self, tp: TopicPartition) -> int:
+        """
+        Forget a partition's offsets from its lowest failed one on
+
+        Returns:
+            The lowest failed offset, where the partition must be redelivered from
+        """
+        with self._lock:
+            offset = min(self._failed.pop(tp))
+            self._pending[tp] = {pending for pending in self._pending.get(tp, set()) if pending < offset}
+            self._next[tp] = offset
+            return offset
+
+    def in_flight(self, partitions=None) -> int:
+        """Number of dispatched offsets that have not completed, optionally only of some partitions"""
+        with self._lock:
+            if partitions is None:
+                return sum(len(offsets) for offsets in self._pending.values())
+            return sum(len(self._pending.get(tp, ())) for tp in partitions)
+
+    def committable(self) -> Dict[TopicPartition, OffsetAndMetadata]:
+        """Offsets that advanced since the last call to mark_committed"""
+        with self._lock:
+            offsets = {}
+            for tp, next_offset in self._next.items():
+                blocked = self._pending.get(tp, set()) | self._failed.get(tp, set())
+                offset = min(blocked) if blocked else next_offset
+                if offset > self._committed.get(tp, -1):
+                    offsets[tp] = _offset_and_metadata(offset)
+            return offsets
+
+    def committed_offset(self, tp: TopicPartition) -> Optional[int]:
+        """Last offset committed for a partition, or None before the first commit"""
+        with self._lock:
+            return self._committed.get(tp)
+
+    def mark_committed(self, offsets: Dict[TopicPartition, OffsetAndMetadata]) -> None:
+        """Remember offsets that were successfully committed"""
+        with self._lock:
+            for tp, offset in offsets.items():
+                self._committed[tp] = offset.offset
+
+    def forget(self, partitions) -> None:
+        """Drop state for partitions that are no longer assigned"""
+        with self._lock:
+            for tp in partitions:
+                self._pending.pop(tp, None)
+                self._failed.pop(tp, None)
+                self._next.pop(tp, None)
+                self._committed.pop(tp, None)
+
+
+class EngineRebalanceListener(ConsumerRebalanceListener):
+    """
+    Forwards partition assignment changes of the consumer group to a consumer engine
+
+    The consumer is subscribed before its engine exists, so the engine is bound
+    afterwards; rebalances only happen inside poll(), once the engine runs.
+    """
+
+    def __init__(self, engine: Optional["KafkaConsumerEngine"] = None):
+        self.engine = engine
+
+    def on_partitions_revoked(self, revoked) -> None:
+        if self.engine is not None:
+            self.engine.on_partitions_revoked(revoked)
+
+    def on_partitions_assigned(self, assigned) -> None:
+        if self.engine is not None:
+            self.engine.on_partitions_assigned(assigned)
+
+
+class KafkaConsumerEngine:
+    """
+    Runs a KafkaConsumer with bounded concurrent processing and manual commits.
+
+    The poll loop runs in the calling thread and dispatches every record to an
+    asyncio event loop, with at most ``max_in_flight`` records processing at once.
+    Records with the same key are processed in order; records with different keys
+    run in parallel. In batch mode each poll's records are handed over per topic
+    as one batch, and batches sharing a key are likewise chained. Offsets are committed from the poll thread (KafkaConsumer is
+    not thread-safe) and only up to the lowest record that has not completed.
+
+    Topics in ``record_delays`` are delayed: a record is only processed once
+    that many seconds have passed since its timestamp. The partition is paused
+    at the first record that is not due yet and resumed when it is, so waiting
+    records take no processing slot and are not committed.
+
+    A record whose processing fails is never committed: once nothing else of
+    its partition is in flight, the partition is sought back to the first
+    failed record and resumed after ``redelivery_delay`` seconds, so the
+    record and the ones after it are processed again.
+
+    Subscribe the consumer with an EngineRebalanceListener bound to the engine so
+    that, when the group rebalances, records of revoked partitions finish and are
+    committed before another member takes the partitions over.
+    """
+
+    def __init__(
+        self,
+        consumer: KafkaConsumer,
+        process_record: Optional[RecordProcessor] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        max_in_flight: int = 16,
+        process_batch: Optional[BatchProcessor] = None,
+        max_batch_records: int = 32,
+        poll_timeout_ms: int = 500,
+        commit_interval: float = 1.0,
+        drain_timeout: float = 30.0,
+        record_delays: Optional[Dict[str, float]] = None,
+        redelivery_delay: float = 5.0
+    ):
+        """
+        Initialize consumer engine
+
+        Args:
+            consumer: Subscribed consumer with enable_auto_commit disabled
+            process_record: Coroutine function processing one ConsumerRecord
+            loop: Event loop to process records on (a private loop thread is started if None)
+            max_in_flight: Maximum number of records processing at the same time
+            process_batch: Coroutine function processing a list of ConsumerRecords; when set,
+                the engine polls up to max_batch_records at once and dispatches them as batches
+            max_batch_records: Maximum number of records per batch
+            poll_timeout_ms: Poll timeout, which bounds how quickly stop() is noticed
+            commit_interval: Minimum seconds between two commits
+            drain_timeout: Seconds to wait for in-flight records on shutdown
+            record_delays: Seconds after their timestamp before records are processed, per topic
+            redelivery_delay: Seconds before the records of a partition are redelivered after a failure
+        """
+        if max_in_flight <= 0:
+            raise ValueError("max_in_flight must be positive")
+        if (process_record is None) == (process_batch is None):
+            raise ValueError("Exactly one of process_record and process_batch is required")
+
+        self.consumer = consumer
+        self.process_record = process_record
+        self.process_batch = process_batch
+        self.max_batch_records = max(1, min(max_batch_records, max_in_flight))
+        self.max_in_flight = max_in_flight
+        self.poll_timeout_ms = poll_timeout_ms
+        self.commit_interval = commit_interval
+        self.drain_timeout = drain_timeout
+        self.record_delays = dict(record_delays or {})
+        self.redelivery_delay = redelivery_delay
+
+        self._loop = loop
+        self._own_loop_thread: Optional[threading.Thread] = None
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._offsets = OffsetTracker()
+        self._key_tails: Dict[Any, Future] = {}
+        self._key_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._last_commit = 0.0
+        # Partitions paused until their first record is due (or is redelivered), with the due time
+        self._paused: Dict[TopicPartition, float] = {}
+        self.topics: List[str] = []
+        # Messages behind the partition end per assigned partition, refreshed from the poll thread
+        self.lag: Dict[TopicPartition, int] = {}
+
+    def stop(self) -> None:
+        """Ask the poll loop to stop; run() drains in-flight records and returns"""
+        self._stopping.set()
+
+    def on_partitions_revoked(self, revoked) -> None:
+        """
+        Finish and commit the records of partitions taken away by a rebalance
+
+        Called from the poll thread inside consumer.poll(), so committing here is safe.
+        """
+        revoked = list(revoked)
+        if not revoked:
+            return
+        deadline = time.monotonic() + self.drain_timeout
+        while self._offsets.in_flight(revoked) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self._offsets.in_flight(revoked):
+            logger.warning(
+                f"{self._offsets.in_flight(revoked)} records of revoked partitions still in flight; "
+                f"they may be processed again by the new owner"
+            )
+        self._commit(force=True)
+        self._offsets.forget(revoked)
+        for tp in revoked:
+            self._paused.pop(tp, None)
+        self.lag = {tp: behind for tp, behind in self.lag.items() if tp not in revoked}
+        logger.info(f"Partitions revoked: {sorted(f'{tp.topic}[{tp.partition}]' for tp in revoked)}")
+
+    def on_partitions_assigned(self, assigned) -> None:
+        """Log newly assigned partitions; their positions come from the committed offsets"""
+        logger.info(f"Partitions assigned: {sorted(f'{tp.topic}[{tp.partition}]' for tp in assigned)}")
+
+    @property
+    def in_flight(self) -> int:
+        """Number of records currently processing"""
+        return self._offsets.in_flight()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._own_loop_thread = threading.Thread(
+                target=self._loop.run_forever, name="kafka-consumer-loop", daemon=True
+            )
+            self._own_loop_thread.start()
+        return self._loop
+
+    def run(self) -> None:
+        """Poll, dispatch and commit until stop() is called. Blocks the calling thread."""
+        loop = self._ensure_loop()
+        self.topics = sorted(self.consumer.subscription() or [])
+
+        try:
+            while not self._stopping.is_set():
+                self._commit(force=False)
+                self._rewind_failed()
+                self._resume_due()
+
+                # Only fetch as many records as there are free processing slots
+                free_slots = self.max_in_flight - self.in_flight
+                if free_slots <= 0:
+                    self._wait_for_slot()
+                    continue
+
+                if self.process_batch is not None:
+                    # Poll many records and hand each topic's records over as one batch
+                    records = self._hold_back(self.consumer.poll(
+                        timeout_ms=self._poll_timeout_ms(),
+                        max_records=min(free_slots, self.max_batch_records)
+                    ))
+                    batches: Dict[str, List[Any]] = {}
+                    for tp, messages in records.items():
+                        batches.setdefault(tp.topic, []).extend(messages)
+                    for messages in batches.values():
+                        self._dispatch(loop, messages)
+                else:
+                    records = self._hold_back(
+                        self.consumer.poll(timeout_ms=self._poll_timeout_ms(), max_records=free_slots)
+                    )
+                    for tp, messages in records.items():
+                        for message in messages:
+                            self._dispatch(loop, [message])
+        finally:
+            self._drain()
+            self._commit(force=True)
+            self.consumer.close()
+            if self._own_loop_thread:
+                loop.call_soon_threadsafe(loop.stop)
+                self._own_loop_thread.join(timeout=5)
+
+    def _hold_back(self, records: Dict[TopicPartition, List[Any]]) -> Dict[TopicPartition, List[Any]]:
+        """Drop the records of delayed topics that are not due yet and pause their partitions there"""
+        if not self.record_delays:
+            return records
+        now = time.time()
+        due_records = {}
+        for tp, messages in records.items():
+            delay = self.record_delays.get(tp.topic, 0.0)
+            for index, message in enumerate(messages):
+                due = message.timestamp / 1000 + delay
+                if due > now:
+                    # Fetch this record again once the partition is resumed
+                    self.consumer.seek(tp, message.offset)
+                    self.consumer.pause(tp)
+                    self._paused[tp] = due
+                    messages = messages[:index]
+                    break
+            if messages:
+                due_records[tp] = messages
+        return due_records
+
+    def _poll_timeout_ms(self) -> int:
+        """Poll timeout, shortened so a paused partition is resumed when its first record is due"""
+        if not self._paused:
+            return self.poll_timeout_ms
+        until_due = min(self._paused.values()) - time.time()
+        return max(0, min(self.poll_timeout_ms, int(until_due * 1000) + 1))
+
+    def _resume_due(self) -> None:
+        if not self._paused:
+            return
+        now = time.time()
+        due = [tp for tp, due_at in self._paused.items() if due_at <= now]
+        if due:
+            self.consumer.resume(*due)
+            for tp in due:
+                del self._paused[tp]
+
+    def _rewind_failed(self) -> None:
+        """Seek partitions with failed records back to the first one once nothing else of theirs is in flight"""
+        for tp in self._offsets.failed_partitions():
+            # Fetch nothing more from the partition until it has been rewound
+            self.consumer.pause(tp)
+            self._paused.pop(tp, None)
+            if self._offsets.in_flight([tp]):
+                continue
+            offset = self._offsets.rewind(tp)
+            self.consumer.seek(tp, offset)
+            self._paused[tp] = time.time() + self.redelivery_delay
+            logger.warning(
+                f"Redelivering {tp.topic}[{tp.partition}] from offset {offset} in {self.redelivery_delay:g}s"
+            )
+
+    def _wait_for_slot(self) -> None:
+        # Keep the stop flag responsive while the engine is saturated
+        if self._slots.acquire(timeout=self.poll_timeout_ms / 1000):
+            self._slots.release()
+
+    def _dispatch(self, loop: asyncio.AbstractEventLoop, messages: List[Any]) -> None:
+        """Schedule a group of records (one record, or one batch) on the event loop"""
+        for message in messages:
+            self._slots.acquire()
+            self._offsets.start(TopicPartition(message.topic, message.partition), message.offset)
+
+        # Chain on every key in the group so records with the same key run in partition order
+        keys = {(message.topic, message.key) for message in messages if message.key is not None}
+        with self._key_lock:
+            previous = {self._key_tails[key] for key in keys if key in self._key_tails}
+            future = asyncio.run_coroutine_threadsafe(self._process(messages, previous), loop)
+            for key in keys:
+                self._key_tails[key] = future
+
+        future.add_done_callback(lambda f: self._on_done(f, messages, keys))
+
+    async def _process(self, messages: List[Any], previous: Set[Future]) -> None:
+        for earlier in previous:
+            try:
+                await asyncio.wrap_future(earlier)
+            except Exception:
+                pass  # The earlier record's failure was already logged; it is redelivered
+
+        first = messages[0]
+        try:
+            if self.process_batch is not None:
+                await self.process_batch(messages)
+            else:
+                await self.process_record(first)
+        except Exception as e:
+            logger.error(
+                f"Error processing {len(messages)} message(s) at "
+                f"{first.topic}[{first.partition}]@{first.offset}, they will be redelivered: {e}"
+            )
+            raise
+
+    def _on_done(self, future: Future, messages: List[Any], keys: Set[Any]) -> None:
+        with self._key_lock:
+            for key in keys:
+                if self._key_tails.get(key) is future:
+                    del self._key_tails[key]
+        failed = future.cancelled() or future.exception() is not None
+        for message in messages:
+            tp = TopicPartition(message.topic, message.partition)
+            if failed:
+                self._offsets.fail(tp, message.offset)
+            else:
+                self._offsets.complete(tp, message.offset)
+            self._slots.release()
+
+    def _commit(self, force: bool) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_commit < self.commit_interval:
+            return
+        self._last_commit = now
+
+        offsets = self._offsets.committable()
+        if offsets:
+            try:
+                self.consumer.commit(offsets=offsets)
+                self._offsets.mark_committed(offsets)
+            except Exception as e:
+                logger.error(f"Error committing offsets: {e}")
+        self._update_lag()
+
+    def _update_lag(self) -> None:
+        """Refresh per-partition lag from the highwater marks the consumer already fetched"""
+        try:
+            lag = {}
+            for tp in self.consumer.assignment():
+                highwater = self.consumer.highwater(tp)
+                committed = self._offsets.committed_offset(tp)
+                if highwater is not None and committed is not None:
+                    lag[tp] = max(0, highwater - committed)
+            self.lag = lag
+        except Exception as e:
+            logger.debug(f"Could not compute consumer lag: {e}")
+
+    def _drain(self) -> None:
+        deadline = time.monotonic() + self.drain_timeout
+        while self.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self.in_flight:
+            logger.warning(f"Shutting down with {self.in_flight} records still in flight")
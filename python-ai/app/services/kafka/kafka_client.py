@@ -1,12 +1,18 @@
 import json
 import uuid
+import time
 import asyncio
 import inspect
+import contextvars
 from datetime import datetime
 from typing import Dict, List, Optional, Any, Callable, TypedDict, Union, Awaitable
-from dataclasses import dataclass, asdict
-from kafka import KafkaProducer, KafkaConsumer
+from dataclasses import dataclass, asdict, replace
+from kafka import ConsumerRebalanceListener, KafkaProducer, KafkaConsumer
 from kafka.errors import KafkaError
+from .consumer_engine import EngineRebalanceListener, KafkaConsumerEngine
+from .retry_topics import BatchMessageFailure, PermanentMessageError, RetryPolicy, create_retry_policy
+from ..utils.priority_scheduler import PRIORITIES, PriorityScheduler, create_priority_scheduler
+from ..utils.stage_timing import record_stage, stage_timing_enabled, time_stage
 import logging
 import os
 
@@ -21,6 +27,11 @@ class Metadata(TypedDict):
     retryCount: int
     priority: str  # 'normal' | 'high' | 'low'
 
+class FailureMetadata(Metadata, total=False):
+    """Metadata of a message republished to a retry or dead-letter topic"""
+    originalTopic: str
+    error: str
+
 @dataclass
 class EventMessage:
     messageId: str
@@ -32,12 +43,68 @@ class EventMessage:
     payload: Any
     metadata: Metadata
 
+@dataclass
+class UndecodableValue:
+    """Value of a record that is not JSON, kept raw so it can be dead-lettered"""
+    raw: bytes
+    error: str
+
+def _deserialize_value(value: Optional[bytes]) -> Any:
+    """Deserialize a JSON message value; malformed values become UndecodableValue"""
+    if not value:
+        return {}
+    try:
+        return json.loads(value.decode('utf-8'))
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        logger.error(f"Error parsing message JSON: {e}")
+        return UndecodableValue(value, f"{type(e).__name__}: {e}")
+
+def _serialize_value(value: Any) -> bytes:
+    """Serialize a message value to JSON; raw bytes (dead-lettered records) are sent as they are"""
+    if isinstance(value, bytes):
+        return value
+    return json.dumps(value).encode('utf-8')
+
+def _set_future_result(future: asyncio.Future, result: Any) -> None:
+    if not future.done():
+        future.set_result(result)
+
+def _set_future_exception(future: asyncio.Future, exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
+
+# Callback for non-blocking publishes: (result, None) on success, (None, exception) on failure
+PublishCallback = Callable[[Optional[Dict[str, Any]], Optional[BaseException]], None]
+
 # Type alias for message handler (now supports both sync and async)
 MessageHandler = Union[
     Callable[[str, EventMessage, Dict[str, bytes]], None],
     Callable[[str, EventMessage, Dict[str, bytes]], Awaitable[None]]
 ]
 
+# Type alias for batch message handler: receives every message of a poll for one topic,
+# with the headers of each message at the same index
+BatchMessageHandler = Union[
+    Callable[[str, List[EventMessage], List[Dict[str, bytes]]], None],
+    Callable[[str, List[EventMessage], List[Dict[str, bytes]]], Awaitable[None]]
+]
+
+def batch_handler(max_records: int = 32):
+    """
+    Mark a handler as a batch handler
+    
+    subscribe() then polls up to ``max_records`` messages at once and calls the
+    handler with lists of EventMessages and headers instead of one message.
+    """
+    def decorator(handler: BatchMessageHandler) -> BatchMessageHandler:
+        handler.batch_max_records = max_records
+        return handler
+    return decorator
+
+def is_batch_handler(handler: Callable) -> bool:
+    """Whether a handler was marked with @batch_handler"""
+    return getattr(handler, "batch_max_records", None) is not None
+
 class KafkaMessageQueue:
     def __init__(self, config_dict=None):
         """
@@ -63,15 +130,22 @@ class KafkaMessageQueue:
         producer_config = {
             'bootstrap_servers': config_dict['brokers'],
             'client_id': config_dict['client_id'],
-            'value_serializer': lambda v: json.dumps(v).encode('utf-8'),
+            'value_serializer': _serialize_value,
             'key_serializer': lambda k: k.encode('utf-8') if k else None,
             'acks': 'all',  # Equivalent to idempotent=true
             'retries': 8,
-            'max_in_flight_requests_per_connection': 1,
+            # Idempotence keeps ordering with up to 5 in-flight requests per connection
+            'max_in_flight_requests_per_connection': 5,
             'enable_idempotence': True,
             'request_timeout_ms': 30000,
+            'linger_ms': int(os.getenv('KAFKA_LINGER_MS', '5')),
+            'batch_size': int(os.getenv('KAFKA_BATCH_SIZE', '32768')),
         }
         
+        compression_type = os.getenv('KAFKA_COMPRESSION')
+        if compression_type:
+            producer_config['compression_type'] = compression_type
+        
         # Add SSL configuration if provided
         if config_dict['ca']:
             producer_config.update({
@@ -83,8 +157,12 @@ class KafkaMessageQueue:
             })
         
         self.producer = None
-        self.consumer = None
+        self._engines: List[KafkaConsumerEngine] = []
         self.producer_config = producer_config
+        # Orders handler calls of every subscription by message priority and topic (None: arrival order)
+        self.priority_scheduler = create_priority_scheduler()
+        # Republishes messages whose handler failed to retry and dead-letter topics (None: failed messages are redelivered)
+        self.retry_policy = create_retry_policy()
         
     def connect(self) -> None:
         """Connect the Kafka producer"""
@@ -96,22 +174,24 @@ class KafkaMessageQueue:
             raise
     
     def disconnect(self) -> None:
-        """Disconnect producer and consumer"""
+        """Disconnect the producer and every consumer"""
         if self.producer:
             self.producer.close()
             print("Kafka producer disconnected")
             
-        if self.consumer:
-            self.consumer.close()
-            print("Kafka consumer disconnected")
+        if self._engines:
+            # Running subscriptions close their own consumer once drained
+            self.stop_consumers()
+            print(f"Kafka consumers disconnected ({len(self._engines)} still draining)")
     
     def create_message(
         self, 
         event_type: str, 
         payload: Any, 
-        destination: Optional[str] = None
+        destination: Optional[str] = None,
+        priority: str = 'normal'
     ) -> EventMessage:
-        """Create a structured event message"""
+        """Create a structured event message; priority is 'high', 'normal' or 'low'"""
         return EventMessage(
             messageId=str(uuid.uuid4()),
             timestamp=datetime.utcnow().isoformat() + 'Z',
@@ -123,48 +203,62 @@ class KafkaMessageQueue:
             metadata=Metadata(
                 correlationId=str(uuid.uuid4()),
                 retryCount=0,
-                priority='normal'
+                priority=priority
             )
         )
     
+    def _send(self, topic: str, message: EventMessage, key: Optional[str] = None):
+        """Hand a message to the producer's batching buffer and return its send future"""
+        if not self.producer:
+            raise RuntimeError("Producer not connected. Call connect() first.")
+        
+        # Convert dataclass to dict for serialization
+        message_dict = asdict(message)
+        
+        # Prepare headers
+        headers = [
+            ('event-type', message.eventType.encode('utf-8')),
+            ('source', message.source.encode('utf-8')),
+            ('timestamp', message.timestamp.encode('utf-8')),
+        ]
+        
+        # Send message
+        return self.producer.send(
+            topic=topic,
+            key=key or message.messageId,
+            value=message_dict,
+            headers=headers
+        )
+    
+    def _send_raw(self, topic: str, value: bytes, key: Optional[str], headers: List[tuple]):
+        """Hand raw bytes to the producer, bypassing EventMessage serialization"""
+        if not self.producer:
+            raise RuntimeError("Producer not connected. Call connect() first.")
+        return self.producer.send(topic=topic, key=key, value=value, headers=headers)
+    
+    @staticmethod
+    def _to_result(record_metadata) -> Dict[str, Any]:
+        return {
+            'topic': record_metadata.topic,
+            'partition': record_metadata.partition,
+            'offset': record_metadata.offset,
+            'timestamp': record_metadata.timestamp
+        }
+    
     def publish_event(
         self, 
         topic: str, 
         message: EventMessage, 
         key: Optional[str] = None
     ) -> Any:
-        """Publish an event to a Kafka topic"""
-        if not self.producer:
-            raise RuntimeError("Producer not connected. Call connect() first.")
-        
+        """Publish an event to a Kafka topic and wait for the broker acknowledgement"""
         try:
-            # Convert dataclass to dict for serialization
-            message_dict = asdict(message)
-            
-            # Prepare headers
-            headers = [
-                ('event-type', message.eventType.encode('utf-8')),
-                ('source', message.source.encode('utf-8')),
-                ('timestamp', message.timestamp.encode('utf-8')),
-            ]
-            
-            # Send message
-            future = self.producer.send(
-                topic=topic,
-                key=key or message.messageId,
-                value=message_dict,
-                headers=headers
-            )
+            future = self._send(topic, message, key)
             
             # Wait for the message to be sent and get metadata
             record_metadata = future.get(timeout=30)
             
-            result = {
-                'topic': record_metadata.topic,
-                'partition': record_metadata.partition,
-                'offset': record_metadata.offset,
-                'timestamp': record_metadata.timestamp
-            }
+            result = self._to_result(record_metadata)
             
             print(f"Message published to {topic}: {result}")
             return result
@@ -176,42 +270,211 @@ class KafkaMessageQueue:
             logger.error(f"Unexpected error publishing message: {e}")
             raise
     
+    def publish_event_nowait(
+        self, 
+        topic: str, 
+        message: EventMessage, 
+        key: Optional[str] = None,
+        callback: Optional[PublishCallback] = None
+    ) -> Any:
+        """
+        Publish an event without waiting for the broker
+        
+        The message is appended to the producer's batch and sent in the
+        background (see KAFKA_LINGER_MS / KAFKA_BATCH_SIZE / KAFKA_COMPRESSION).
+        
+        Args:
+            topic: Topic to publish to
+            message: Event to publish
+            key: Message key (defaults to the message id)
+            callback: Called from the producer thread with (result, None) on
+                success or (None, exception) on failure
+            
+        Returns:
+            The producer's send future
+        """
+        started = time.perf_counter() if stage_timing_enabled() else None
+        
+        def on_success(record_metadata):
+            result = self._to_result(record_metadata)
+            logger.debug(f"Message published to {topic}: {result}")
+            if started is not None:
+                record_stage("publish", time.perf_counter() - started, topic=topic)
+            if callback:
+                callback(result, None)
+        
+        def on_error(exc):
+            logger.error(f"Error publishing message to {topic}: {exc}")
+            if started is not None:
+                record_stage("publish", time.perf_counter() - started, topic=topic, error=True)
+            if callback:
+                callback(None, exc)
+        
+        future = self._send(topic, message, key)
+        future.add_callback(on_success)
+        future.add_errback(on_error)
+        return future
+    
+    async def publish_event_async(
+        self, 
+        topic: str, 
+        message: EventMessage, 
+        key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Publish an event and await the broker acknowledgement without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        result_future = loop.create_future()
+        
+        def resolve(result, exc):
+            if exc is not None:
+                loop.call_soon_threadsafe(_set_future_exception, result_future, exc)
+            else:
+                loop.call_soon_threadsafe(_set_future_result, result_future, result)
+        
+        self.publish_event_nowait(topic, message, key, callback=resolve)
+        return await result_future
+    
+    async def _dead_letter_record(self, message, error: BaseException) -> None:
+        """
+        Publish a record that is not an EventMessage to its topic's dead-letter topic
+        
+        The value is sent as it was received (re-serialized if it was valid JSON of
+        the wrong shape), with the original topic and the error as headers.
+        """
+        if isinstance(message.value, UndecodableValue):
+            value, reason = message.value.raw, message.value.error
+        else:
+            value, reason = _serialize_value(message.value), f"{type(error).__name__}: {error}"
+        target = RetryPolicy.dead_letter_topic(message.topic)
+        headers = [
+            *(message.headers or []),
+            ('original-topic', message.topic.encode('utf-8')),
+            ('error', reason[:1000].encode('utf-8')),
+        ]
+        loop = asyncio.get_running_loop()
+        result_future = loop.create_future()
+        future = self._send_raw(target, value, message.key, headers)
+        future.add_callback(
+            lambda record_metadata: loop.call_soon_threadsafe(
+                _set_future_result, result_future, self._to_result(record_metadata)
+            )
+        )
+        future.add_errback(lambda exc: loop.call_soon_threadsafe(_set_future_exception, result_future, exc))
+        await result_future
+        
+        if stage_timing_enabled():
+            record_stage("retry", 0.0, topic=message.topic, dead_letter=True)
+        logger.error(
+            f"Malformed record {message.topic}[{message.partition}]@{message.offset} moved to {target}: {reason}"
+        )
+    
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until every buffered message has been sent"""
+        if self.producer:
+            self.producer.flush(timeout=timeout)
+    
     async def _call_handler(
         self, 
-        handler: MessageHandler, 
+        handler: Union[MessageHandler, BatchMessageHandler], 
         topic: str, 
-        event_message: EventMessage, 
-        headers: Dict[str, bytes]
+        event_message: Union[EventMessage, List[EventMessage]], 
+        headers: Union[Dict[str, bytes], List[Dict[str, bytes]]]
     ) -> None:
-        """Call handler whether it's sync or async"""
+        """
+        Call handler whether it's sync or async, once the priority scheduler grants a slot
+        
+        Messages the handler fails on are republished to a retry or dead-letter
+        topic; the call only fails if that is not possible (or retries are
+        disabled), and the consumer engine then redelivers the messages.
+        """
         try:
-            if inspect.iscoroutinefunction(handler):
-                await handler(topic, event_message, headers)
+            if self.priority_scheduler is None:
+                await self._run_handler(handler, topic, event_message, headers)
+                return
+
+            priority = self._message_priority(event_message)
+            started = time.perf_counter()
+            async with self.priority_scheduler.slot(topic, priority):
+                if stage_timing_enabled():
+                    record_stage("schedule", time.perf_counter() - started, topic=topic, priority=priority)
+                await self._run_handler(handler, topic, event_message, headers)
+        except Exception as e:
+            if self.retry_policy is None:
+                raise
+            messages = event_message if isinstance(event_message, list) else [event_message]
+            if isinstance(e, BatchMessageFailure):
+                failures = [(messages[index], error) for index, error in e.failures.items()]
             else:
-                # Run sync handler in a thread pool to avoid blocking
-                loop = asyncio.get_event_loop()
-                await loop.run_in_executor(None, handler, topic, event_message, headers)
+                failures = [(message, e) for message in messages]
+            await asyncio.gather(*(self._retry_message(topic, message, error) for message, error in failures))
+
+    async def _retry_message(self, topic: str, message: EventMessage, error: BaseException) -> None:
+        """Republish a failed message to its next retry topic, or to the dead-letter topic"""
+        retry_count = message.metadata.get('retryCount', 0)
+        if isinstance(error, PermanentMessageError):
+            target, dead_letter = self.retry_policy.dead_letter_topic(topic), True
+        else:
+            target, dead_letter = self.retry_policy.next_topic(topic, retry_count)
+
+        metadata: FailureMetadata = {
+            **message.metadata,
+            'retryCount': retry_count if dead_letter else retry_count + 1,
+            'originalTopic': self.retry_policy.base_topic(topic),
+            'error': f"{type(error).__name__}: {error}"[:1000],
+        }
+        await self.publish_event_async(target, replace(message, metadata=metadata))
+
+        if stage_timing_enabled():
+            record_stage("retry", 0.0, topic=topic, dead_letter=dead_letter)
+        if dead_letter:
+            logger.error(f"Message {message.messageId} moved to {target} after {retry_count} retries: {error}")
+        else:
+            logger.warning(f"Message {message.messageId} failed on {topic}, retry {retry_count + 1} on {target}: {error}")
+
+    @staticmethod
+    def _message_priority(event_message: Union[EventMessage, List[EventMessage]]) -> str:
+        """Priority of a message, or the highest priority of a batch"""
+        messages = event_message if isinstance(event_message, list) else [event_message]
+        priorities = [
+            PriorityScheduler.normalize_priority((message.metadata or {}).get('priority'))
+            for message in messages
+        ]
+        return min(priorities, key=PRIORITIES.index)
+
+    async def _run_handler(
+        self, 
+        handler: Union[MessageHandler, BatchMessageHandler], 
+        topic: str, 
+        event_message: Union[EventMessage, List[EventMessage]], 
+        headers: Union[Dict[str, bytes], List[Dict[str, bytes]]]
+    ) -> None:
+        messages = len(event_message) if isinstance(event_message, list) else 1
+        try:
+            async with time_stage("handler", topic=topic, messages=messages):
+                if inspect.iscoroutinefunction(handler):
+                    await handler(topic, event_message, headers)
+                else:
+                    # Run sync handler in a thread pool to avoid blocking, keeping the
+                    # scheduling context so its encode requests keep their priority
+                    loop = asyncio.get_event_loop()
+                    context = contextvars.copy_context()
+                    await loop.run_in_executor(None, context.run, handler, topic, event_message, headers)
         except Exception as e:
             logger.error(f"Error in message handler: {e}")
             raise
 
-    async def subscribe_async(
-        self, 
-        topics: List[str], 
-        group_id: str, 
-        message_handler: MessageHandler
-    ) -> None:
-        """Subscribe to topics and process messages asynchronously"""
+    def _consumer_config(self, group_id: str) -> Dict[str, Any]:
+        """Build consumer configuration; offsets are committed manually by the consumer engine"""
         consumer_config = {
             'bootstrap_servers': self.kafka_config['brokers'],
             'group_id': group_id,
             'client_id': self.kafka_config['client_id'],
-            'value_deserializer': lambda m: json.loads(m.decode('utf-8')) if m else {},
+            'value_deserializer': _deserialize_value,
             'key_deserializer': lambda k: k.decode('utf-8') if k else None,
             'session_timeout_ms': 30000,
             'heartbeat_interval_ms': 3000,
             'auto_offset_reset': 'earliest',
-            'enable_auto_commit': True,
+            'enable_auto_commit': False,
         }
         
         # Add SSL configuration if provided
@@ -224,118 +487,167 @@ class KafkaMessageQueue:
                 'ssl_certfile': self.kafka_config['cert'],
             })
         
-        try:
-            self.consumer = KafkaConsumer(*topics, **consumer_config)
-            print(f"Subscribed to topics: {topics}")
-            
-            # Process messages in a separate thread to avoid blocking
-            loop = asyncio.get_event_loop()
-            
-            def consume_messages():
-                """Consume messages synchronously in a separate thread"""
-                for message in self.consumer:
-                    try:
-                        # Parse message value into EventMessage
-                        message_data = message.value
-                        if not message_data:
-                            continue
-                        
-                        # Convert dict back to EventMessage
-                        event_message = EventMessage(**message_data)
-                        
-                        # Convert headers to dict
-                        headers = {}
-                        if message.headers:
-                            for key, value in message.headers:
-                                headers[key] = value
-                        
-                        # Schedule the handler to run in the event loop
-                        asyncio.run_coroutine_threadsafe(
-                            self._call_handler(message_handler, message.topic, event_message, headers),
-                            loop
-                        )
-                        
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Error parsing message JSON: {e}")
-                    except Exception as e:
-                        logger.error(f"Error processing message: {e}")
-            
-            # Run the consumer in a thread pool
-            await loop.run_in_executor(None, consume_messages)
-                    
-        except Exception as e:
-            logger.error(f"Error in consumer: {e}")
-            raise
+        return consumer_config
+    
+    def _create_consumer(
+        self,
+        topics: List[str],
+        group_id: str,
+        listener: Optional[ConsumerRebalanceListener] = None
+    ):
+        """Create a consumer subscribed to topics, notifying listener of partition rebalances"""
+        consumer = KafkaConsumer(**self._consumer_config(group_id))
+        consumer.subscribe(topics, listener=listener)
+        return consumer
+    
+    @staticmethod
+    def _to_event_message(message) -> Optional[EventMessage]:
+        """
+        Convert a consumer record into an EventMessage, or None if it has no value
+        
+        Raises:
+            ValueError: If the value is not JSON
+            TypeError: If the value is not an EventMessage object
+        """
+        message_data = message.value
+        if isinstance(message_data, UndecodableValue):
+            raise ValueError(message_data.error)
+        if not message_data:
+            return None
+        return EventMessage(**message_data)
+    
+    @staticmethod
+    def _to_headers(message) -> Dict[str, bytes]:
+        """Convert consumer record headers to a dict"""
+        headers = {}
+        if message.headers:
+            for key, value in message.headers:
+                headers[key] = value
+        return headers
+    
+    async def subscribe_async(
+        self, 
+        topics: List[str], 
+        group_id: str, 
+        message_handler: MessageHandler,
+        max_in_flight: Optional[int] = None,
+        delays: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Subscribe to topics and process messages on the running event loop"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            lambda: self.subscribe(
+                topics, group_id, message_handler, loop=loop, max_in_flight=max_in_flight, delays=delays
+            )
+        )
 
     def subscribe(
         self, 
         topics: List[str], 
         group_id: str, 
-        message_handler: MessageHandler
+        message_handler: Union[MessageHandler, BatchMessageHandler],
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        max_in_flight: Optional[int] = None,
+        delays: Optional[Dict[str, float]] = None
     ) -> None:
-        """Subscribe to topics and process messages (synchronous version for backward compatibility)"""
-        consumer_config = {
-            'bootstrap_servers': self.kafka_config['brokers'],
-            'group_id': group_id,
-            'client_id': self.kafka_config['client_id'],
-            'value_deserializer': lambda m: json.loads(m.decode('utf-8')) if m else {},
-            'key_deserializer': lambda k: k.decode('utf-8') if k else None,
-            'session_timeout_ms': 30000,
-            'heartbeat_interval_ms': 3000,
-            'auto_offset_reset': 'earliest',
-            'enable_auto_commit': True,
-        }
+        """
+        Subscribe to topics and process messages until stop_consumers() is called
         
-        # Add SSL configuration if provided
-        if self.kafka_config['ca']:
-            consumer_config.update({
-                'security_protocol': 'SSL',
-                'ssl_check_hostname': True,
-                'ssl_cafile': self.kafka_config['ca'],
-                'ssl_keyfile': self.kafka_config['key'],
-                'ssl_certfile': self.kafka_config['cert'],
-            })
+        Blocks the calling thread with the poll loop. Messages are processed
+        concurrently on ``loop`` (or a private event loop if None), up to
+        ``max_in_flight`` at a time, in order per message key. Offsets are
+        committed only after their handler has completed.
+        
+        Args:
+            topics: Topics to subscribe to
+            group_id: Consumer group
+            message_handler: Sync or async handler called for each message, or a
+                handler marked with @batch_handler called with lists of messages
+            loop: Event loop to run handlers on
+            max_in_flight: Maximum number of messages processing at once
+                (if None, reads KAFKA_MAX_IN_FLIGHT)
+            delays: Seconds to wait after a message was published before handling it,
+                per topic (used for retry topics)
+        """
+        async def process_record(message) -> None:
+            try:
+                event_message = self._to_event_message(message)
+            except (TypeError, ValueError) as e:
+                await self._dead_letter_record(message, e)
+                return
+            if event_message is None:
+                return
+            
+            await self._call_handler(message_handler, message.topic, event_message, self._to_headers(message))
+        
+        async def process_batch(messages) -> None:
+            event_messages = []
+            headers = []
+            malformed = []
+            for message in messages:
+                try:
+                    event_message = self._to_event_message(message)
+                except (TypeError, ValueError) as e:
+                    malformed.append(self._dead_letter_record(message, e))
+                    continue
+                if event_message is None:
+                    continue
+                event_messages.append(event_message)
+                headers.append(self._to_headers(message))
+            
+            await asyncio.gather(*malformed)
+            if event_messages:
+                await self._call_handler(message_handler, messages[0].topic, event_messages, headers)
         
         try:
-            self.consumer = KafkaConsumer(*topics, **consumer_config)
+            # Each subscription owns its consumer; rebalances are handed to its engine
+            listener = EngineRebalanceListener()
+            consumer = self._create_consumer(topics, group_id, listener)
             print(f"Subscribed to topics: {topics}")
             
-            # Process messages
-            for message in self.consumer:
-                try:
-                    # Parse message value into EventMessage
-                    message_data = message.value
-                    if not message_data:
-                        continue
-                    
-                    # Convert dict back to EventMessage
-                    event_message = EventMessage(**message_data)
-                    
-                    # Convert headers to dict
-                    headers = {}
-                    if message.headers:
-                        for key, value in message.headers:
-                            headers[key] = value
-                    
-                    # Call message handler - now handles both sync and async
-                    if inspect.iscoroutinefunction(message_handler):
-                        # For async handlers, run in new event loop
-                        asyncio.run(message_handler(message.topic, event_message, headers))
-                    else:
-                        # For sync handlers, call directly
-                        message_handler(message.topic, event_message, headers)
-                    
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error parsing message JSON: {e}")
-                    # TODO: Implement dead-letter queue / retry logic here
-                except Exception as e:
-                    logger.error(f"Error processing message: {e}")
-                    # TODO: Implement dead-letter queue / retry logic here
+            max_in_flight = max_in_flight or int(os.getenv('KAFKA_MAX_IN_FLIGHT', '16'))
+            redelivery_delay = float(os.getenv('KAFKA_REDELIVERY_DELAY', '5'))
+            if is_batch_handler(message_handler):
+                engine = KafkaConsumerEngine(
+                    consumer,
+                    loop=loop,
+                    max_in_flight=max_in_flight,
+                    process_batch=process_batch,
+                    max_batch_records=message_handler.batch_max_records,
+                    record_delays=delays,
+                    redelivery_delay=redelivery_delay
+                )
+            else:
+                engine = KafkaConsumerEngine(
+                    consumer,
+                    process_record,
+                    loop=loop,
+                    max_in_flight=max_in_flight,
+                    record_delays=delays,
+                    redelivery_delay=redelivery_delay
+                )
+            listener.engine = engine
+            self._engines.append(engine)
+            try:
+                engine.run()
+            finally:
+                self._engines.remove(engine)
                     
         except Exception as e:
             logger.error(f"Error in consumer: {e}")
             raise
     
+    @property
+    def engines(self) -> List[KafkaConsumerEngine]:
+        """Consumer engines of the running subscriptions"""
+        return list(self._engines)
+    
+    def stop_consumers(self) -> None:
+        """Signal every running subscription to drain in-flight messages, commit and close"""
+        for engine in list(self._engines):
+            engine.stop()
+    
     def __enter__(self):
         """Context manager entry"""
         self.connect()
@@ -346,5 +658,10 @@ class KafkaMessageQueue:
         self.disconnect()
 
 
-# Create singleton instance using global config
-kafka_message_queue = KafkaMessageQueue()
\ No newline at end of file
+# Create singleton instance using global config; KAFKA_BACKEND=memory swaps in the
+# in-process stand-in used by benchmarks and local runs without a broker
+if os.getenv('KAFKA_BACKEND', 'kafka') == 'memory':
+    from .memory_queue import InMemoryMessageQueue
+    kafka_message_queue = InMemoryMessageQueue()
+else:
+    kafka_message_queue = KafkaMessageQueue()
\ No newline at end of file
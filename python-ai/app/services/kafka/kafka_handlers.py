@@ -1,11 +1,17 @@
-from .kafka_client import EventMessage
+from .kafka_client import EventMessage, batch_handler
+from .retry_topics import BatchMessageFailure, PermanentMessageError
 from typing import Dict
-from ..embedding.embedding_service import download_document, embedding_model, collection
-from ..llm.openai_service import OpenAIService, DocumentRetriever, DocumentContext
-from ..utils.extract_text import extract_text_from_pdf
-from typing import Dict, Optional
+from ..embedding.embedding_service import embedding_model, encode_scheduler, query_embedding_cache, vector_index, lexical_index
+from ..embedding.ingestion import prepare_document, store_documents, ingest_documents
+from ..llm.openai_service import OpenAIService, DocumentRetriever, DocumentContext, LLMResponse
+from ..llm.response_cache import SemanticResponseCache
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import logging
+import os
 from  .kafka_client import kafka_message_queue
+from ..utils.stage_timing import time_stage
+from ..utils.lazy_service import LazyService
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -23,46 +29,159 @@ async def handle_embedding_create(topic: str, message: EventMessage, headers: Di
     object_name = payload.get("objectName")
 
     if not document_url or not object_name:
-        logger.error("Missing required fields: url or objectName")
-        return
+        raise PermanentMessageError("Missing required fields: url or objectName")
 
     # Now you can directly await since this function is async
     await process_embedding(document_url, object_name)
 
 async def process_embedding(url: str, doc_id: str):
-    """Process document embedding asynchronously"""
+    """Process document embedding asynchronously; failures are raised so the message is retried"""
     try:
         logger.info(f"Starting embedding processing for {doc_id}")
         
-        # Download document
-        file_path = await download_document(url)
-        logger.info(f"Document downloaded: {file_path}")
-        
-        # Extract text from PDF
-        text = extract_text_from_pdf(file_path)
-        logger.info(f"Text extracted, length: {len(text)} characters")
-        
-        # Create embedding
-        embedding = embedding_model.encode(text)
-        logger.info(f"Embedding created, shape: {embedding.shape}")
+        # Download, extract and encode the document, unless the stored copy is current
+        document = await prepare_document(url, doc_id)
+        if document.unchanged:
+            logger.info(f"[=] Embeddings for {doc_id} are up to date.")
+            return
+        logger.info(f"Embeddings created, shape: {document.embeddings.shape}")
 
-        # Store in ChromaDB
-        collection.add(
-            documents=[text],
-            embeddings=[embedding.tolist()],
-            ids=[doc_id],
-            metadatas=[{"source": "kafka", "filename": doc_id}]
-        )
+        # Replace the document's chunks in ChromaDB with a single bulk write
+        await asyncio.get_running_loop().run_in_executor(None, store_documents, [document])
 
-        logger.info(f"[+] Embedding for {doc_id} stored successfully.")
+        logger.info(f"[+] Embeddings for {doc_id} ({len(document.chunks)} chunks) stored successfully.")
+        
+        response_cache.invalidate_document(doc_id)
 
     except Exception as e:
         logger.error(f"[-] Error processing embedding for {doc_id}: {e}")
+        raise
+
+@batch_handler(max_records=int(os.getenv("EMBEDDING_BATCH_SIZE", "16")))
+async def handle_embedding_create_batch(
+    topic: str, 
+    messages: List[EventMessage], 
+    headers: List[Dict[str, bytes]]
+) -> None:
+    """
+    Batch handler for embedding creation events
+    
+    Downloads and extracts every document of the batch concurrently, encodes all
+    of their chunks in one call and stores them with one upsert. Messages whose
+    document failed are reported with BatchMessageFailure so only they are retried.
+    """
+    logger.info(f"Received {len(messages)} messages on topic {topic}")
+    
+    items = []
+    failures = {}
+    for index, message in enumerate(messages):
+        payload = message.payload
+        document_url = payload.get("url")
+        object_name = payload.get("objectName")
+        
+        if not document_url or not object_name:
+            logger.error(f"Missing required fields: url or objectName (message {message.messageId})")
+            failures[index] = PermanentMessageError("Missing required fields: url or objectName")
+            continue
+        items.append((index, document_url, object_name))
+    
+    if items:
+        try:
+            errors = {}
+            documents = await ingest_documents([(url, object_name) for _, url, object_name in items], errors=errors)
+            changed = [document for document in documents if not document.unchanged]
+            
+            chunk_count = sum(len(document.chunks) for document in changed)
+            logger.info(
+                f"[+] Embeddings for {len(changed)} documents ({chunk_count} chunks) stored successfully, "
+                f"{len(documents) - len(changed)} unchanged, {len(errors)} failed."
+            )
+            
+            for document in changed:
+                response_cache.invalidate_document(document.doc_id)
+            
+            for index, _, object_name in items:
+                if object_name in errors:
+                    failures[index] = errors[object_name]
+        
+        except Exception as e:
+            # Encoding or storing failed for the whole batch
+            logger.error(f"[-] Error processing embedding batch: {e}")
+            raise
+    
+    if failures:
+        raise BatchMessageFailure(failures)
        
 
-# Initialize services
-openai_service = OpenAIService()
-document_retriever = DocumentRetriever(collection, embedding_model)
+# Initialize services; the OpenAI client and the retriever are created on first
+# use (or when the app lifespan warms them) rather than at import time
+openai_service = LazyService("openai_service", OpenAIService)
+response_cache = SemanticResponseCache(
+    max_size=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+    similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+)
+document_retriever = LazyService("document_retriever", lambda: DocumentRetriever(
+    vector_index.get(),
+    embedding_model.get(),
+    encode_scheduler,
+    query_embedding_cache,
+    lexical_index=lexical_index.get(),
+    lexical_candidates=int(os.getenv("LEXICAL_CANDIDATES", "50"))
+))
+
+# Default system message for document queries
+DEFAULT_SYSTEM_MESSAGE = """You are a helpful assistant that answers questions based on provided document context. 
+                Be accurate and cite specific information from the documents when possible. 
+                If the provided context doesn't contain enough information to answer the question completely, 
+                clearly state what information is missing."""
+
+def llm_settings(llm_params: Optional[Dict]) -> Dict:
+    """Generation settings of a query with their defaults; also the response cache parameters"""
+    llm_params = llm_params or {}
+    return {
+        "model": openai_service.get().model,
+        "max_tokens": llm_params.get("max_tokens", 1000),
+        "temperature": llm_params.get("temperature", 0.7),
+        "system_message": llm_params.get("system_message") or DEFAULT_SYSTEM_MESSAGE,
+    }
+
+async def generate_answer(
+    user_prompt: str,
+    query_embedding,
+    context_documents: List[DocumentContext],
+    llm_params: Optional[Dict] = None
+) -> Tuple[LLMResponse, bool]:
+    """
+    Answer a prompt from its context documents
+    
+    Near-duplicate questions over the same documents are answered from the
+    response cache.
+    
+    Returns:
+        The response and whether it came from the cache
+    """
+    service = await openai_service.get_async()
+    settings = llm_settings(llm_params)
+    response = response_cache.get(query_embedding, context_documents, settings)
+    if response is not None:
+        logger.info("LLM response served from response cache")
+        return response, True
+    
+    # Generate LLM response
+    logger.info("Generating LLM response...")
+    
+    response = await service.generate_response(
+        prompt=user_prompt,
+        context=context_documents,
+        max_tokens=settings["max_tokens"],
+        temperature=settings["temperature"],
+        system_message=settings["system_message"]
+    )
+    response_cache.put(query_embedding, context_documents, settings, response)
+    
+    logger.info(f"LLM response generated ({len(response.content)} characters)")
+    logger.info(f"Token usage: {response.usage}")
+    return response, False
 
 async def handle_document_query(topic: str, message: EventMessage, headers: Dict[str, bytes]) -> None:
     """
@@ -95,8 +214,7 @@ async def handle_document_query(topic: str, message: EventMessage, headers: Dict
         # Extract required fields
         user_prompt = payload.get("user_prompt")
         if not user_prompt:
-            logger.error("Missing required field: user_prompt")
-            return
+            raise PermanentMessageError("Missing required field: user_prompt")
         
         # Extract optional fields
         document_id = payload.get("document_id")
@@ -117,8 +235,8 @@ async def handle_document_query(topic: str, message: EventMessage, headers: Dict
         )
         
     except Exception as e:
+        # Re-raised so the message queue retries it, then dead-letters it
         logger.error(f"Error handling document query: {e}")
-        # TODO: Send error response back or to dead letter queue
         raise
 
 async def process_document_query(
@@ -141,6 +259,8 @@ async def process_document_query(
         correlation_id: Correlation ID for tracking
     """
     try:
+        retriever = await document_retriever.get_async()
+
         # Set default parameters
         search_params = search_params or {}
         llm_params = llm_params or {}
@@ -148,10 +268,15 @@ async def process_document_query(
         # Retrieve document context
         context_documents = []
         
+        # Served from the query embedding cache for repeated questions
+        async with time_stage("embed_query"):
+            query_embedding = await retriever.embed_query_async(user_prompt)
+        
         if query_type == "specific_document" and document_id:
             # Retrieve specific document
             logger.info(f"Retrieving specific document: {document_id}")
-            doc = document_retriever.get_document_by_id(document_id)
+            with time_stage("retrieve", query_type=query_type):
+                doc = retriever.get_document_by_id(document_id)
             if doc:
                 context_documents.append(doc)
                 logger.info(f"Retrieved document {document_id} ({len(doc.content)} characters)")
@@ -164,11 +289,13 @@ async def process_document_query(
             n_results = search_params.get("n_results", 3)
             similarity_threshold = search_params.get("similarity_threshold", 0.7)
             
-            context_documents = document_retriever.search_similar_documents(
-                query=user_prompt,
-                n_results=n_results,
-                similarity_threshold=similarity_threshold,
-            )
+            async with time_stage("retrieve", query_type=query_type):
+                context_documents = await retriever.search_similar_documents_async(
+                    query=user_prompt,
+                    n_results=n_results,
+                    similarity_threshold=similarity_threshold,
+                    query_embedding=query_embedding,
+                )
             
             logger.info(f"Found {len(context_documents)} relevant documents")
             for doc in context_documents:
@@ -177,31 +304,7 @@ async def process_document_query(
         else:
             logger.warning(f"Unknown query_type: {query_type}")
         
-        # Generate LLM response
-        logger.info("Generating LLM response...")
-        
-        # Prepare LLM parameters
-        max_tokens = llm_params.get("max_tokens", 1000)
-        temperature = llm_params.get("temperature", 0.7)
-        system_message = llm_params.get("system_message")
-        
-        # Default system message for document queries
-        if not system_message:
-            system_message = """You are a helpful assistant that answers questions based on provided document context. 
-                Be accurate and cite specific information from the documents when possible. 
-                If the provided context doesn't contain enough information to answer the question completely, 
-                clearly state what information is missing."""
-        
-        response = await openai_service.generate_response(
-            prompt=user_prompt,
-            context=context_documents,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            system_message=system_message
-        )
-        
-        logger.info(f"LLM response generated ({len(response.content)} characters)")
-        logger.info(f"Token usage: {response.usage}")
+        response, cached = await generate_answer(user_prompt, query_embedding, context_documents, llm_params)
         
         # TODO: Send response back via Kafka or store in database
         logger.info("=== LLM RESPONSE ===")
@@ -219,14 +322,18 @@ async def process_document_query(
                 "response": response.content,
                 "model": response.model,
                 "finish_reason": response.finish_reason,
+                "cached": cached,
+                "context_usage": response.context_usage,
             }
         )
 
-        # Publish to Kafka topic "llm.response"
-        kafka_message_queue.publish_event("llm.response", llm_event)
+        # Publish to Kafka topic "llm.response" and wait for the broker acknowledgement:
+        # a failed send fails the handler, so the query is retried (answered from the
+        # response cache) instead of its offset being committed with the answer lost.
+        # Handlers run concurrently, so only this message waits for the ack
+        await kafka_message_queue.publish_event_async("llm.response", llm_event)
 
         
     except Exception as e:
         logger.error(f"Error processing document query: {e}")
-        # TODO: Handle errors appropriately (retry, dead letter queue, etc.)
         raise
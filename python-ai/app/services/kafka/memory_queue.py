@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import namedtuple
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from kafka.structs import TopicPartition
+
+from .kafka_client import EventMessage, KafkaMessageQueue, _deserialize_value
+
+logger = logging.getLogger(__name__)
+
+# Shape of the kafka-python ConsumerRecord fields the consumer engine and handlers use
+MemoryRecord = namedtuple("MemoryRecord", ["topic", "partition", "offset", "timestamp", "key", "value", "headers"])
+
+# Shape of kafka-python's RecordMetadata fields used by KafkaMessageQueue._to_result
+MemoryRecordMetadata = namedtuple("MemoryRecordMetadata", ["topic", "partition", "offset", "timestamp"])
+
+
+class _CompletedSend:
+    """Send future of a message that is already stored; callbacks run immediately"""
+
+    def __init__(self, record_metadata: MemoryRecordMetadata):
+        self.record_metadata = record_metadata
+
+    def add_callback(self, fn, *args, **kwargs) -> "_CompletedSend":
+        fn(*args, self.record_metadata, **kwargs)
+        return self
+
+    def add_errback(self, fn, *args, **kwargs) -> "_CompletedSend":
+        return self
+
+    def get(self, timeout: Optional[float] = None) -> MemoryRecordMetadata:
+        return self.record_metadata
+
+
+class InMemoryConsumer:
+    """Consumer over an InMemoryMessageQueue with the poll/commit/seek/pause/close calls KafkaConsumerEngine makes"""
+
+    def __init__(self, broker: "InMemoryMessageQueue", topics: List[str], group_id: str, listener=None):
+        self.broker = broker
+        self.topics = list(topics)
+        self.group_id = group_id
+        self.listener = listener
+        self._positions: Dict[TopicPartition, int] = {}
+        self._paused: set = set()
+        self._assigned = False
+        self._closed = False
+
+    def _assignment(self) -> List[TopicPartition]:
+        return [
+            TopicPartition(topic, partition)
+            for topic in self.topics
+            for partition in range(self.broker.partitions)
+        ]
+
+    def subscription(self) -> set:
+        return set(self.topics)
+
+    def assignment(self) -> set:
+        return set(self._assignment())
+
+    def highwater(self, tp: TopicPartition) -> int:
+        with self.broker._changed:
+            return len(self.broker._log(tp))
+
+    def poll(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict[TopicPartition, List[MemoryRecord]]:
+        if not self._assigned:
+            # The only member of its group: every partition is assigned on the first poll, like a join
+            self._assigned = True
+            if self.listener is not None:
+                self.listener.on_partitions_assigned(self._assignment())
+        deadline = time.monotonic() + timeout_ms / 1000
+        with self.broker._changed:
+            while True:
+                records: Dict[TopicPartition, List[MemoryRecord]] = {}
+                budget = max_records or float("inf")
+                for tp in self._assignment():
+                    if budget <= 0:
+                        break
+                    if tp in self._paused:
+                        continue
+                    log = self.broker._log(tp)
+                    position = self._positions.setdefault(tp, self.broker._committed.get((self.group_id, tp), 0))
+                    fetched = log[position:position + int(min(budget, len(log)))]
+                    if fetched:
+                        records[tp] = fetched
+                        self._positions[tp] = position + len(fetched)
+                        budget -= len(fetched)
+
+                remaining = deadline - time.monotonic()
+                if records or remaining <= 0 or self._closed:
+                    return records
+                self.broker._changed.wait(remaining)
+
+    def seek(self, tp: TopicPartition, offset: int) -> None:
+        self._positions[tp] = offset
+
+    def pause(self, *partitions: TopicPartition) -> None:
+        self._paused.update(partitions)
+
+    def resume(self, *partitions: TopicPartition) -> None:
+        self._paused.difference_update(partitions)
+
+    def paused(self) -> set:
+        return set(self._paused)
+
+    def commit(self, offsets: Optional[Dict[TopicPartition, Any]] = None) -> None:
+        with self.broker._changed:
+            for tp, offset in (offsets or {}).items():
+                self.broker._committed[(self.group_id, tp)] = offset.offset
+            self.broker._changed.notify_all()
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class InMemoryMessageQueue(KafkaMessageQueue):
+    """
+    In-process stand-in for KafkaMessageQueue.
+
+    Published messages are serialized like the real producer and appended to
+    per-partition logs; subscriptions run the same KafkaConsumerEngine over an
+    InMemoryConsumer, so handlers see the same EventMessages, concurrency,
+    ordering and commit behaviour as with a broker. Used by the benchmarks and
+    for running the service without Kafka (KAFKA_BACKEND=memory).
+    """
+
+    def __init__(self, config_dict=None, partitions: int = 4):
+        """
+        Initialize in-memory queue
+
+        Args:
+            config_dict: Optional config dictionary (only service_name and client_id are used)
+            partitions: Number of partitions per topic; messages are assigned by key
+        """
+        if config_dict is None:
+            config_dict = {
+                'service_name': os.getenv('KAFKA_SERVICE_NAME', 'python-ai'),
+                'brokers': [],
+                'client_id': os.getenv('KAFKA_CLIENT_ID', 'default-client'),
+                'ca': None,
+                'cert': None,
+                'key': None
+            }
+        super().__init__(config_dict)
+        self.partitions = max(1, partitions)
+        self._logs: Dict[TopicPartition, List[MemoryRecord]] = {}
+        self._committed: Dict[Tuple[str, TopicPartition], int] = {}
+        self._changed = threading.Condition()
+        self._connected = False
+
+    def connect(self) -> None:
+        self._connected = True
+        print("In-memory message queue connected")
+
+    def disconnect(self) -> None:
+        self._connected = False
+        self.stop_consumers()
+        print("In-memory message queue disconnected")
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Messages are stored synchronously; nothing to flush"""
+
+    def _log(self, tp: TopicPartition) -> List[MemoryRecord]:
+        return self._logs.setdefault(tp, [])
+
+    def _send(self, topic: str, message: EventMessage, key: Optional[str] = None) -> _CompletedSend:
+        if not self._connected:
+            raise RuntimeError("Producer not connected. Call connect() first.")
+
+        key = key or message.messageId
+        headers = [
+            ('event-type', message.eventType.encode('utf-8')),
+            ('source', (message.source or '').encode('utf-8')),
+            ('timestamp', message.timestamp.encode('utf-8')),
+        ]
+        # Round-trip through JSON like the real serializer/deserializer pair
+        return self._append(topic, key, json.dumps(asdict(message)).encode('utf-8'), headers)
+
+    def _send_raw(self, topic: str, value: bytes, key: Optional[str], headers: List[tuple]) -> _CompletedSend:
+        if not self._connected:
+            raise RuntimeError("Producer not connected. Call connect() first.")
+        return self._append(topic, key or "", value, headers)
+
+    def _append(self, topic: str, key: str, raw_value: bytes, headers: List[tuple]) -> _CompletedSend:
+        value = _deserialize_value(raw_value)
+        timestamp = int(time.time() * 1000)
+        tp = TopicPartition(topic, zlib.crc32(key.encode('utf-8')) % self.partitions)
+
+        with self._changed:
+            log = self._log(tp)
+            record = MemoryRecord(topic, tp.partition, len(log), timestamp, key, value, headers)
+            log.append(record)
+            self._changed.notify_all()
+
+        return _CompletedSend(MemoryRecordMetadata(topic, tp.partition, record.offset, timestamp))
+
+    def _create_consumer(self, topics: List[str], group_id: str, listener=None) -> InMemoryConsumer:
+        return InMemoryConsumer(self, topics, group_id, listener)
+
+    def messages(self, topic: str) -> List[Dict[str, Any]]:
+        """Every message published to a topic, as dicts, in partition then offset order"""
+        with self._changed:
+            return [
+                record.value
+                for tp in sorted(self._logs, key=lambda tp: tp.partition)
+                if tp.topic == topic
+                for record in self._logs[tp]
+            ]
+
+    def lag(self, topic: str, group_id: str) -> int:
+        """Number of messages of a topic the group has not committed yet"""
+        with self._changed:
+            return sum(
+                len(log) - self._committed.get((group_id, tp), 0)
+                for tp, log in self._logs.items()
+                if tp.topic == topic
+            )
+
+    def wait_until_committed(self, topic: str, group_id: str, timeout: Optional[float] = None) -> bool:
+        """Block until the group has committed every message of a topic"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while self.lag(topic, group_id) > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
@@ -0,0 +1,114 @@
+import logging
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_RETRY_TOPIC = re.compile(r"^(?P<base>.+)\.retry\.[0-9.]+s$")
+_DEAD_LETTER_SUFFIX = ".dlq"
+
+
+class PermanentMessageError(Exception):
+    """Raised by a handler for a message that can never succeed; it is dead-lettered without retries"""
+
+
+class BatchMessageFailure(Exception):
+    """
+    Raised by a batch handler when only some messages of the batch failed
+
+    Only the failed messages are retried; the others count as processed.
+    """
+
+    def __init__(self, failures: Dict[int, BaseException]):
+        """
+        Args:
+            failures: Exception of each failed message, by its index in the batch
+        """
+        super().__init__(f"{len(failures)} message(s) of the batch failed")
+        self.failures = failures
+
+
+class RetryPolicy:
+    """
+    Delay-tiered retry topics and a dead-letter topic per handled topic.
+
+    A message failing on ``topic`` for the n-th time (metadata.retryCount == n)
+    is republished to ``topic.retry.<delay>s`` with the n-th delay and
+    retryCount n + 1; once max_retries retries have failed it goes to
+    ``topic.dlq``. Delays grow exponentially:
+
+        RetryPolicy(max_retries=3, base_delay=10, backoff=6)
+        # embedding.create.retry.10s, embedding.create.retry.60s, embedding.create.retry.360s
+
+    Retry topics are consumed with their delay (see KafkaMessageQueue.subscribe),
+    so a failing message waits on its own topic instead of blocking the
+    partition it came from.
+    """
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 10.0, backoff: float = 6.0):
+        """
+        Initialize retry policy
+
+        Args:
+            max_retries: Retries before a message is dead-lettered
+            base_delay: Seconds before the first retry
+            backoff: Factor between the delays of consecutive retries
+        """
+        if max_retries <= 0:
+            raise ValueError("max_retries must be positive")
+        if base_delay < 0 or backoff < 1:
+            raise ValueError("base_delay must not be negative and backoff must be at least 1")
+
+        self.max_retries = max_retries
+        self.delays = [base_delay * backoff ** attempt for attempt in range(max_retries)]
+
+    @staticmethod
+    def base_topic(topic: str) -> str:
+        """Topic a retry topic belongs to (the topic itself for non-retry topics)"""
+        match = _RETRY_TOPIC.match(topic)
+        return match.group("base") if match else topic
+
+    @staticmethod
+    def dead_letter_topic(topic: str) -> str:
+        return RetryPolicy.base_topic(topic) + _DEAD_LETTER_SUFFIX
+
+    def retry_topic(self, topic: str, attempt: int) -> str:
+        """Retry topic of the attempt-th retry (0-based)"""
+        return f"{self.base_topic(topic)}.retry.{self.delays[attempt]:g}s"
+
+    def retry_topics(self, topic: str) -> Dict[str, float]:
+        """Every retry topic of a topic with its delay in seconds"""
+        return {self.retry_topic(topic, attempt): delay for attempt, delay in enumerate(self.delays)}
+
+    def next_topic(self, topic: str, retry_count: int) -> Tuple[str, bool]:
+        """
+        Where a message that failed after retry_count retries goes next
+
+        Returns:
+            The topic and whether it is the dead-letter topic
+        """
+        if retry_count >= self.max_retries:
+            return self.dead_letter_topic(topic), True
+        return self.retry_topic(topic, retry_count), False
+
+
+def create_retry_policy() -> Optional[RetryPolicy]:
+    """
+    Create the retry policy from KAFKA_MAX_RETRIES, KAFKA_RETRY_DELAY and KAFKA_RETRY_BACKOFF
+
+    The retry and dead-letter topics must exist, or the brokers must create topics
+    automatically. KAFKA_MAX_RETRIES=0 disables retry topics: failed messages are
+    redelivered from their own partition, which blocks it until they succeed.
+
+    Returns:
+        RetryPolicy, or None when retries are disabled
+    """
+    max_retries = int(os.getenv("KAFKA_MAX_RETRIES", "3"))
+    if max_retries <= 0:
+        return None
+    return RetryPolicy(
+        max_retries=max_retries,
+        base_delay=float(os.getenv("KAFKA_RETRY_DELAY", "10")),
+        backoff=float(os.getenv("KAFKA_RETRY_BACKOFF", "6"))
+    )
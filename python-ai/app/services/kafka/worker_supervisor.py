@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def run_consumer_worker(worker_id: int, environment: Dict[str, str]) -> None:
+    """
+    Entry point of a consumer worker process
+
+    Applies the environment overrides before the service modules are imported, then runs
+    its own producer, consumers, model and store handles until SIGTERM or SIGINT,
+    and drains in-flight messages before exiting.
+    """
+    # Overrides, not defaults: spawned workers inherit the API process's environment
+    for name, value in environment.items():
+        os.environ[name] = value
+    asyncio.run(_serve_worker(worker_id))
+
+
+async def _serve_worker(worker_id: int) -> None:
+    from ..pipeline_runtime import PipelineRuntime
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    runtime = PipelineRuntime()
+    print(f"Consumer worker {worker_id} started (pid {os.getpid()})")
+    try:
+        await runtime.start()
+        await stop.wait()
+        print(f"Consumer worker {worker_id} draining")
+    finally:
+        await runtime.stop()
+        print(f"Consumer worker {worker_id} stopped")
+
+
+@dataclass
+class WorkerState:
+    """One supervised worker slot and the process currently filling it"""
+    worker_id: int
+    process: Optional[multiprocessing.process.BaseProcess] = None
+    started_at: float = 0.0
+    restarts: int = 0
+    backoff: float = 0.0
+    restart_at: Optional[float] = None
+    last_exit_code: Optional[int] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def as_dict(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.alive,
+            "restarts": self.restarts,
+            "last_exit_code": self.last_exit_code,
+        }
+
+
+class WorkerSupervisor:
+    """
+    Runs N consumer worker processes in the same consumer group.
+
+    Every worker owns its consumers, model and store handles, so the group
+    spreads the topic partitions over all of them (a topic needs at least N
+    partitions to keep every worker busy). Workers that exit unexpectedly are
+    restarted, with exponential backoff while they keep failing soon after
+    starting. stop() sends SIGTERM, lets each worker drain and commit, and
+    kills workers that do not finish in time.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        target: Callable[..., None] = run_consumer_worker,
+        environment: Optional[Dict[str, str]] = None,
+        drain_timeout: float = 30.0,
+        min_uptime: float = 30.0,
+        max_backoff: float = 60.0
+    ):
+        """
+        Initialize worker supervisor
+
+        Args:
+            workers: Number of worker processes
+            target: Worker entry point, called with (worker_id, environment)
+            environment: Environment variables overriding the inherited ones in the workers
+            drain_timeout: Seconds a stopping worker gets before it is killed
+            min_uptime: Workers that crash sooner than this back off before restarting
+            max_backoff: Maximum seconds between restarts of a crashing worker
+        """
+        if workers <= 0:
+            raise ValueError("workers must be positive")
+
+        self.target = target
+        self.environment = dict(environment or {})
+        self.drain_timeout = drain_timeout
+        self.min_uptime = min_uptime
+        self.max_backoff = max_backoff
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = [WorkerState(worker_id) for worker_id in range(workers)]
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._monitor_thread: Optional[threading.Thread] = None
+
+    @property
+    def workers(self) -> int:
+        return len(self._workers)
+
+    @property
+    def alive(self) -> int:
+        """Number of worker processes currently running"""
+        with self._lock:
+            return sum(state.alive for state in self._workers)
+
+    def status(self) -> List[dict]:
+        with self._lock:
+            return [state.as_dict() for state in self._workers]
+
+    def _spawn(self, state: WorkerState) -> None:
+        state.process = self._context.Process(
+            target=self.target,
+            args=(state.worker_id, self.environment),
+            name=f"consumer-worker-{state.worker_id}"
+        )
+        state.process.start()
+        state.started_at = time.monotonic()
+        state.restart_at = None
+        logger.info(f"Started consumer worker {state.worker_id} (pid {state.process.pid})")
+
+    def start(self) -> None:
+        """Start every worker and the thread restarting crashed ones"""
+        with self._lock:
+            for state in self._workers:
+                self._spawn(state)
+        self._monitor_thread = threading.Thread(target=self._monitor, name="worker-supervisor", daemon=True)
+        self._monitor_thread.start()
+
+    def _monitor(self) -> None:
+        while not self._stopping.wait(0.5):
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                now = time.monotonic()
+                for state in self._workers:
+                    if state.process is not None and not state.process.is_alive():
+                        state.process.join()
+                        state.last_exit_code = state.process.exitcode
+                        uptime = now - state.started_at
+                        state.backoff = min(self.max_backoff, max(1.0, state.backoff * 2)) if uptime < self.min_uptime else 1.0
+                        state.restart_at = now + state.backoff
+                        state.process = None
+                        logger.error(
+                            f"Consumer worker {state.worker_id} exited with code {state.last_exit_code} "
+                            f"after {uptime:.1f}s; restarting in {state.backoff:.0f}s"
+                        )
+                    elif state.process is None and state.restart_at is not None and now >= state.restart_at:
+                        state.restarts += 1
+                        self._spawn(state)
+
+    def stop(self) -> None:
+        """Drain and stop every worker; blocks up to drain_timeout"""
+        self._stopping.set()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
+
+        with self._lock:
+            running = [state for state in self._workers if state.alive]
+        for state in running:
+            state.process.terminate()  # SIGTERM: the worker drains, commits and exits
+
+        deadline = time.monotonic() + self.drain_timeout
+        for state in running:
+            state.process.join(max(0.0, deadline - time.monotonic()))
+            if state.process.is_alive():
+                logger.warning(f"Consumer worker {state.worker_id} did not drain in time; killing it")
+                state.process.kill()
+                state.process.join()
+            state.last_exit_code = state.process.exitcode
+        logger.info("Consumer workers stopped")
+
+
+def create_worker_supervisor() -> Optional[WorkerSupervisor]:
+    """
+    Create the consumer worker supervisor if KAFKA_CONSUMER_WORKERS is set
+
+    The workers share the vector and lexical stores with each other and with the
+    API process, so stores that only one process may open are rejected. That
+    includes the lexical index, which is enabled by default and kept in local
+    files: consumer workers need a Chroma server (CHROMA_HOST) and
+    LEXICAL_INDEX_ENABLED=false.
+
+    Each worker collects its own stage timings and consumer lag; they are not
+    aggregated into the API process's /metrics.
+
+    Returns:
+        WorkerSupervisor, or None when messages are consumed in the API process
+
+    Raises:
+        RuntimeError: If a configured store cannot be shared between processes
+    """
+    workers = int(os.getenv("KAFKA_CONSUMER_WORKERS", "0"))
+    if workers <= 0:
+        return None
+
+    from ..embedding.embedding_service import process_local_stores
+
+    stores = process_local_stores()
+    if stores:
+        raise RuntimeError(
+            f"KAFKA_CONSUMER_WORKERS={workers} needs stores shared between processes, "
+            f"but these can only be opened by one process: {'; '.join(stores)}. "
+            f"Fix the configuration or set KAFKA_CONSUMER_WORKERS=0 to consume in the API process"
+        )
+
+    # Each worker encodes in its own process; split the cores instead of nesting process pools
+    environment = {
+        "CPU_STAGE_WORKERS": "0",
+        "EMBEDDING_INTRA_OP_THREADS": str(max(1, (os.cpu_count() or 1) // workers)),
+    }
+    return WorkerSupervisor(
+        workers,
+        environment=environment,
+        drain_timeout=float(os.getenv("KAFKA_WORKER_DRAIN_TIMEOUT", "45"))
+    )
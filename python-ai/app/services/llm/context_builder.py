@@ -0,0 +1,243 @@
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, List, Optional, Set
+
+from ..index.lexical_index import tokenize
+
+if TYPE_CHECKING:
+    from .openai_service import DocumentContext
+
+logger = logging.getLogger(__name__)
+
+# Counts the tokens of a piece of text
+TokenCounter = Callable[[str], int]
+
+_WORD_OR_SYMBOL = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+_SEPARATOR = "\n" + "=" * 80
+
+
+def heuristic_token_count(text: str) -> int:
+    """
+    Estimate BPE tokens without a tokenizer: one per symbol, one per four characters of a word
+
+    Close to tiktoken's counts for English prose and always available offline.
+    """
+    count = 0
+    for match in _WORD_OR_SYMBOL.finditer(text):
+        token = match.group()
+        count += math.ceil(len(token) / 4) if token[0].isalnum() or token[0] == "_" else 1
+    return count
+
+
+def tiktoken_counter(model: str) -> Optional[TokenCounter]:
+    """Exact token counter for an OpenAI model, or None when tiktoken or its encoding is unavailable"""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:  # Not installed, or the encoding cannot be downloaded offline
+        logger.warning(f"tiktoken unavailable ({e}), falling back to heuristic token counts")
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def get_token_counter(name: str = "heuristic", model: str = "gpt-3.5-turbo") -> TokenCounter:
+    """
+    Resolve a token counter by name
+
+    Args:
+        name: "heuristic" (offline estimate) or "tiktoken" (exact, falls back to the heuristic)
+        model: Model whose tokenizer tiktoken should use
+
+    Returns:
+        TokenCounter
+    """
+    if name == "tiktoken":
+        return tiktoken_counter(model) or heuristic_token_count
+    if name != "heuristic":
+        raise ValueError(f"Unknown token counter: {name}")
+    return heuristic_token_count
+
+
+@dataclass
+class Passage:
+    """A contiguous piece of one context document"""
+    doc_index: int
+    position: int
+    text: str
+    tokens: int
+    terms: Set[str]
+    score: float = 0.0
+
+
+@dataclass
+class ContextBuildResult:
+    """Assembled context and how much of the retrieved text it kept"""
+    text: str
+    tokens_used: int  # Tokens of the assembled context
+    tokens_total: int  # Tokens the full, untrimmed context would have taken
+    passages_used: int = 0
+    passages_redundant: int = 0  # Dropped as near-duplicates of a selected passage
+    passages_over_budget: int = 0  # Dropped because they did not fit the budget
+    documents: List[str] = field(default_factory=list)  # IDs of documents with a selected passage
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_total - self.tokens_used)
+
+    def as_dict(self) -> dict:
+        return {
+            "tokens_used": self.tokens_used,
+            "tokens_total": self.tokens_total,
+            "tokens_saved": self.tokens_saved,
+            "passages_used": self.passages_used,
+            "passages_redundant": self.passages_redundant,
+            "passages_over_budget": self.passages_over_budget,
+        }
+
+
+class ContextBuilder:
+    """
+    Assembles retrieved documents into a prompt context under a token budget.
+
+    Documents are split into passages of at most ``passage_tokens`` tokens along
+    sentence and paragraph breaks. Passages are scored by their document's
+    similarity plus how many query terms they contain, then taken best first
+    until the budget is spent; passages whose terms mostly repeat an already
+    selected passage are dropped. Selected passages are emitted in document
+    order so the context still reads naturally.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 3000,
+        token_counter: Optional[TokenCounter] = None,
+        passage_tokens: int = 200,
+        redundancy_threshold: float = 0.8,
+        query_weight: float = 0.5
+    ):
+        """
+        Initialize context builder
+
+        Args:
+            token_budget: Maximum tokens of the assembled context
+            token_counter: Function counting tokens (offline heuristic if None)
+            passage_tokens: Maximum tokens per passage
+            redundancy_threshold: Jaccard similarity of term sets above which a passage is redundant
+            query_weight: Weight of query term coverage relative to document similarity
+        """
+        if token_budget <= 0:
+            raise ValueError("token_budget must be positive")
+
+        self.token_budget = token_budget
+        self.count_tokens = token_counter or heuristic_token_count
+        self.passage_tokens = passage_tokens
+        self.redundancy_threshold = redundancy_threshold
+        self.query_weight = query_weight
+
+    @staticmethod
+    def _header(index: int, doc: "DocumentContext") -> str:
+        if doc.metadata.get("filename"):
+            return (
+                f"\nDocument {index} - {doc.metadata['filename']} "
+                f"(ID: {doc.document_id}, Similarity: {doc.similarity_score:.3f}):\n"
+            )
+        return f"\nDocument {index} (ID: {doc.document_id}, Similarity: {doc.similarity_score:.3f}):\n"
+
+    def _split(self, text: str) -> List[str]:
+        """Pack sentences into passages of at most passage_tokens tokens"""
+        passages, current, current_tokens = [], [], 0
+        for sentence in _SENTENCE_BREAK.split(text):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            tokens = self.count_tokens(sentence)
+            if tokens > self.passage_tokens:
+                # Hard-split sentences longer than a passage by words
+                words = sentence.split()
+                step = max(1, len(words) * self.passage_tokens // tokens)
+                pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+            else:
+                pieces = [sentence]
+            for piece in pieces:
+                piece_tokens = self.count_tokens(piece) if len(pieces) > 1 else tokens
+                if current and current_tokens + piece_tokens > self.passage_tokens:
+                    passages.append(" ".join(current))
+                    current, current_tokens = [], 0
+                current.append(piece)
+                current_tokens += piece_tokens
+        if current:
+            passages.append(" ".join(current))
+        return passages
+
+    @staticmethod
+    def _jaccard(a: Set[str], b: Set[str]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    def build(self, context: List["DocumentContext"], query: str = "") -> ContextBuildResult:
+        """
+        Assemble a context for a query
+
+        Args:
+            context: Retrieved documents, best first
+            query: User question, used to favor passages that mention its terms
+
+        Returns:
+            ContextBuildResult
+        """
+        query_terms = set(tokenize(query))
+        headers = [self._header(i, doc) for i, doc in enumerate(context, 1)]
+        header_tokens = [self.count_tokens(header) for header in headers]
+        frame_tokens = self.count_tokens(_SEPARATOR) * 2
+
+        passages: List[Passage] = []
+        tokens_total = frame_tokens
+        for doc_index, doc in enumerate(context):
+            tokens_total += header_tokens[doc_index] + self.count_tokens(doc.content or "")
+            for position, text in enumerate(self._split(doc.content or "")):
+                terms = set(tokenize(text))
+                coverage = len(query_terms & terms) / len(query_terms) if query_terms else 0.0
+                passages.append(Passage(
+                    doc_index=doc_index,
+                    position=position,
+                    text=text,
+                    tokens=self.count_tokens(text),
+                    terms=terms,
+                    score=doc.similarity_score + self.query_weight * coverage
+                ))
+
+        result = ContextBuildResult(text="", tokens_used=0, tokens_total=tokens_total)
+        selected: List[Passage] = []
+        budget = self.token_budget - frame_tokens
+        opened: Set[int] = set()
+
+        # Best first; earlier passages win ties
+        for passage in sorted(passages, key=lambda p: (-p.score, p.doc_index, p.position)):
+            if any(self._jaccard(passage.terms, other.terms) >= self.redundancy_threshold for other in selected):
+                result.passages_redundant += 1
+                continue
+            cost = passage.tokens + (0 if passage.doc_index in opened else header_tokens[passage.doc_index])
+            if cost > budget:
+                result.passages_over_budget += 1
+                continue
+            budget -= cost
+            opened.add(passage.doc_index)
+            selected.append(passage)
+
+        parts = []
+        for doc_index in sorted(opened):
+            doc_passages = sorted((p for p in selected if p.doc_index == doc_index), key=lambda p: p.position)
+            parts.append(headers[doc_index] + "\n".join(p.text for p in doc_passages))
+            result.documents.append(context[doc_index].document_id)
+
+        result.text = _SEPARATOR + "\n".join(parts) + _SEPARATOR if parts else ""
+        result.tokens_used = self.count_tokens(result.text) if parts else 0
+        result.passages_used = len(selected)
+        return result
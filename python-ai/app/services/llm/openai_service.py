@@ -1,9 +1,16 @@
+import asyncio
+import httpx
 import openai
 import os
 import logging
-from typing import List, Dict, Any, Optional
+import numpy as np
+from typing import AsyncIterator, List, Dict, Any, Optional, Sequence, Tuple
 from dataclasses import dataclass
-from chromadb import Collection
+from ..index.vector_index import VectorIndex, as_vector_index
+from ..index.lexical_index import reciprocal_rank_fusion
+from ..utils.chunk_text import merge_chunks
+from .context_builder import ContextBuilder, ContextBuildResult, TokenCounter, get_token_counter
+from ..utils.stage_timing import time_stage
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -17,6 +24,14 @@ class LLMResponse:
     model: str
     usage: Dict[str, Any]
     finish_reason: str
+    context_usage: Optional[Dict[str, int]] = None  # Token accounting of the assembled context
+
+@dataclass
+class LLMResponseDelta:
+    """Piece of a streamed LLM response; the last one carries the finish reason"""
+    content: str
+    model: str
+    finish_reason: Optional[str] = None
 
 @dataclass
 class DocumentContext:
@@ -29,13 +44,31 @@ class DocumentContext:
 class OpenAIService:
     """Service for interacting with OpenAI API"""
     
-    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-3.5-turbo"):
+    def __init__(
+        self, 
+        api_key: Optional[str] = None, 
+        model: str = "gpt-3.5-turbo",
+        base_url: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        request_timeout: Optional[float] = None,
+        context_token_budget: Optional[int] = None,
+        token_counter: Optional[TokenCounter] = None
+    ):
         """
         Initialize OpenAI service
         
         Args:
             api_key: OpenAI API key (if None, reads from OPENAI_API_KEY env var)
             model: OpenAI model to use
+            base_url: API base URL, e.g. a local stub server (if None, reads OPENAI_BASE_URL)
+            max_concurrency: Maximum number of in-flight requests (if None, reads OPENAI_MAX_CONCURRENCY)
+            max_connections: Size of the shared HTTP connection pool (if None, reads OPENAI_MAX_CONNECTIONS)
+            request_timeout: Per-request timeout in seconds (if None, reads OPENAI_TIMEOUT_SECONDS)
+            context_token_budget: Maximum tokens of document context per prompt
+                (if None, reads OPENAI_CONTEXT_TOKEN_BUDGET)
+            token_counter: Function counting tokens (if None, picked by OPENAI_TOKEN_COUNTER:
+                "heuristic", which works offline, or "tiktoken")
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
@@ -43,7 +76,66 @@ class OpenAIService:
         
         openai.api_key = self.api_key
         self.model = model
-        self.client = openai.OpenAI(api_key=self.api_key)
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+        self.max_concurrency = max_concurrency or int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+        self.max_connections = max_connections or int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+        self.request_timeout = request_timeout or float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+        self.context_builder = ContextBuilder(
+            token_budget=context_token_budget or int(os.getenv("OPENAI_CONTEXT_TOKEN_BUDGET", "3000")),
+            token_counter=token_counter or get_token_counter(os.getenv("OPENAI_TOKEN_COUNTER", "heuristic"), model)
+        )
+        
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    async def _ensure_client(self) -> openai.AsyncOpenAI:
+        """Async client with a pooled HTTP connection, created for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                await self._close_stale_client()
+            # httpx connection pools are bound to the loop that created them
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                timeout=self.request_timeout
+            )
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client,
+                timeout=self.request_timeout
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+    
+    async def _close_stale_client(self) -> None:
+        """Close the client of an earlier event loop instead of leaking its connection pool"""
+        client, loop = self._client, self._loop
+        self._client = None
+        if loop is not None and loop.is_running():
+            # Still running (in another thread): close the client on its own loop
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+        else:
+            # Its loop has stopped; closing from this loop still releases the pool, except
+            # for connections of a loop that is already closed, which only the GC reclaims
+            try:
+                await client.close()
+            except RuntimeError as e:
+                logger.info(f"OpenAI client of a closed event loop left to the garbage collector: {e}")
+                return
+        logger.info("Closed the OpenAI client of a previous event loop")
+    
+    async def close(self) -> None:
+        """Close the shared HTTP connection pool"""
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.close()
+        self._client = None
+        self._loop = None
         
     async def generate_response(
         self, 
@@ -67,89 +159,222 @@ class OpenAIService:
             LLMResponse object
         """
         try:
-            messages = []
-            
-            # Add system message if provided
-            if system_message:
-                messages.append({"role": "system", "content": system_message})
-            
-            # Prepare context if documents provided
-            if context and len(context) > 0:
-                context_text = self._prepare_context(context)
-                enhanced_prompt = f"""Based on the following document context, please answer the user's question:
-
-                    DOCUMENT CONTEXT:
-                    {context_text}
-
-                    USER QUESTION:
-                    {prompt}
-
-                    Please provide a comprehensive answer based on the document context. If the context doesn't contain enough information to fully answer the question, please mention what additional information might be needed."""
-            else:
-                enhanced_prompt = prompt
-            
-            messages.append({"role": "user", "content": enhanced_prompt})
+            messages, context_result = self._build_messages(prompt, context, system_message)
             
             logger.info(f"Sending request to OpenAI model: {self.model}")
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+            client = await self._ensure_client()
+            async with self._semaphore:
+                async with time_stage("llm", model=self.model) as stage:
+                    response = await client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        timeout=self.request_timeout
+                    )
+                    if response.usage:
+                        stage.values.update(
+                            prompt_tokens=response.usage.prompt_tokens,
+                            completion_tokens=response.usage.completion_tokens
+                        )
             
             return LLMResponse(
                 content=response.choices[0].message.content,
                 model=response.model,
                 usage=response.usage.model_dump() if response.usage else {},
-                finish_reason=response.choices[0].finish_reason
+                finish_reason=response.choices[0].finish_reason,
+                context_usage=context_result.as_dict() if context_result else None
             )
             
         except Exception as e:
             logger.error(f"Error generating OpenAI response: {e}")
             raise Exception(f"Failed to generate LLM response: {e}")
     
-    def _prepare_context(self, context: List[DocumentContext]) -> str:
+    async def stream_response(
+        self, 
+        prompt: str, 
+        context: Optional[List[DocumentContext]] = None,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        system_message: Optional[str] = None
+    ) -> AsyncIterator[LLMResponseDelta]:
+        """
+        Generate a response from OpenAI, yielding its content as it is produced
+        
+        Takes the same arguments as generate_response. The request holds one of
+        the max_concurrency slots until the stream is consumed or closed.
+        """
+        messages, _ = self._build_messages(prompt, context, system_message)
+        
+        client = await self._ensure_client()
+        async with self._semaphore:
+            async with time_stage("llm", model=self.model, stream=True):
+                try:
+                    stream = await client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                        timeout=self.request_timeout,
+                        stream=True
+                    )
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        choice = chunk.choices[0]
+                        if choice.delta.content or choice.finish_reason:
+                            yield LLMResponseDelta(
+                                content=choice.delta.content or "",
+                                model=chunk.model,
+                                finish_reason=choice.finish_reason
+                            )
+                except Exception as e:
+                    logger.error(f"Error streaming OpenAI response: {e}")
+                    raise Exception(f"Failed to generate LLM response: {e}")
+    
+    def _build_messages(
+        self, 
+        prompt: str, 
+        context: Optional[List[DocumentContext]], 
+        system_message: Optional[str]
+    ) -> Tuple[List[Dict[str, str]], Optional[ContextBuildResult]]:
+        """Chat messages for a prompt and its document context"""
+        messages = []
+        
+        # Add system message if provided
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        
+        # Prepare context if documents provided
+        context_result = None
+        if context and len(context) > 0:
+            context_result = self._build_context(context, prompt)
+            context_text = context_result.text
+            enhanced_prompt = f"""Based on the following document context, please answer the user's question:
+
+                    DOCUMENT CONTEXT:
+                    {context_text}
+
+                    USER QUESTION:
+                    {prompt}
+
+                    Please provide a comprehensive answer based on the document context. If the context doesn't contain enough information to fully answer the question, please mention what additional information might be needed."""
+        else:
+            enhanced_prompt = prompt
+        
+        messages.append({"role": "user", "content": enhanced_prompt})
+        return messages, context_result
+    
+    def _prepare_context(self, context: List[DocumentContext], prompt: str = "") -> str:
         """
         Format document context for LLM prompt
         
         Args:
             context: List of document contexts
+            prompt: User prompt, used to favor passages that mention its terms
             
         Returns:
-            Formatted context string
+            Formatted context string, within the context token budget
         """
-        context_parts = []
-        
-        for i, doc in enumerate(context, 1):
-            context_part = f"""
-                Document {i} (ID: {doc.document_id}, Similarity: {doc.similarity_score:.3f}):
-                {doc.content}
-                """
-            if doc.metadata.get("filename"):
-                context_part = f"""
-                Document {i} - {doc.metadata['filename']} (ID: {doc.document_id}, Similarity: {doc.similarity_score:.3f}):
-                {doc.content}
-                """
-            
-            context_parts.append(context_part)
-        
-        return "\n" + "="*80 + "\n".join(context_parts) + "\n" + "="*80
+        return self._build_context(context, prompt).text
+    
+    def _build_context(self, context: List[DocumentContext], prompt: str = "") -> ContextBuildResult:
+        """Assemble the best passages of the context documents within the token budget"""
+        result = self.context_builder.build(context, prompt)
+        logger.info(
+            f"Context: {result.tokens_used}/{self.context_builder.token_budget} tokens used, "
+            f"{result.tokens_saved} saved, {result.passages_used} passages "
+            f"({result.passages_redundant} redundant, {result.passages_over_budget} over budget)"
+        )
+        return result
 
 class DocumentRetriever:
-    """Service for retrieving documents from ChromaDB"""
+    """Service for retrieving documents from the vector index"""
     
-    def __init__(self, collection: Collection, embedding_model):
+    def __init__(
+        self,
+        collection,
+        embedding_model,
+        encode_scheduler=None,
+        query_cache=None,
+        lexical_index=None,
+        lexical_candidates: int = 50,
+        rrf_k: int = 60
+    ):
         """
         Initialize document retriever
         
         Args:
-            collection: ChromaDB collection
-            embedding_model: SentenceTransformer model for embeddings
+            collection: VectorIndex, or a raw ChromaDB collection (wrapped in a ChromaIndex)
+            embedding_model: EmbeddingBackend (or SentenceTransformer) used when no encode scheduler is given
+            encode_scheduler: Optional EncodeScheduler to batch query encodes with other callers
+            query_cache: Optional QueryEmbeddingCache so repeated queries skip the encoder
+            lexical_index: Optional BM25Index over the same chunks; enables hybrid retrieval
+            lexical_candidates: Number of lexical hits scored and fused with the vector hits
+            rrf_k: Damping constant of reciprocal-rank fusion
         """
-        self.collection = collection
+        self.index: VectorIndex = as_vector_index(collection)
         self.embedding_model = embedding_model
+        self.encode_scheduler = encode_scheduler
+        self.query_cache = query_cache
+        self.lexical_index = lexical_index
+        self.lexical_candidates = lexical_candidates
+        self.rrf_k = rrf_k
+    
+    def embed_query(self, query: str):
+        """Return the embedding of a query, from the cache when possible"""
+        if self.query_cache:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached
+        
+        if self.encode_scheduler:
+            embedding = self.encode_scheduler.encode_sync(query)
+        else:
+            embedding = self.embedding_model.encode(query)
+        
+        if self.query_cache:
+            self.query_cache.put(query, embedding)
+        return embedding
+    
+    async def embed_query_async(self, query: str):
+        """Return the embedding of a query without blocking the event loop on the encoder"""
+        if not self.encode_scheduler:
+            return self.embed_query(query)
+        
+        if self.query_cache:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached
+        
+        embedding = await self.encode_scheduler.encode(query)
+        
+        if self.query_cache:
+            self.query_cache.put(query, embedding)
+        return embedding
+    
+    async def embed_queries_async(self, queries: Sequence[str]) -> np.ndarray:
+        """
+        Return the embeddings of several queries as a 2-D array
+        
+        Queries missing from the cache are encoded together in one call.
+        """
+        embeddings = [self.query_cache.get(query) if self.query_cache else None for query in queries]
+        missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+        
+        if missing:
+            if self.encode_scheduler:
+                encoded = await self.encode_scheduler.encode(missing)
+            else:
+                encoded = np.asarray(self.embedding_model.encode(missing))
+            by_query = dict(zip(missing, encoded))
+            if self.query_cache:
+                for query, embedding in by_query.items():
+                    self.query_cache.put(query, embedding)
+            embeddings = [by_query[query] if embedding is None else embedding for query, embedding in zip(queries, embeddings)]
+        
+        return np.stack(embeddings)
     
     def get_document_by_id(self, document_id: str) -> Optional[DocumentContext]:
         """
@@ -162,19 +387,33 @@ class DocumentRetriever:
             DocumentContext if found, None otherwise
         """
         try:
-            result = self.collection.get(
-                ids=[document_id],
+            # Documents are stored as "<doc_id>#<n>" chunks; reassemble them in order
+            result = self.index.get(
+                where={"doc_id": document_id},
                 include=["documents", "metadatas"]
             )
             
+            if not result["ids"] or len(result["ids"]) == 0:
+                # Fall back to documents stored whole, before chunking was introduced
+                result = self.index.get(
+                    ids=[document_id],
+                    include=["documents", "metadatas"]
+                )
+            
             if not result["ids"] or len(result["ids"]) == 0:
                 logger.warning(f"Document {document_id} not found in collection")
                 return None
             
+            metadatas = result["metadatas"] or [{} for _ in result["ids"]]
+            chunks = sorted(
+                zip(result["documents"], metadatas),
+                key=lambda item: (item[1] or {}).get("chunk_index", 0)
+            )
+            
             return DocumentContext(
                 document_id=document_id,
-                content=result["documents"][0],
-                metadata=result["metadatas"][0] if result["metadatas"] else {},
+                content=merge_chunks([document for document, _ in chunks]),
+                metadata=chunks[0][1] or {},
                 similarity_score=1.0  # Exact match
             )
             
@@ -201,34 +440,190 @@ class DocumentRetriever:
         """
         try:
             # Generate embedding for the query
-            query_embedding = self.embedding_model.encode(query)
+            query_embedding = self.embed_query(query)
             
-            # Search in ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding.tolist()],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"],
-                
-            )
+            return self._query_collection(query_embedding, n_results, similarity_threshold, query)
             
-            documents = []
-            
-            if results["ids"] and len(results["ids"][0]) > 0:
-                for i in range(len(results["ids"][0])):
-                    # Convert distance to similarity (assuming cosine distance)
-                    distance = results["distances"][0][i] if results["distances"] else 0
-                    similarity = 1 - distance  # Convert distance to similarity
-                    
-                    if similarity >= similarity_threshold:
-                        documents.append(DocumentContext(
-                            document_id=results["ids"][0][i],
-                            content=results["documents"][0][i],
-                            metadata=results["metadatas"][0][i] if results["metadatas"] else {},
-                            similarity_score=similarity
-                        ))
+        except Exception as e:
+            logger.error(f"Error searching similar documents: {e}")
+            return []
+    
+    async def search_similar_documents_async(
+        self, 
+        query: str, 
+        n_results: int = 3,
+        similarity_threshold: float = 0.7,
+        query_embedding=None
+    ) -> List[DocumentContext]:
+        """
+        Search for similar documents without blocking the event loop.
+        
+        The query is encoded through the encode scheduler, so concurrent queries and
+        document ingestion share batched encode calls, and the index is searched in
+        the default executor.
+        
+        Args:
+            query: Search query
+            n_results: Number of results to return
+            similarity_threshold: Minimum similarity score
+            query_embedding: Precomputed embedding of the query, if the caller already has one
             
-            return documents
+        Returns:
+            List of similar documents
+        """
+        try:
+            if query_embedding is None:
+                query_embedding = await self.embed_query_async(query)
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._query_collection, query_embedding, n_results, similarity_threshold, query
+            )
             
         except Exception as e:
             logger.error(f"Error searching similar documents: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def search_batch(
+        self,
+        queries: Sequence[Optional[str]],
+        query_embeddings,
+        n_results: int = 3,
+        similarity_threshold: float = 0.7
+    ) -> List[List[DocumentContext]]:
+        """
+        Search for several queries with one multi-query call to the index
+        
+        Args:
+            queries: Query texts, used for lexical fusion (None to skip it for a query)
+            query_embeddings: Embedding of each query
+            n_results: Number of results to return per query
+            similarity_threshold: Minimum similarity score
+            
+        Returns:
+            The similar documents of each query, in query order
+        """
+        results = self.index.query(
+            query_embeddings=[np.asarray(embedding).tolist() for embedding in query_embeddings],
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"],
+        )
+        
+        documents = []
+        for row, (query, query_embedding) in enumerate(zip(queries, query_embeddings)):
+            hits = self._hits_to_documents(results, row)
+            if self.lexical_index is not None and query:
+                documents.append(self._fuse_lexical(query, query_embedding, hits, n_results, similarity_threshold))
+            else:
+                documents.append([doc for doc in hits if doc.similarity_score >= similarity_threshold])
+        return documents
+    
+    async def search_batch_async(
+        self,
+        queries: Sequence[str],
+        n_results: int = 3,
+        similarity_threshold: float = 0.7
+    ) -> Tuple[np.ndarray, List[List[DocumentContext]]]:
+        """
+        Encode several queries in one batch and search for all of them with one index call
+        
+        Returns:
+            The query embeddings and the similar documents of each query
+        """
+        query_embeddings = await self.embed_queries_async(queries)
+        documents = await asyncio.get_running_loop().run_in_executor(
+            None, self.search_batch, queries, query_embeddings, n_results, similarity_threshold
+        )
+        return query_embeddings, documents
+    
+    def _query_collection(
+        self, 
+        query_embedding, 
+        n_results: int,
+        similarity_threshold: float,
+        query: Optional[str] = None
+    ) -> List[DocumentContext]:
+        """
+        Run a vector query against the index and convert hits to DocumentContext
+        
+        With a lexical index, BM25 hits for the query text are added to the vector
+        hits and both are ranked by reciprocal-rank fusion. Lexical hits are scored
+        against the query embedding in the index's distance space too, and every
+        candidate must meet the similarity threshold, except chunks holding a rare
+        identifier of the query, so exact identifiers surface without a large n_results.
+        """
+        return self.search_batch([query], [query_embedding], n_results, similarity_threshold)[0]
+    
+    @staticmethod
+    def _hits_to_documents(results, row: int) -> List[DocumentContext]:
+        """Convert the hits of one query of a multi-query result to DocumentContext"""
+        documents = []
+        
+        if results["ids"] and len(results["ids"][row]) > 0:
+            for i in range(len(results["ids"][row])):
+                # Convert distance to similarity (assuming cosine distance)
+                distance = results["distances"][row][i] if results["distances"] else 0
+                similarity = 1 - distance  # Convert distance to similarity
+                
+                documents.append(DocumentContext(
+                    document_id=results["ids"][row][i],
+                    content=results["documents"][row][i],
+                    metadata=results["metadatas"][row][i] if results["metadatas"] else {},
+                    similarity_score=similarity
+                ))
+        
+        return documents
+    
+    def _fuse_lexical(
+        self,
+        query: str,
+        query_embedding,
+        vector_hits: List[DocumentContext],
+        n_results: int,
+        similarity_threshold: float
+    ) -> List[DocumentContext]:
+        """
+        Fuse vector hits with BM25 hits by reciprocal-rank fusion
+
+        The fusion is additive: the vector query runs over the whole index and the
+        lexical hits are added to its hits, not used to narrow them. Lexical hits the
+        vector query missed are fetched by id and scored with the index's own
+        distance, so every candidate's similarity is on the same scale and the
+        similarity threshold applies to both. The one exception are chunks holding
+        a rare identifier-like query term (see BM25Index.identifier_matches).
+        """
+        lexical_hits = self.lexical_index.search(query, self.lexical_candidates)
+        if not lexical_hits:
+            return [doc for doc in vector_hits if doc.similarity_score >= similarity_threshold]
+        
+        candidates = {doc.document_id: doc for doc in vector_hits}
+        missing = [chunk_id for chunk_id, _ in lexical_hits if chunk_id not in candidates]
+        if missing:
+            fetched = self.index.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+            if len(fetched["ids"]):
+                # Same conversion as the vector hits: 1 - distance
+                similarities = 1.0 - self.index.distances(query_embedding, fetched["embeddings"])
+            for i, chunk_id in enumerate(fetched["ids"]):
+                candidates[chunk_id] = DocumentContext(
+                    document_id=chunk_id,
+                    content=fetched["documents"][i],
+                    metadata=fetched["metadatas"][i] if fetched["metadatas"] else {},
+                    similarity_score=float(similarities[i])
+                )
+        
+        lexical_ranking = [chunk_id for chunk_id, _ in lexical_hits if chunk_id in candidates]
+        fused = reciprocal_rank_fusion(
+            [[doc.document_id for doc in vector_hits], lexical_ranking],
+            k=self.rrf_k
+        )
+        
+        # Only chunks holding a rare identifier of the query (e.g. "INV-2024-0042")
+        # may pass below the threshold; shared ordinary words are not enough
+        identifier_matches = self.lexical_index.identifier_matches(query)
+        documents = []
+        for chunk_id, _ in fused:
+            doc = candidates[chunk_id]
+            if doc.similarity_score >= similarity_threshold or chunk_id in identifier_matches:
+                documents.append(doc)
+                if len(documents) == n_results:
+                    break
+        
+        return documents
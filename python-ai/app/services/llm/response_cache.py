@@ -0,0 +1,215 @@
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .openai_service import DocumentContext, LLMResponse
+
+logger = logging.getLogger(__name__)
+
+ContextKey = FrozenSet[Tuple[str, str]]
+ParamsKey = Tuple[Tuple[str, Hashable], ...]
+
+
+@dataclass
+class _CachedResponse:
+    """A cached LLM response and what it was generated from"""
+    embedding: np.ndarray
+    context_key: ContextKey
+    params_key: ParamsKey
+    doc_ids: Set[str]
+    response: LLMResponse
+
+
+@dataclass
+class ResponseCacheStats:
+    """Counters reported by the response cache"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    size: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "size": self.size,
+        }
+
+
+class SemanticResponseCache:
+    """
+    Cache of LLM responses keyed by query meaning rather than query text.
+
+    A lookup hits when an earlier query was answered against exactly the same
+    context documents (ids and versions) with the same LLM parameters, and its
+    embedding is within ``similarity_threshold`` (cosine) of the new query.
+    Entries are evicted least-recently-used and invalidated when one of their
+    documents is re-embedded.
+    """
+
+    def __init__(self, max_size: int = 512, similarity_threshold: float = 0.95):
+        """
+        Initialize response cache
+
+        Args:
+            max_size: Maximum number of cached responses
+            similarity_threshold: Minimum cosine similarity between query embeddings for a hit
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+
+        self._entries: "OrderedDict[int, _CachedResponse]" = OrderedDict()
+        self._buckets: Dict[Tuple[ContextKey, ParamsKey], Set[int]] = {}
+        self._by_document: Dict[str, Set[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = ResponseCacheStats()
+
+    @staticmethod
+    def context_key(context: List[DocumentContext]) -> ContextKey:
+        """Identify a retrieved context by its document ids and versions"""
+        return frozenset(
+            (doc.document_id, str(doc.metadata.get("version", ""))) for doc in context
+        )
+
+    @staticmethod
+    def params_key(params: Dict[str, Any]) -> ParamsKey:
+        """Identify the LLM parameters a response was generated with"""
+        return tuple(sorted((name, value) for name, value in params.items()))
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def get(
+        self,
+        query_embedding: np.ndarray,
+        context: List[DocumentContext],
+        params: Dict[str, Any]
+    ) -> Optional[LLMResponse]:
+        """
+        Look up a response for a query
+
+        Args:
+            query_embedding: Embedding of the user prompt
+            context: Retrieved context documents the answer would be based on
+            params: LLM parameters (model, max_tokens, temperature, system message, ...)
+
+        Returns:
+            Cached LLMResponse, or None on a miss
+        """
+        embedding = self._normalize(query_embedding)
+        bucket_key = (self.context_key(context), self.params_key(params))
+
+        with self._lock:
+            best_id, best_score = None, self.similarity_threshold
+            for entry_id in self._buckets.get(bucket_key, ()):
+                score = float(np.dot(self._entries[entry_id].embedding, embedding))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self._stats.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self._stats.hits += 1
+            logger.debug(f"Response cache hit (similarity {best_score:.3f})")
+            return self._entries[best_id].response
+
+    def put(
+        self,
+        query_embedding: np.ndarray,
+        context: List[DocumentContext],
+        params: Dict[str, Any],
+        response: LLMResponse
+    ) -> None:
+        """
+        Store a response
+
+        Args:
+            query_embedding: Embedding of the user prompt
+            context: Context documents the answer was based on
+            params: LLM parameters the answer was generated with
+            response: Generated response
+        """
+        entry = _CachedResponse(
+            embedding=self._normalize(query_embedding),
+            context_key=self.context_key(context),
+            params_key=self.params_key(params),
+            doc_ids={doc.metadata.get("doc_id", doc.document_id) for doc in context},
+            response=response
+        )
+
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            self._buckets.setdefault((entry.context_key, entry.params_key), set()).add(entry_id)
+            for doc_id in entry.doc_ids:
+                self._by_document.setdefault(doc_id, set()).add(entry_id)
+
+            while len(self._entries) > self.max_size:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self._stats.evictions += 1
+
+    def invalidate_document(self, doc_id: str) -> int:
+        """
+        Drop every response that was based on a document
+
+        Args:
+            doc_id: Document that was re-embedded
+
+        Returns:
+            int: Number of responses dropped
+        """
+        with self._lock:
+            entry_ids = list(self._by_document.get(doc_id, ()))
+            for entry_id in entry_ids:
+                self._remove(entry_id)
+            self._stats.invalidations += len(entry_ids)
+
+        if entry_ids:
+            logger.info(f"Invalidated {len(entry_ids)} cached responses for document {doc_id}")
+        return len(entry_ids)
+
+    def _remove(self, entry_id: int) -> None:
+        """Remove an entry and its index references; caller holds the lock"""
+        entry = self._entries.pop(entry_id)
+
+        bucket_key = (entry.context_key, entry.params_key)
+        bucket = self._buckets[bucket_key]
+        bucket.discard(entry_id)
+        if not bucket:
+            del self._buckets[bucket_key]
+
+        for doc_id in entry.doc_ids:
+            entries = self._by_document[doc_id]
+            entries.discard(entry_id)
+            if not entries:
+                del self._by_document[doc_id]
+
+    @property
+    def stats(self) -> ResponseCacheStats:
+        """Snapshot of the cache counters"""
+        with self._lock:
+            return ResponseCacheStats(
+                hits=self._stats.hits,
+                misses=self._stats.misses,
+                evictions=self._stats.evictions,
+                invalidations=self._stats.invalidations,
+                size=len(self._entries)
+            )
@@ -0,0 +1,158 @@
+import asyncio
+import functools
+import logging
+import time
+from typing import List, Optional
+
+from .kafka.kafka_client import kafka_message_queue
+from .kafka.topic_handlers import TOPIC_HANDLERS
+from .kafka.kafka_handlers import openai_service, document_retriever
+from .embedding.embedding_service import (
+    encode_scheduler, cpu_executor, document_downloader, query_embedding_cache,
+    embedding_model, vector_index, lexical_index
+)
+from .embedding.ingestion import backfill_lexical_index
+from .utils.lazy_service import component_registry
+
+logger = logging.getLogger(__name__)
+
+CONSUMER_GROUP_ID = "python-ai-consumer-group"
+
+# Startup steps that are not lazy services; registered up front so /ready waits for them
+STARTUP_STEPS = ("kafka", "lexical_backfill", "encoder_warm_up")
+
+
+async def warm_up_encoder() -> None:
+    """Load the worker models and run a first encode so the first real request is not slowed down"""
+    loop = asyncio.get_running_loop()
+    try:
+        with component_registry.track("encoder_warm_up"):
+            await loop.run_in_executor(None, cpu_executor.warm_up)
+            await encode_scheduler.encode("warm up")
+    except Exception:
+        pass  # Recorded in the component registry and reported by /ready
+
+
+class PipelineRuntime:
+    """
+    Starts and stops the services of one process: Kafka producer, model and
+    stores, and optionally the topic subscriptions.
+
+    Used by the FastAPI lifespan and by each consumer worker process, so both
+    warm up and drain the same way. start() only schedules the loading, so the
+    server listens (and /ready answers 503) while the model and stores load;
+    requests arriving meanwhile wait for the services they need.
+    """
+
+    def __init__(self, consume: bool = True, group_id: str = CONSUMER_GROUP_ID):
+        """
+        Initialize pipeline runtime
+
+        Args:
+            consume: Subscribe to the handled topics in this process
+            group_id: Consumer group of the subscriptions
+        """
+        self.consume = consume
+        self.group_id = group_id
+        self._subscriptions: List[asyncio.Future] = []
+        self._warm_up: Optional[asyncio.Task] = None
+        self._startup: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Start connecting, loading the model and stores, and consuming in the background"""
+        for name in STARTUP_STEPS:
+            component_registry.register(name)
+        self._startup = asyncio.create_task(self._load())
+
+    async def wait_started(self) -> None:
+        """Wait until start()'s background loading has finished (or failed)"""
+        if self._startup is not None:
+            await asyncio.gather(self._startup, return_exceptions=True)
+
+    async def _load(self) -> None:
+        try:
+            await self._load_services()
+        except Exception as e:
+            # Recorded in the component registry; /ready keeps reporting 503
+            logger.error(f"Startup failed: {e!r}")
+
+    async def _load_services(self) -> None:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+
+        # Worker processes load their models while the stores open; /ready reports when they are done
+        self._warm_up = asyncio.create_task(warm_up_encoder())
+
+        # Connect Kafka producer
+        with component_registry.track("kafka"):
+            await loop.run_in_executor(None, kafka_message_queue.connect)
+
+        # Load the model (or wait for the pool workers to load it) and open the stores off the event loop, in parallel
+        await asyncio.gather(*(
+            loop.run_in_executor(None, service.get)
+            for service in (embedding_model, vector_index, lexical_index, openai_service)
+        ))
+        await loop.run_in_executor(None, document_retriever.get)
+
+        # Index chunks stored before hybrid retrieval was enabled
+        with component_registry.track("lexical_backfill"):
+            await loop.run_in_executor(None, backfill_lexical_index)
+
+        # Subscribe to Kafka topics with handlers; each subscription polls in its own
+        # thread and runs handlers concurrently on this event loop
+        if self.consume:
+            for topic, handler in TOPIC_HANDLERS.items():
+                if topic in [".", ".."] or not topic.strip():
+                    continue
+                self._subscriptions.append(loop.run_in_executor(
+                    None,
+                    functools.partial(
+                        kafka_message_queue.subscribe,
+                        [topic],
+                        self.group_id,
+                        handler,
+                        loop=loop
+                    )
+                ))
+                # Failed messages come back on the topic's retry topics once their delay has passed
+                if kafka_message_queue.retry_policy is not None:
+                    delays = kafka_message_queue.retry_policy.retry_topics(topic)
+                    self._subscriptions.append(loop.run_in_executor(
+                        None,
+                        functools.partial(
+                            kafka_message_queue.subscribe,
+                            list(delays),
+                            self.group_id,
+                            handler,
+                            loop=loop,
+                            delays=delays
+                        )
+                    ))
+
+        print(f"Startup took {time.perf_counter() - started:.2f}s: {component_registry.status()}")
+
+    async def stop(self) -> None:
+        """Drain in-flight messages and commit, then close the producer, model and stores"""
+        loop = asyncio.get_running_loop()
+        if self._startup is not None:
+            self._startup.cancel()
+            await self.wait_started()
+        if self._warm_up is not None:
+            self._warm_up.cancel()
+        kafka_message_queue.stop_consumers()
+        await asyncio.gather(*self._subscriptions, *filter(None, [self._warm_up]), return_exceptions=True)
+        await loop.run_in_executor(None, kafka_message_queue.flush, 10)
+        kafka_message_queue.disconnect()
+        encode_scheduler.stop(timeout=5)
+        print(f"Encode scheduler stats: {encode_scheduler.stats.as_dict()}")
+        if kafka_message_queue.priority_scheduler is not None:
+            print(f"Priority scheduler stats: {kafka_message_queue.priority_scheduler.stats()}")
+        print(f"Query embedding cache stats: {query_embedding_cache.stats.as_dict()}")
+        cpu_executor.shutdown()
+        if vector_index.peek() is not None:
+            vector_index.peek().flush()
+        if lexical_index.peek() is not None:
+            lexical_index.peek().close()
+        await document_downloader.close()
+        if openai_service.peek() is not None:
+            await openai_service.peek().close()
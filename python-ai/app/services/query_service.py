@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .kafka.kafka_handlers import document_retriever, openai_service, response_cache, generate_answer, llm_settings
+from .llm.openai_service import DocumentContext, LLMResponse
+from .utils.stage_timing import time_stage
+
+logger = logging.getLogger(__name__)
+
+
+def document_summary(document: DocumentContext, include_content: bool = True) -> Dict[str, Any]:
+    """JSON-serializable form of a search hit"""
+    summary = asdict(document)
+    summary["similarity_score"] = float(document.similarity_score)
+    if not include_content:
+        del summary["content"]
+    return summary
+
+
+async def search_queries(
+    queries: Sequence[str],
+    n_results: int = 3,
+    similarity_threshold: float = 0.7
+) -> Tuple[np.ndarray, List[List[DocumentContext]]]:
+    """
+    Retrieve the similar documents of a batch of queries
+
+    Every query not in the query embedding cache is encoded in one batch, and
+    the index is searched with one multi-query call in the default executor.
+
+    Returns:
+        The query embeddings and the similar documents of each query
+    """
+    retriever = await document_retriever.get_async()
+    async with time_stage("embed_query", queries=len(queries)):
+        query_embeddings = await retriever.embed_queries_async(queries)
+    async with time_stage("retrieve", query_type="semantic_search", queries=len(queries)):
+        documents = await asyncio.get_running_loop().run_in_executor(
+            None, retriever.search_batch, queries, query_embeddings, n_results, similarity_threshold
+        )
+    return query_embeddings, documents
+
+
+async def answer_queries(
+    queries: Sequence[str],
+    query_embeddings: np.ndarray,
+    contexts: List[List[DocumentContext]],
+    llm_params: Optional[Dict] = None
+) -> List[Union[Tuple[LLMResponse, bool], Exception]]:
+    """
+    Answer every query from its context documents concurrently; see generate_answer
+
+    Returns:
+        The response of each query and whether it came from the cache, or the
+        exception its generation failed with
+    """
+    return await asyncio.gather(
+        *(
+            generate_answer(query, embedding, context, llm_params)
+            for query, embedding, context in zip(queries, query_embeddings, contexts)
+        ),
+        return_exceptions=True
+    )
+
+
+async def _stream_answer(
+    index: int,
+    query: str,
+    query_embedding: np.ndarray,
+    context: List[DocumentContext],
+    llm_params: Optional[Dict]
+) -> AsyncIterator[Dict[str, Any]]:
+    """Events of one streamed answer: content deltas, then a final "done" event"""
+    service = await openai_service.get_async()
+    settings = llm_settings(llm_params)
+    cached = response_cache.get(query_embedding, context, settings)
+    if cached is not None:
+        yield {"index": index, "delta": cached.content}
+        yield {"index": index, "done": True, "model": cached.model, "finish_reason": cached.finish_reason, "cached": True}
+        return
+
+    content = []
+    model = settings["model"]
+    finish_reason = None
+    async for delta in service.stream_response(
+        prompt=query,
+        context=context,
+        max_tokens=settings["max_tokens"],
+        temperature=settings["temperature"],
+        system_message=settings["system_message"]
+    ):
+        model = delta.model or model
+        finish_reason = delta.finish_reason or finish_reason
+        if delta.content:
+            content.append(delta.content)
+            yield {"index": index, "delta": delta.content}
+
+    # Streams report no token usage; the cached copy only serves later requests
+    response = LLMResponse(content="".join(content), model=model, usage={}, finish_reason=finish_reason)
+    response_cache.put(query_embedding, context, settings, response)
+    yield {"index": index, "done": True, "model": model, "finish_reason": finish_reason, "cached": False}
+
+
+async def stream_answers(
+    queries: Sequence[str],
+    query_embeddings: np.ndarray,
+    contexts: List[List[DocumentContext]],
+    llm_params: Optional[Dict] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream the answers of a batch of queries as they are generated
+
+    The answers are generated concurrently and their events interleave; each
+    event carries the index of its query. A query whose generation fails ends
+    with an "error" event instead of "done".
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    finished = object()
+
+    async def produce(index: int) -> None:
+        try:
+            async for event in _stream_answer(index, queries[index], query_embeddings[index], contexts[index], llm_params):
+                await events.put(event)
+        except Exception as e:
+            logger.error(f"Error streaming answer {index}: {e}")
+            await events.put({"index": index, "error": str(e)})
+        finally:
+            events.put_nowait(finished)
+
+    producers = [asyncio.create_task(produce(index)) for index in range(len(queries))]
+    try:
+        remaining = len(producers)
+        while remaining:
+            event = await events.get()
+            if event is finished:
+                remaining -= 1
+            else:
+                yield event
+    finally:
+        # The client went away: stop generating the remaining answers
+        for producer in producers:
+            producer.cancel()
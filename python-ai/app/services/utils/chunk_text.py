@@ -0,0 +1,142 @@
+import os
+from typing import List
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces, which is roughly 1000 characters of English text
+DEFAULT_CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+DEFAULT_CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+
+
+class TextChunker:
+    """
+    Incremental version of chunk_text.
+
+    Text can be fed piece by piece (e.g. one PDF page at a time) and complete
+    chunks are returned as soon as they are available, so downstream stages can
+    start before the whole document has been read.
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP):
+        """
+        Initialize text chunker
+
+        Args:
+            chunk_size: Maximum number of characters per chunk
+            chunk_overlap: Number of characters shared between consecutive chunks
+
+        Raises:
+            ValueError: If chunk_size/chunk_overlap are inconsistent
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        if chunk_overlap < 0 or chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be >= 0 and smaller than chunk_size")
+
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._buffer = ""
+        self._carried = 0  # Characters at the start of the buffer already emitted as overlap
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Add text and return the chunks it completes
+
+        Args:
+            text: Next piece of the document
+
+        Returns:
+            List of complete, non-empty chunks
+        """
+        buffer = self._buffer + text
+        chunks = []
+        start = 0
+
+        while len(buffer) - start > self.chunk_size:
+            end = start + self.chunk_size
+
+            # Prefer to cut on whitespace, but never go back into the overlap region
+            cut = buffer.rfind(" ", start + self.chunk_overlap + 1, end)
+            newline_cut = buffer.rfind("\n", start + self.chunk_overlap + 1, end)
+            cut = max(cut, newline_cut)
+            if cut > start + self.chunk_overlap:
+                end = cut
+
+            chunk = buffer[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+
+            start = end - self.chunk_overlap
+            self._carried = self.chunk_overlap
+
+        self._buffer = buffer[start:]
+        return chunks
+
+    def flush(self) -> List[str]:
+        """
+        Return the final, possibly short, chunk and reset the chunker
+
+        Returns:
+            List with the last chunk, or an empty list if nothing new is left
+        """
+        buffer, carried = self._buffer, self._carried
+        self._buffer = ""
+        self._carried = 0
+
+        chunk = buffer.strip()
+        if len(buffer) > carried and chunk:
+            return [chunk]
+        return []
+
+
+def chunk_text(
+    text: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP
+) -> List[str]:
+    """
+    Split text into overlapping chunks suitable for embedding.
+
+    Chunks are cut at the last whitespace before ``chunk_size`` where possible,
+    so words are not split across chunk boundaries.
+
+    Args:
+        text: Text to split
+        chunk_size: Maximum number of characters per chunk
+        chunk_overlap: Number of characters shared between consecutive chunks
+
+    Returns:
+        List of non-empty chunks, in document order
+
+    Raises:
+        ValueError: If chunk_size/chunk_overlap are inconsistent
+    """
+    chunker = TextChunker(chunk_size, chunk_overlap)
+    return chunker.feed(text) + chunker.flush()
+
+
+def merge_chunks(chunks: List[str], max_overlap: int = DEFAULT_CHUNK_OVERLAP) -> str:
+    """
+    Reassemble chunks produced by chunk_text, dropping the overlapping text.
+
+    Args:
+        chunks: Chunks in document order
+        max_overlap: Largest overlap that may exist between two consecutive chunks
+
+    Returns:
+        str: Reassembled text
+    """
+    if not chunks:
+        return ""
+
+    parts = [chunks[0]]
+    previous = chunks[0]
+    for chunk in chunks[1:]:
+        overlap = 0
+        for size in range(min(max_overlap, len(previous), len(chunk)), 0, -1):
+            if previous.endswith(chunk[:size]):
+                overlap = size
+                break
+        remainder = chunk[overlap:]
+        parts.append(remainder if overlap else "\n" + remainder)
+        previous = chunk
+
+    return "".join(parts)
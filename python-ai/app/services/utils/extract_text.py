@@ -1,39 +1,77 @@
 import fitz  # PyMuPDF
 import logging
+from typing import Iterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 def extract_text_from_pdf(file_path: str) -> str:
     """
     Extract text from PDF using PyMuPDF.
-    
+
     Args:
         file_path: Path to the PDF file
-        
+
     Returns:
         str: Extracted text content
-        
+
     Raises:
         Exception: If PDF cannot be processed
     """
-    doc = None
     try:
-        doc = fitz.open(file_path)
-        text = ""
-        
-        for page_num, page in enumerate(doc, 1):
-            page_text = page.get_text()
-            if page_text.strip():  # Only add non-empty pages
-                text += page_text + "\n"
-        
+        text = "\n".join(iter_pdf_pages(file_path))
+
         if not text.strip():
             raise Exception("No text content found in PDF")
-            
+
         return text.strip()
-        
+
     except Exception as e:
         logger.error(f"Failed to extract text from PDF {file_path}: {e}")
         raise Exception(f"PDF text extraction failed: {e}")
+
+def iter_pdf_pages(file_path: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield the text of each non-empty page, one page at a time.
+
+    Args:
+        file_path: Path to the PDF file
+        start: Index of the first page to read
+        stop: Index after the last page to read (defaults to the end of the document)
+
+    Yields:
+        str: Text of each page that has any text content
+    """
+    doc = fitz.open(file_path)
+    try:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        for page_num in range(start, stop):
+            page_text = doc[page_num].get_text()
+            if page_text.strip():  # Only yield non-empty pages
+                yield page_text
+    finally:
+        doc.close()
+
+def get_page_count(file_path: str) -> int:
+    """Return the number of pages in a PDF without extracting any text"""
+    doc = fitz.open(file_path)
+    try:
+        return doc.page_count
     finally:
-        if doc:
-            doc.close()
\ No newline at end of file
+        doc.close()
+
+def page_ranges(page_count: int, pages_per_range: int) -> List[Tuple[int, int]]:
+    """Split [0, page_count) into consecutive (start, stop) ranges"""
+    if pages_per_range <= 0:
+        raise ValueError("pages_per_range must be positive")
+    return [
+        (start, min(start + pages_per_range, page_count))
+        for start in range(0, page_count, pages_per_range)
+    ]
+
+def extract_page_range(file_path: str, start: int, stop: int) -> str:
+    """
+    Extract the text of pages [start, stop) as one string.
+
+    Module-level so it can be shipped to worker processes.
+    """
+    return "\n".join(iter_pdf_pages(file_path, start, stop))
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Generic, Iterable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class ComponentStatus:
+    """Startup state of one service component"""
+    name: str
+    ready: bool = False
+    started_at: Optional[float] = None  # time.time() when initialization began
+    init_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "init_seconds": round(self.init_seconds, 3) if self.init_seconds is not None else None,
+            "error": self.error,
+        }
+
+
+class ComponentRegistry:
+    """
+    Tracks when each service component starts, becomes ready or fails.
+
+    Lazy services register themselves; steps that are not objects (Kafka
+    subscriptions, the warm-up encode) are tracked with ``track``.
+    """
+
+    def __init__(self):
+        self._components: Dict[str, ComponentStatus] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str) -> ComponentStatus:
+        """Get or create the status entry of a component"""
+        with self._lock:
+            if name not in self._components:
+                self._components[name] = ComponentStatus(name)
+            return self._components[name]
+
+    def track(self, name: str) -> "_TrackedStartup":
+        """
+        Time the initialization of a component
+
+            with component_registry.track("kafka"):
+                kafka_message_queue.connect()
+        """
+        return _TrackedStartup(self.register(name))
+
+    def is_ready(self, names: Optional[Iterable[str]] = None) -> bool:
+        """Whether every (or every named) component is ready"""
+        with self._lock:
+            components = list(self._components.values()) if names is None else [
+                self._components.get(name) for name in names
+            ]
+        return all(component is not None and component.ready for component in components)
+
+    def status(self) -> Dict[str, dict]:
+        """Readiness and startup time of every component, in registration order"""
+        with self._lock:
+            return {name: component.as_dict() for name, component in self._components.items()}
+
+
+class _TrackedStartup:
+    __slots__ = ("component", "_started")
+
+    def __init__(self, component: ComponentStatus):
+        self.component = component
+        self._started = None
+
+    def __enter__(self) -> ComponentStatus:
+        self.component.ready = False
+        self.component.error = None
+        self.component.started_at = time.time()
+        self._started = time.perf_counter()
+        return self.component
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.component.init_seconds = time.perf_counter() - self._started
+        if exc_type is None:
+            self.component.ready = True
+            logger.info(f"{self.component.name} ready in {self.component.init_seconds:.3f}s")
+        else:
+            self.component.error = f"{exc_type.__name__}: {exc_val}"
+            logger.error(f"{self.component.name} failed to start: {exc_val!r}")
+
+
+# Components of this process; reported by the /ready endpoint
+component_registry = ComponentRegistry()
+
+
+class LazyService(Generic[T]):
+    """
+    Service singleton created on first use instead of at import time.
+
+    The factory runs at most once, even when several threads ask for the
+    service at the same time; its duration is recorded in the component
+    registry. A failed factory is retried on the next ``get``.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T], registry: ComponentRegistry = component_registry):
+        """
+        Initialize lazy service
+
+        Args:
+            name: Component name reported by the registry
+            factory: Creates the service
+            registry: Registry recording startup time and readiness
+        """
+        self.name = name
+        self.factory = factory
+        self.registry = registry
+        self._value: Optional[T] = None
+        self._created = False
+        self._lock = threading.Lock()
+        registry.register(name)
+
+    @property
+    def ready(self) -> bool:
+        return self._created
+
+    def get(self) -> T:
+        """The service, created now if it does not exist yet"""
+        if self._created:
+            return self._value
+        with self._lock:
+            if not self._created:
+                with self.registry.track(self.name):
+                    self._value = self.factory()
+                self._created = True
+        return self._value
+
+    async def get_async(self) -> T:
+        """The service, waiting off the event loop while it is being created"""
+        if self._created:
+            return self._value
+        return await asyncio.get_running_loop().run_in_executor(None, self.get)
+
+    def peek(self) -> Optional[T]:
+        """The service if it was created, without creating it"""
+        return self._value if self._created else None
+
@@ -0,0 +1,207 @@
+import logging
+import os
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from .stage_timing import add_stage_listener, remove_stage_listener
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:  # Metrics are optional; the service runs without prometheus_client
+    CollectorRegistry = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets from sub-millisecond index lookups to multi-second LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+BYTES_BUCKETS = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6)
+
+# Returns the running consumer engines, read at scrape time for concurrency and lag gauges
+EngineSource = Callable[[], Iterable[Any]]
+
+
+class PipelineMetrics:
+    """
+    Prometheus metrics for the pipeline stages, fed by the stage timing hook.
+
+    Stage durations and stage-specific counters are recorded only while the
+    metrics are enabled; handler concurrency and consumer lag are read from the
+    consumer engines when /metrics is scraped, so nothing runs per message for them.
+    """
+
+    def __init__(self, namespace: str = "python_ai", engines: Optional[EngineSource] = None):
+        """
+        Initialize pipeline metrics
+
+        Args:
+            namespace: Prefix of every metric name
+            engines: Callable returning the running KafkaConsumerEngines
+        """
+        if CollectorRegistry is None:
+            raise RuntimeError("prometheus_client is not installed")
+
+        self.engines = engines
+        self.registry = CollectorRegistry()
+        self._enabled = False
+
+        self.stage_seconds = Histogram(
+            "stage_duration_seconds", "Duration of pipeline stages",
+            ["stage", "outcome"], namespace=namespace, buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self.handler_seconds = Histogram(
+            "handler_duration_seconds", "Duration of Kafka handler calls",
+            ["topic", "outcome"], namespace=namespace, buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self.handler_messages = Counter(
+            "handler_messages", "Messages passed to Kafka handlers",
+            ["topic"], namespace=namespace, registry=self.registry
+        )
+        self.schedule_seconds = Histogram(
+            "schedule_wait_seconds", "Time Kafka messages wait for a priority scheduler slot",
+            ["topic", "priority"], namespace=namespace, buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self.messages_retried = Counter(
+            "messages_retried", "Failed messages republished to retry or dead-letter topics",
+            ["topic", "target"], namespace=namespace, registry=self.registry
+        )
+        self.publish_seconds = Histogram(
+            "publish_duration_seconds", "Time from send to broker acknowledgement",
+            ["topic", "outcome"], namespace=namespace, buckets=LATENCY_BUCKETS, registry=self.registry
+        )
+        self.download_bytes = Histogram(
+            "download_size_bytes", "Size of downloaded documents",
+            namespace=namespace, buckets=BYTES_BUCKETS, registry=self.registry
+        )
+        self.download_not_modified = Counter(
+            "download_not_modified", "Downloads answered with 304 Not Modified",
+            namespace=namespace, registry=self.registry
+        )
+        self.pages_extracted = Counter(
+            "pages_extracted", "PDF pages extracted",
+            namespace=namespace, registry=self.registry
+        )
+        self.chunks_extracted = Counter(
+            "chunks_extracted", "Text chunks produced by extraction",
+            namespace=namespace, registry=self.registry
+        )
+        self.encode_batch_size = Histogram(
+            "encode_batch_size", "Texts per encoder call",
+            namespace=namespace, buckets=SIZE_BUCKETS, registry=self.registry
+        )
+        self.chunks_stored = Counter(
+            "chunks_stored", "Chunks written to the vector index",
+            namespace=namespace, registry=self.registry
+        )
+        self.llm_tokens = Counter(
+            "llm_tokens", "Tokens used by LLM calls",
+            ["model", "type"], namespace=namespace, registry=self.registry
+        )
+
+        if engines is not None:
+            self.registry.register(_EngineCollector(namespace, engines))
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def enable(self) -> None:
+        """Start recording stage metrics"""
+        if not self._enabled:
+            add_stage_listener(self.observe)
+            self._enabled = True
+
+    def disable(self) -> None:
+        """Stop recording stage metrics; stages are no longer timed"""
+        if self._enabled:
+            remove_stage_listener(self.observe)
+            self._enabled = False
+
+    def observe(self, stage: str, seconds: float, values: Dict[str, Any]) -> None:
+        """Stage listener: record one completed stage"""
+        outcome = "error" if values.get("error") else "ok"
+
+        if stage == "handler":
+            topic = values.get("topic", "")
+            self.handler_seconds.labels(topic, outcome).observe(seconds)
+            self.handler_messages.labels(topic).inc(values.get("messages", 1))
+            return
+        if stage == "schedule":
+            self.schedule_seconds.labels(values.get("topic", ""), values.get("priority", "")).observe(seconds)
+            return
+        if stage == "retry":
+            target = "dead_letter" if values.get("dead_letter") else "retry"
+            self.messages_retried.labels(values.get("topic", ""), target).inc()
+            return
+        if stage == "publish":
+            self.publish_seconds.labels(values.get("topic", ""), outcome).observe(seconds)
+            return
+
+        self.stage_seconds.labels(stage, outcome).observe(seconds)
+        if stage == "download":
+            if values.get("not_modified"):
+                self.download_not_modified.inc()
+            elif "bytes" in values:
+                self.download_bytes.observe(values["bytes"])
+        elif stage == "extract":
+            self.pages_extracted.inc(values.get("pages", 0))
+            self.chunks_extracted.inc(values.get("chunks", 0))
+        elif stage == "encode":
+            self.encode_batch_size.observe(values.get("batch_size", 0))
+        elif stage == "store":
+            self.chunks_stored.inc(values.get("chunks", 0))
+        elif stage == "llm":
+            model = values.get("model", "")
+            self.llm_tokens.labels(model, "prompt").inc(values.get("prompt_tokens", 0))
+            self.llm_tokens.labels(model, "completion").inc(values.get("completion_tokens", 0))
+
+    def render(self) -> bytes:
+        """Metrics in the Prometheus text exposition format"""
+        return generate_latest(self.registry)
+
+
+class _EngineCollector:
+    """Reports handler concurrency and consumer lag of the running consumer engines at scrape time"""
+
+    def __init__(self, namespace: str, engines: EngineSource):
+        self.namespace = namespace
+        self.engines = engines
+
+    def collect(self):
+        in_flight = GaugeMetricFamily(
+            f"{self.namespace}_handler_in_flight", "Messages currently being processed", labels=["topics"]
+        )
+        capacity = GaugeMetricFamily(
+            f"{self.namespace}_handler_max_in_flight", "Maximum messages processed at once", labels=["topics"]
+        )
+        lag = GaugeMetricFamily(
+            f"{self.namespace}_consumer_lag", "Messages behind the end of the partition", labels=["topic", "partition"]
+        )
+        for engine in list(self.engines()):
+            topics = ",".join(sorted(getattr(engine, "topics", ()) or ()))
+            in_flight.add_metric([topics], engine.in_flight)
+            capacity.add_metric([topics], engine.max_in_flight)
+            for tp, behind in engine.lag.items():
+                lag.add_metric([tp.topic, str(tp.partition)], behind)
+        yield in_flight
+        yield capacity
+        yield lag
+
+
+def create_pipeline_metrics(engines: Optional[EngineSource] = None) -> Optional[PipelineMetrics]:
+    """
+    Create the pipeline metrics if METRICS_ENABLED is set and prometheus_client is available
+
+    Returns:
+        Enabled PipelineMetrics, or None when metrics are off
+    """
+    if os.getenv("METRICS_ENABLED", "false").lower() != "true":
+        return None
+    if CollectorRegistry is None:
+        logger.warning("METRICS_ENABLED is set but prometheus_client is not installed; metrics are off")
+        return None
+
+    metrics = PipelineMetrics(engines=engines)
+    metrics.enable()
+    return metrics
@@ -0,0 +1,231 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_WEIGHTS = {"high": 4.0, "normal": 2.0, "low": 1.0}
+
+# Scheduling weight of the work running in the current task; shared resources
+# further down the pipeline (the encode scheduler) serve heavier work first
+current_weight: contextvars.ContextVar[float] = contextvars.ContextVar("current_weight", default=1.0)
+
+
+def parse_classes(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "high=4,normal=2,document.query=4" into a class -> number mapping"""
+    classes = {}
+    for item in (spec or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            classes[name.strip()] = float(value)
+    return classes
+
+
+@dataclass
+class ClassStats:
+    """Counters of one scheduling class (a priority or a topic)"""
+    dispatched: int = 0
+    running: int = 0
+    waiting: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "dispatched": self.dispatched,
+            "running": self.running,
+            "waiting": self.waiting,
+            "avg_wait_ms": self.total_wait / self.dispatched * 1000 if self.dispatched else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+class _Flow:
+    """Waiters of one (priority, topic) pair in arrival order"""
+
+    __slots__ = ("priority", "topic", "weight", "waiters", "last_finish")
+
+    def __init__(self, priority: str, topic: str, weight: float):
+        self.priority = priority
+        self.topic = topic
+        self.weight = weight
+        self.waiters: Deque[Tuple[float, float, asyncio.Future]] = deque()  # (tag, enqueued_at, future)
+        self.last_finish = 0.0
+
+
+class PriorityScheduler:
+    """
+    Weighted fair queuing of handler calls across priorities and topics.
+
+    Every (priority, topic) pair is a flow whose weight is the product of the
+    priority's and the topic's weight. Waiting calls are tagged with virtual
+    finish times (start-time fair queuing), so under contention each flow gets
+    slots in proportion to its weight and no flow starves. Concurrency is
+    limited overall and per class (a priority or a topic): a capped class only
+    waits while others keep running, which keeps headroom for interactive
+    traffic while a bulk backfill is queued.
+
+        async with scheduler.slot("document.query", "high"):
+            await handler(...)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        weights: Optional[Dict[str, float]] = None,
+        caps: Optional[Dict[str, float]] = None
+    ):
+        """
+        Initialize priority scheduler
+
+        Args:
+            max_concurrency: Maximum calls running at once
+            weights: Weight per priority or topic, on top of DEFAULT_WEIGHTS (1 if missing)
+            caps: Maximum calls running at once per priority or topic (unlimited if missing)
+        """
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be positive")
+
+        self.max_concurrency = max_concurrency
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.caps = dict(caps or {})
+        self._flows: Dict[Tuple[str, str], _Flow] = {}
+        self._running: Dict[str, int] = {}
+        self._total_running = 0
+        self._virtual_time = 0.0
+        self._stats: Dict[str, ClassStats] = {}
+
+    @staticmethod
+    def normalize_priority(priority: Optional[str]) -> str:
+        """Unknown or missing priorities are treated as normal"""
+        return priority if priority in PRIORITIES else "normal"
+
+    def weight(self, topic: str, priority: str) -> float:
+        return self.weights.get(priority, 1.0) * self.weights.get(topic, 1.0)
+
+    def _class_stats(self, name: str) -> ClassStats:
+        if name not in self._stats:
+            self._stats[name] = ClassStats()
+        return self._stats[name]
+
+    def _has_capacity(self, flow: _Flow) -> bool:
+        return all(
+            self._running.get(name, 0) < self.caps.get(name, float("inf"))
+            for name in (flow.priority, flow.topic)
+        )
+
+    def _dispatch(self) -> None:
+        """Start the waiting calls with the smallest tags while there are free slots"""
+        while self._total_running < self.max_concurrency:
+            eligible = [flow for flow in self._flows.values() if flow.waiters and self._has_capacity(flow)]
+            if not eligible:
+                return
+            flow = min(eligible, key=lambda f: f.waiters[0][0])
+            tag, enqueued_at, future = flow.waiters.popleft()
+            if future.done():  # Cancelled while waiting
+                continue
+
+            self._virtual_time = max(self._virtual_time, tag - 1.0 / flow.weight)
+            self._total_running += 1
+            wait = time.perf_counter() - enqueued_at
+            for name in (flow.priority, flow.topic):
+                self._running[name] = self._running.get(name, 0) + 1
+                stats = self._class_stats(name)
+                stats.waiting -= 1
+                stats.running += 1
+                stats.dispatched += 1
+                stats.total_wait += wait
+                stats.max_wait = max(stats.max_wait, wait)
+            future.set_result(None)
+
+    async def acquire(self, topic: str, priority: Optional[str] = None) -> None:
+        """Wait for a slot; must be paired with release()"""
+        priority = self.normalize_priority(priority)
+        key = (priority, topic)
+        if key not in self._flows:
+            self._flows[key] = _Flow(priority, topic, self.weight(topic, priority))
+        flow = self._flows[key]
+
+        # Finish tag: a flow's calls are spaced 1/weight apart in virtual time
+        tag = max(flow.last_finish, self._virtual_time) + 1.0 / flow.weight
+        flow.last_finish = tag
+        future = asyncio.get_running_loop().create_future()
+        flow.waiters.append((tag, time.perf_counter(), future))
+        for name in (priority, topic):
+            self._class_stats(name).waiting += 1
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(topic, priority)  # Granted just before the cancellation
+            else:
+                for name in (priority, topic):
+                    self._class_stats(name).waiting -= 1
+            raise
+
+    def release(self, topic: str, priority: Optional[str] = None) -> None:
+        """Free the slot of a finished call"""
+        priority = self.normalize_priority(priority)
+        self._total_running -= 1
+        for name in (priority, topic):
+            self._running[name] -= 1
+            self._class_stats(name).running -= 1
+        self._dispatch()
+
+    def slot(self, topic: str, priority: Optional[str] = None) -> "_Slot":
+        """Async context manager holding a slot; the call runs with the flow's weight as current_weight"""
+        return _Slot(self, topic, self.normalize_priority(priority))
+
+    def stats(self) -> Dict[str, dict]:
+        """Counters per priority and topic"""
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+
+class _Slot:
+    __slots__ = ("scheduler", "topic", "priority", "_token")
+
+    def __init__(self, scheduler: PriorityScheduler, topic: str, priority: str):
+        self.scheduler = scheduler
+        self.topic = topic
+        self.priority = priority
+        self._token = None
+
+    async def __aenter__(self) -> "_Slot":
+        await self.scheduler.acquire(self.topic, self.priority)
+        self._token = current_weight.set(self.scheduler.weight(self.topic, self.priority))
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        current_weight.reset(self._token)
+        self.scheduler.release(self.topic, self.priority)
+
+
+def create_priority_scheduler() -> Optional[PriorityScheduler]:
+    """
+    Create the handler scheduler if PRIORITY_SCHEDULING_ENABLED=true
+
+    PRIORITY_WEIGHTS and PRIORITY_CAPS take "name=value" lists whose names are
+    priorities or topics, e.g. PRIORITY_WEIGHTS="high=4,normal=2,low=1,document.query=4"
+    and PRIORITY_CAPS="low=2,embedding.create=8".
+
+    Returns:
+        PriorityScheduler, or None when handlers run in arrival order
+    """
+    if os.getenv("PRIORITY_SCHEDULING_ENABLED", "false").lower() != "true":
+        return None
+
+    scheduler = PriorityScheduler(
+        max_concurrency=int(os.getenv("PRIORITY_MAX_CONCURRENCY", "16")),
+        weights=parse_classes(os.getenv("PRIORITY_WEIGHTS")),
+        caps=parse_classes(os.getenv("PRIORITY_CAPS"))
+    )
+    logger.info(f"Priority scheduling enabled: weights={scheduler.weights} caps={scheduler.caps}")
+    return scheduler
@@ -0,0 +1,81 @@
+import logging
+import time
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Called with (stage, seconds, values) each time a pipeline stage completes; values
+# carry stage-specific numbers (bytes, chunks, batch size, ...) and labels (topic, ...)
+StageListener = Callable[[str, float, Dict[str, Any]], None]
+
+_listeners: List[StageListener] = []
+
+
+def add_stage_listener(listener: StageListener) -> None:
+    """Start receiving stage timings"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_stage_listener(listener: StageListener) -> None:
+    """Stop receiving stage timings"""
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def stage_timing_enabled() -> bool:
+    """Whether any listener is registered; stages skip timing entirely when not"""
+    return bool(_listeners)
+
+
+def record_stage(stage: str, seconds: float, **values: Any) -> None:
+    """
+    Report a completed stage to every listener
+
+    Args:
+        stage: Stage name, e.g. "download" or "encode"
+        seconds: Wall-clock duration of the stage
+        **values: Stage-specific numbers and labels
+    """
+    for listener in list(_listeners):
+        try:
+            listener(stage, seconds, values)
+        except Exception as e:
+            logger.error(f"Error in stage listener for {stage}: {e}")
+
+
+class time_stage:
+    """
+    Time a block of code as a pipeline stage
+
+    Usable as ``with`` or ``async with``. Values known only inside the block can
+    be added to ``values``. Failed stages are reported with ``error=True``. When
+    no listener is registered the block is not timed at all.
+
+        with time_stage("store", chunks=len(ids)):
+            vector_index.upsert(...)
+    """
+
+    __slots__ = ("stage", "values", "_started")
+
+    def __init__(self, stage: str, **values: Any):
+        self.stage = stage
+        self.values = values
+        self._started = None
+
+    def __enter__(self) -> "time_stage":
+        if _listeners:
+            self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if self._started is not None:
+            if exc_type is not None:
+                self.values["error"] = True
+            record_stage(self.stage, time.perf_counter() - self._started, **self.values)
+
+    async def __aenter__(self) -> "time_stage":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.__exit__(exc_type, exc_val, exc_tb)
@@ -0,0 +1,99 @@
+"""
+Compare embedding backends on load time, memory, throughput and query latency.
+
+Each backend runs in its own subprocess, so load time and resident memory
+include the runtime it imports (PyTorch or onnxruntime). "onnx-int8" selects
+the quantized ONNX model. Throughput is measured for bulk encoding (ingestion)
+and latency for single texts (queries). Results are printed as JSON.
+
+    python benchmarks/bench_embedding.py --onnx-path ./onnx/all-MiniLM-L6-v2
+    python benchmarks/bench_embedding.py --backends onnx,onnx-int8 --threads 1,2,4
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_vector_index import rss_mb, percentile  # noqa: E402
+from check_embedding_parity import make_texts  # noqa: E402
+
+
+def run_backend(args) -> dict:
+    from app.services.embedding.embedding_backend import create_embedding_backend
+
+    texts = make_texts(args.texts, random.Random(args.seed))
+    baseline_rss = rss_mb()
+
+    start = time.perf_counter()
+    backend = create_embedding_backend(
+        "onnx" if args.backend.startswith("onnx") else args.backend,
+        args.model,
+        onnx_path=args.onnx_path,
+        quantized=args.backend == "onnx-int8",
+        intra_op_threads=args.thread_count or None
+    )
+    backend.encode(texts[:8])  # First call allocates buffers and picks kernels
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    backend.encode(texts, batch_size=args.batch_size)
+    bulk_seconds = time.perf_counter() - start
+
+    latencies = []
+    for text in texts[:args.queries]:
+        start = time.perf_counter()
+        backend.encode(text)
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "backend": args.backend,
+        "threads": args.thread_count or "default",
+        "load_seconds": round(load_seconds, 3),
+        "texts_per_second": round(len(texts) / bulk_seconds, 1),
+        "query_p50_ms": round(percentile(latencies, 50), 3),
+        "query_p95_ms": round(percentile(latencies, 95), 3),
+        "rss_mb": round(rss_mb() - baseline_rss, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="sentence-transformers,onnx,onnx-int8", help="Comma-separated backends")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)  # Set in the per-backend subprocess
+    parser.add_argument("--thread-count", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--threads", default="0", help="Comma-separated intra-op thread counts (0: runtime default)")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-path", default="./onnx/all-MiniLM-L6-v2")
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args)))
+        return
+
+    results = []
+    for backend in args.backends.split(","):
+        for threads in args.threads.split(","):
+            command = [sys.executable, __file__, "--backend", backend, f"--thread-count={threads}"] + [
+                f"--{name.replace('_', '-')}={getattr(args, name)}"
+                for name in ("model", "onnx_path", "texts", "queries", "batch_size", "seed")
+            ]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                results.append({"backend": backend, "threads": threads, "error": completed.stderr.strip().splitlines()[-1:]})
+            else:
+                results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Offline end-to-end benchmark of the embedding and query pipelines.
+
+Generates synthetic PDFs and serves them from a local HTTP server. A local
+stub answers OpenAI chat completions. The real handlers are driven through
+the in-memory KafkaMessageQueue stand-in (KAFKA_BACKEND=memory). Reports
+per-stage latency percentiles and throughput as JSON:
+
+    python benchmarks/bench_pipeline.py --documents 50 --pages 8 --queries 200 --output run.json
+
+Stages: download, extract, encode, store, embed_query, retrieve, llm, publish,
+plus handler (one sample per handler call, also split per topic as
+handler.<topic>). With --backfill-documents a third phase repeats the queries
+at high priority while that many more documents are ingested at low priority;
+set PRIORITY_SCHEDULING_ENABLED=true to compare query latency with and
+without priority scheduling:
+
+    PRIORITY_SCHEDULING_ENABLED=true python benchmarks/bench_pipeline.py --backfill-documents 50
+
+Needs the embedding model to be in the local cache already; nothing else leaves
+the machine.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WORDS = (
+    "invoice contract supplier delivery payment schedule warranty clause amount total "
+    "customer order shipment account balance report quarter revenue policy renewal "
+    "term notice service level agreement support ticket incident product module"
+).split()
+
+GROUP_ID = "python-ai-benchmark"
+
+
+def make_pdf(path: str, pages: int, words_per_page: int, rng: random.Random) -> None:
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for page_number in range(pages):
+        sentences = []
+        for _ in range(words_per_page // 12):
+            words = [rng.choice(WORDS) for _ in range(11)]
+            sentences.append(" ".join(words).capitalize() + f" ref-{rng.randint(1000, 9999)}.")
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), " ".join(sentences), fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+class StageCollector:
+    """Stage listener collecting durations and values per stage"""
+
+    def __init__(self, input_topics=()):
+        self.input_topics = set(input_topics)  # Publishes made by the harness itself are not measured
+        self.samples = defaultdict(list)
+        self.values = defaultdict(lambda: defaultdict(float))
+        self.handled = defaultdict(int)
+        self._lock = threading.Condition()
+
+    def __call__(self, stage, seconds, values):
+        if stage == "publish" and values.get("topic") in self.input_topics:
+            return
+        with self._lock:
+            self.samples[stage].append(seconds)
+            for name, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    self.values[stage][name] += value
+            if stage == "handler":
+                self.samples[f"handler.{values.get('topic')}"].append(seconds)
+                self.handled[values.get("topic")] += values.get("messages", 1)
+                self._lock.notify_all()
+
+    def wait_for(self, topic: str, messages: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.handled[topic] < messages:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+            return True
+
+    def report(self, wall_seconds: float) -> dict:
+        with self._lock:
+            stages = {}
+            for stage, samples in sorted(self.samples.items()):
+                latencies = np.array(samples) * 1000
+                stages[stage] = {
+                    "count": len(samples),
+                    "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                    "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+                    "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                    "mean_ms": round(float(latencies.mean()), 3),
+                    "total_s": round(float(latencies.sum()) / 1000, 3),
+                    "per_second": round(len(samples) / wall_seconds, 3) if wall_seconds else None,
+                    "totals": {name: round(value, 3) for name, value in self.values[stage].items()},
+                }
+            return stages
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.values.clear()
+
+
+async def start_server(docs_dir: str, llm_latency: float):
+    from aiohttp import web
+
+    async def serve_document(request):
+        return web.FileResponse(os.path.join(docs_dir, request.match_info["name"]))
+
+    async def chat_completions(request):
+        body = await request.json()
+        await asyncio.sleep(llm_latency)
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        return web.json_response({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "Stub answer based on the documents."},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 8, "total_tokens": prompt_tokens + 8},
+        })
+
+    app = web.Application()
+    app.router.add_get("/docs/{name}", serve_document)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def publish_queries(kafka_message_queue, args, rng: random.Random, priority: str = "normal") -> None:
+    from app.services.kafka.kafka_topics import KafkaTopics
+
+    for i in range(args.queries):
+        prompt = f"What does the {rng.choice(WORDS)} say about the {rng.choice(WORDS)} {rng.choice(WORDS)}?"
+        message = kafka_message_queue.create_message("document.query", {
+            "user_prompt": prompt,
+            "query_type": "semantic_search",
+            "search_params": {"n_results": 3, "similarity_threshold": args.similarity_threshold},
+        }, priority=priority)
+        kafka_message_queue.publish_event_nowait(KafkaTopics.DOCUMENT_QUERY.value, message)
+
+
+async def run(args, work_dir: str) -> dict:
+    docs_dir = os.path.join(work_dir, "docs")
+    os.makedirs(docs_dir)
+    rng = random.Random(args.seed)
+    for i in range(args.documents):
+        make_pdf(os.path.join(docs_dir, f"doc-{i}.pdf"), args.pages, args.words_per_page, rng)
+    for i in range(args.backfill_documents):
+        make_pdf(os.path.join(docs_dir, f"backfill-{i}.pdf"), args.pages, args.words_per_page, rng)
+
+    runner, base_url = await start_server(docs_dir, args.llm_latency_ms / 1000)
+
+    # Configure the service before its modules create their singletons
+    os.environ.update({
+        "KAFKA_BACKEND": "memory",
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "VECTOR_INDEX_BACKEND": args.vector_backend,
+        "VECTOR_INDEX_PATH": os.path.join(work_dir, "vector_index"),
+        "LEXICAL_INDEX_PATH": os.path.join(work_dir, "lexical_index"),
+    })
+    if args.vector_backend == "chroma":
+        os.chdir(work_dir)  # PersistentClient writes ./chromadb
+
+    from app.services.kafka.kafka_client import kafka_message_queue
+    from app.services.kafka.topic_handlers import TOPIC_HANDLERS
+    from app.services.kafka.kafka_topics import KafkaTopics
+    from app.services.embedding.embedding_service import encode_scheduler, cpu_executor, document_downloader
+    from app.services.kafka.kafka_handlers import openai_service
+    from app.services.utils.stage_timing import add_stage_listener
+
+    collector = StageCollector(input_topics=TOPIC_HANDLERS)
+    add_stage_listener(collector)
+
+    loop = asyncio.get_running_loop()
+    kafka_message_queue.connect()
+    subscriptions = [
+        loop.run_in_executor(
+            None,
+            lambda topic=topic, handler=handler: kafka_message_queue.subscribe([topic], GROUP_ID, handler, loop=loop)
+        )
+        for topic, handler in TOPIC_HANDLERS.items()
+    ]
+
+    results = {"config": vars(args)}
+    try:
+        # Ingestion phase
+        topic = KafkaTopics.EMBEDDING_CREATE.value
+        started = time.perf_counter()
+        for i in range(args.documents):
+            message = kafka_message_queue.create_message(
+                "embedding.create", {"url": f"{base_url}/docs/doc-{i}.pdf", "objectName": f"doc-{i}.pdf"}
+            )
+            kafka_message_queue.publish_event_nowait(topic, message, key=f"doc-{i}.pdf")
+        done = await loop.run_in_executor(None, collector.wait_for, topic, args.documents, args.timeout)
+        wall = time.perf_counter() - started
+        stages = collector.report(wall)
+        chunks = stages.get("store", {}).get("totals", {}).get("chunks", 0)
+        results["ingest"] = {
+            "completed": done,
+            "wall_s": round(wall, 3),
+            "documents_per_s": round(args.documents / wall, 3),
+            "chunks_per_s": round(chunks / wall, 3),
+            "stages": stages,
+        }
+        collector.reset()
+
+        # Query phase
+        topic = KafkaTopics.DOCUMENT_QUERY.value
+        started = time.perf_counter()
+        publish_queries(kafka_message_queue, args, rng)
+        done = await loop.run_in_executor(None, collector.wait_for, topic, args.queries, args.timeout)
+        wall = time.perf_counter() - started
+        results["query"] = {
+            "completed": done,
+            "wall_s": round(wall, 3),
+            "queries_per_s": round(args.queries / wall, 3),
+            "responses_published": len(kafka_message_queue.messages("llm.response")),
+            "stages": collector.report(wall),
+        }
+        collector.reset()
+
+        # Mixed phase: high-priority queries while a low-priority backfill is ingested
+        if args.backfill_documents:
+            ingest_topic = KafkaTopics.EMBEDDING_CREATE.value
+            started = time.perf_counter()
+            for i in range(args.backfill_documents):
+                message = kafka_message_queue.create_message(
+                    "embedding.create",
+                    {"url": f"{base_url}/docs/backfill-{i}.pdf", "objectName": f"backfill-{i}.pdf"},
+                    priority="low"
+                )
+                kafka_message_queue.publish_event_nowait(ingest_topic, message, key=f"backfill-{i}.pdf")
+            publish_queries(kafka_message_queue, args, rng, priority="high")
+            queries_done = await loop.run_in_executor(None, collector.wait_for, topic, 2 * args.queries, args.timeout)
+            backfill_done = await loop.run_in_executor(
+                None, collector.wait_for, ingest_topic, args.documents + args.backfill_documents, args.timeout
+            )
+            wall = time.perf_counter() - started
+            results["mixed"] = {
+                "completed": queries_done and backfill_done,
+                "wall_s": round(wall, 3),
+                "stages": collector.report(wall),
+            }
+    finally:
+        kafka_message_queue.stop_consumers()
+        await asyncio.gather(*subscriptions, return_exceptions=True)
+        kafka_message_queue.disconnect()
+        encode_scheduler.stop(timeout=5)
+        cpu_executor.shutdown()
+        await document_downloader.close()
+        if openai_service.peek() is not None:
+            await openai_service.peek().close()
+        await runner.cleanup()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--backfill-documents", type=int, default=0,
+                        help="Documents ingested at low priority during a second round of queries")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="Delay of the OpenAI stub")
+    parser.add_argument("--similarity-threshold", type=float, default=0.0)
+    parser.add_argument("--vector-backend", default="numpy", choices=["numpy", "chroma"])
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds to wait for each phase")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Keep the service's lifecycle prints out of the JSON on stdout
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as work_dir, contextlib.redirect_stdout(sys.stderr):
+        results = asyncio.run(run(args, work_dir))
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
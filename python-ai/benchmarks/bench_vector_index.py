@@ -0,0 +1,160 @@
+"""
+Compare vector index backends on build time, query latency and memory.
+
+Each backend runs in its own subprocess on the same random, normalized vectors,
+so resident memory is measured per backend. "numpy-float16" and "numpy-int8"
+select the quantized storage formats of the NumPy index. Memory is reported as
+the resident set growth of the subprocess (rss_mb) and disk use as the size of
+the index directory (disk_mb); compact storage also keeps a full-precision copy
+of every vector on disk for re-ranking. Results are printed as JSON.
+
+    python benchmarks/bench_vector_index.py --vectors 100000 --queries 200
+    python benchmarks/bench_vector_index.py --backends numpy,numpy-float16,numpy-int8 --rerank-factor 8
+    python benchmarks/bench_vector_index.py --backends numpy,numpy-float16 --scan-cache-mb 64
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+BATCH_SIZE = 5000
+
+
+def rss_mb() -> float:
+    """Resident set size of this process in MiB"""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def disk_mb(path: str) -> float:
+    """Total size of the files under path in MiB"""
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+
+def percentile(samples, q) -> float:
+    return float(np.percentile(samples, q)) * 1000
+
+
+def make_data(n_vectors: int, n_queries: int, dimension: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n_vectors, dimension), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = rng.standard_normal((n_queries, dimension), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+
+def open_index(backend: str, path: str, dimension: int, rerank_factor: int, scan_cache_mb: float):
+    if backend.startswith("numpy"):
+        from app.services.index.numpy_index import NumpyIndex
+        storage = backend.partition("-")[2] or "float32"
+        return NumpyIndex(
+            path,
+            dimension=dimension,
+            storage=storage,
+            rerank_factor=rerank_factor,
+            scan_cache_bytes=int(scan_cache_mb * 1024 * 1024)
+        )
+    if backend == "chroma":
+        from chromadb import PersistentClient
+        from app.services.index.vector_index import ChromaIndex
+        client = PersistentClient(path=path)
+        return ChromaIndex(client.get_or_create_collection(name="bench"))
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def run_backend(args) -> dict:
+    vectors, queries = make_data(args.vectors, args.queries, args.dimension, args.seed)
+    # Exact top-k for recall, computed outside the index and before measuring memory
+    truth = np.argsort(-(vectors @ queries.T), axis=0)[:args.k].T
+    path = tempfile.mkdtemp(prefix=f"bench-{args.backend}-")
+    try:
+        baseline_rss = rss_mb()
+        index = open_index(args.backend, path, args.dimension, args.rerank_factor, args.scan_cache_mb)
+
+        start = time.perf_counter()
+        for offset in range(0, len(vectors), BATCH_SIZE):
+            batch = vectors[offset:offset + BATCH_SIZE]
+            ids = [f"doc{offset + i}#0" for i in range(len(batch))]
+            index.upsert(
+                ids=ids,
+                embeddings=batch if args.backend.startswith("numpy") else batch.tolist(),
+                documents=ids,
+                metadatas=[{"doc_id": f"doc{offset + i}", "chunk_index": 0} for i in range(len(batch))]
+            )
+        index.flush()
+        build_seconds = time.perf_counter() - start
+
+        latencies, hits = [], 0
+        for q, query in enumerate(queries):
+            start = time.perf_counter()
+            result = index.query(query_embeddings=[query.tolist()], n_results=args.k)
+            latencies.append(time.perf_counter() - start)
+            found = {int(record_id[3:].split("#")[0]) for record_id in result["ids"][0]}
+            hits += len(found & set(truth[q].tolist()))
+
+        return {
+            "backend": args.backend,
+            "vectors": args.vectors,
+            "dimension": args.dimension,
+            "k": args.k,
+            "build_seconds": round(build_seconds, 3),
+            "query_p50_ms": round(percentile(latencies, 50), 3),
+            "query_p95_ms": round(percentile(latencies, 95), 3),
+            "query_p99_ms": round(percentile(latencies, 99), 3),
+            "recall_at_k": round(hits / (len(queries) * args.k), 4),
+            "rss_mb": round(rss_mb() - baseline_rss, 1),
+            "disk_mb": round(disk_mb(path), 1),
+            "resident_bytes_per_vector": getattr(index, "vector_bytes", None),
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="numpy,chroma", help="Comma-separated backends to compare")
+    parser.add_argument("--backend", help=argparse.SUPPRESS)  # Set in the per-backend subprocess
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rerank-factor", type=int, default=4, help="Candidates re-ranked per result (quantized storage)")
+    parser.add_argument("--scan-cache-mb", type=float, default=0, help="Float32 scan block cache (quantized storage)")
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args)))
+        return
+
+    results = []
+    for backend in args.backends.split(","):
+        command = [sys.executable, __file__, "--backend", backend] + [
+            f"--{name}={getattr(args, name)}" for name in ("vectors", "queries", "dimension", "k", "seed")
+        ] + [f"--rerank-factor={args.rerank_factor}", f"--scan-cache-mb={args.scan_cache_mb}"]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            results.append({"backend": backend, "error": completed.stderr.strip().splitlines()[-1:]})
+        else:
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Check that the ONNX embedding backends agree with the PyTorch backend.
+
+Encodes the same texts with sentence-transformers and with the exported ONNX
+model (float32 and int8), and compares the embeddings one by one (cosine) and
+as a retrieval (top-k overlap of the same queries over the same texts). Exits
+with status 1 when a backend falls below its threshold. Results are printed as
+JSON.
+
+    python benchmarks/check_embedding_parity.py --export
+    python benchmarks/check_embedding_parity.py --onnx-path ./onnx/all-MiniLM-L6-v2 --texts 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_pipeline import WORDS  # noqa: E402
+
+
+def make_texts(count: int, rng: random.Random):
+    """Sentences of varying length, some long enough to be truncated"""
+    texts = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.choice((3, 12, 40, 400)))]
+        texts.append(" ".join(words).capitalize() + f" ref-{rng.randint(1000, 9999)}.")
+    return texts
+
+
+def compare(reference: np.ndarray, candidate: np.ndarray, queries: int, k: int) -> dict:
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = (reference * candidate).sum(axis=1)
+
+    # The first texts act as queries against all texts, with themselves excluded
+    overlap = []
+    for scores_ref, scores_cand, q in zip(reference[:queries] @ reference.T, candidate[:queries] @ candidate.T, range(queries)):
+        scores_ref[q] = scores_cand[q] = -np.inf
+        top_ref = set(np.argpartition(-scores_ref, k)[:k].tolist())
+        top_cand = set(np.argpartition(-scores_cand, k)[:k].tolist())
+        overlap.append(len(top_ref & top_cand) / k)
+
+    return {
+        "cosine_mean": round(float(cosine.mean()), 6),
+        "cosine_min": round(float(cosine.min()), 6),
+        "cosine_p01": round(float(np.percentile(cosine, 1)), 6),
+        f"top{k}_overlap": round(float(np.mean(overlap)), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-path", default="./onnx/all-MiniLM-L6-v2")
+    parser.add_argument("--export", action="store_true", help="Export the ONNX models to --onnx-path first")
+    parser.add_argument("--texts", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-cosine", type=float, default=0.999, help="Minimum cosine of the float32 ONNX model")
+    parser.add_argument("--min-cosine-int8", type=float, default=0.98, help="Minimum cosine of the int8 ONNX model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from app.services.embedding.embedding_backend import create_embedding_backend, export_onnx_model
+
+    if args.export:
+        export_onnx_model(args.model, args.onnx_path)
+
+    texts = make_texts(args.texts, random.Random(args.seed))
+    reference = create_embedding_backend("sentence-transformers", args.model).encode(texts)
+
+    results, passed = {"model": args.model, "texts": len(texts)}, True
+    for name, quantized, threshold in (("onnx", False, args.min_cosine), ("onnx-int8", True, args.min_cosine_int8)):
+        backend = create_embedding_backend("onnx", args.model, onnx_path=args.onnx_path, quantized=quantized)
+        result = compare(reference, backend.encode(texts), min(args.queries, len(texts)), args.k)
+        result["min_cosine_required"] = threshold
+        result["passed"] = result["cosine_min"] >= threshold
+        passed = passed and result["passed"]
+        results[name] = result
+
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
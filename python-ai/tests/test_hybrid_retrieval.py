@@ -0,0 +1,52 @@
+import numpy as np
+
+from app.services.index.lexical_index import BM25Index
+from app.services.index.numpy_index import NumpyIndex
+from app.services.llm.openai_service import DocumentRetriever
+
+DIMENSION = 8
+
+CHUNKS = {
+    "doc-a#0": "the invoice total is due at the end of the month",
+    "doc-b#0": "the shipment of parts arrived on the dock",
+    "doc-c#0": "the order INV-2024-0042 was cancelled by the customer",
+}
+
+
+def unit(i: int) -> np.ndarray:
+    vector = np.zeros(DIMENSION, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+
+def make_retriever(tmp_path) -> DocumentRetriever:
+    index = NumpyIndex(str(tmp_path / "vectors"), dimension=DIMENSION)
+    ids = list(CHUNKS)
+    index.upsert(
+        ids=ids,
+        embeddings=np.stack([unit(i) for i in range(len(ids))]),
+        documents=[CHUNKS[chunk_id] for chunk_id in ids],
+        metadatas=[{"doc_id": chunk_id.split("#")[0], "chunk_index": 0} for chunk_id in ids]
+    )
+    lexical = BM25Index()
+    lexical.upsert(ids, [CHUNKS[chunk_id] for chunk_id in ids])
+    return DocumentRetriever(index, embedding_model=None, lexical_index=lexical)
+
+
+def test_unrelated_query_sharing_only_stopwords_returns_nothing(tmp_path):
+    retriever = make_retriever(tmp_path)
+    # Orthogonal to every chunk; shares only "the" and "is" with them
+    documents = retriever.search_batch(["what is the weather"], [unit(7)], n_results=3, similarity_threshold=0.7)
+    assert documents == [[]]
+
+
+def test_rare_identifier_passes_below_threshold(tmp_path):
+    retriever = make_retriever(tmp_path)
+    documents = retriever.search_batch(["status of INV-2024-0042"], [unit(7)], n_results=3, similarity_threshold=0.7)
+    assert [doc.document_id for doc in documents[0]] == ["doc-c#0"]
+
+
+def test_similar_chunks_pass_the_threshold(tmp_path):
+    retriever = make_retriever(tmp_path)
+    documents = retriever.search_batch(["when is the invoice due"], [unit(0)], n_results=3, similarity_threshold=0.7)
+    assert [doc.document_id for doc in documents[0]] == ["doc-a#0"]